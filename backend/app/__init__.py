@@ -1,11 +1,21 @@
 import asyncio
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 
 from .api.artists import router as artists_router
 from .api.albums import router as albums_router
-from .crawler import repeat_every, DeezerCrawler, num_albums_in_queue
+from .cache import deezer_cache
+from .clients import clients
+from .limiter import deezer_limiter
+from .downloads import download_manager
+from .metrics import load_album_statuses
+from .crawler import num_albums_in_queue
+from .pipeline import pipeline_metrics
+from .review_queue import review_queue
+from .scheduler import crawl_scheduler
+from .verification import shutdown_pool
 from .settings import settings
 
 
@@ -16,12 +26,17 @@ app.include_router(albums_router, tags=["albums"])
 
 
 @app.on_event("startup")
-@repeat_every(minutes=5)
-async def crawl_deezer():
-    crawler = DeezerCrawler()
-    # Have to wait for database to initialize:
-    await asyncio.sleep(3)
-    await crawler.crawl_deezer()
+async def start_clients():
+    await clients.start()
+
+
+@app.on_event("shutdown")
+async def close_resources():
+    await clients.close()
+    # Both wait for work still running on their threads or processes, which
+    # must not block the event loop meanwhile:
+    await asyncio.to_thread(deezer_cache.close)
+    await asyncio.to_thread(shutdown_pool)
 
 
 @app.get("/")
@@ -39,10 +54,37 @@ async def get_queue_size():
     return {"queue_size": count}
 
 
+@app.get("/deezer-cache")
+async def get_deezer_cache_stats():
+    return await deezer_cache.run(deezer_cache.info)
+
+
+@app.get("/deezer-limiter")
+async def get_deezer_limiter_stats():
+    return deezer_limiter.info()
+
+
+@app.get("/crawl-pipeline")
+async def get_crawl_pipeline_stats():
+    return pipeline_metrics
+
+
+@app.get("/crawl-scheduler")
+async def get_crawl_scheduler_stats():
+    return crawl_scheduler.info()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 def create_app() -> FastAPI:
     from fastapi.middleware.cors import CORSMiddleware
     from tortoise.contrib.fastapi import register_tortoise
 
+    from .migrations import migrate
+
     origins = ["*"]
 
     app.add_middleware(
@@ -57,8 +99,20 @@ def create_app() -> FastAPI:
         app,
         db_url=settings.DATABASE_URL,
         modules={"models": ["app.models"]},
-        generate_schemas=True,
+        # Schemas are generated by migrate, after existing tables have been
+        # brought up to date:
+        generate_schemas=False,
         add_exception_handlers=True,
     )
+    app.add_event_handler("startup", migrate)
+    app.add_event_handler("startup", load_album_statuses)
+    app.add_event_handler("startup", review_queue.start)
+    app.add_event_handler("shutdown", review_queue.stop)
+    # Needs the migrated database to pick up jobs left from the last run:
+    app.add_event_handler("startup", download_manager.start)
+    app.add_event_handler("shutdown", download_manager.stop)
+    # Started last, once the database is ready and the clients are open:
+    app.add_event_handler("startup", crawl_scheduler.start)
+    app.add_event_handler("shutdown", crawl_scheduler.stop)
 
     return app
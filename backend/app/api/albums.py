@@ -1,31 +1,45 @@
 import os
+import json
 import shutil
 
+from typing import Optional
+
 import httpx
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from fastapi_pagination.ext.tortoise import paginate
-from fastapi_pagination import Params, Page
-from tortoise.transactions import atomic
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from fastapi_pagination import Params, Page, create_page
+from tortoise.queryset import QuerySet
 from tortoise.exceptions import DoesNotExist
 
 from pydantic import ValidationError
 
 from app.models import (
     Album,
+    DownloadJob,
     Upload,
 )
 from app.schemas import (
     AlbumInfo,
-    DeezerTrack,
+    DownloadJobInfo,
     TrackerAPIResponse,
     TrackerCode,
     TrackingStatus,
+    UploadBatch,
     UploadParameters,
-    RecordType,
-    ParsedAudioFile,
+    UploadResult,
 )
-from app.external import DeezerAPI, download_album, UploadManager
+from app.clients import get_qbittorrent_client, get_tracker_client
+from app.pagination import ALBUM_KEYS, CursorPage, CursorParams, keyset_paginate
+from app.downloads import download_manager
+from app import uploads
+from app.external import DeezerAPI
+from app.qbittorrent import QBittorrentSession
+from app.settings import settings
+from app.statuses import set_album_status
+from app.torrents import hashing_progress
+from app.uploads import downloaded_filepaths
+from app.verification import forget_album, iter_verifications, verify_album
 
 
 router = APIRouter()
@@ -38,36 +52,115 @@ async def get_album_or_404(id: int) -> Album:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
 
+# List views only show these columns. Selecting them (and the artist's)
+# through values() joins the artist into the same query and skips loading
+# the tracks/contributors/genres JSON of every row.
+ALBUM_INFO_FIELDS = (
+    "id",
+    "title",
+    "image_url",
+    "digital_release_date",
+    "release_date",
+    "create_date",
+    "record_type",
+    "status",
+    "folder_name",
+)
+ARTIST_INFO_FIELDS = ("id", "name", "image_url", "nb_album", "nb_fan", "create_date")
+
+
+async def fetch_album_infos(query: QuerySet[Album]) -> list[dict]:
+    rows = await query.values(
+        *ALBUM_INFO_FIELDS, *(f"artist__{field}" for field in ARTIST_INFO_FIELDS)
+    )
+    albums = []
+    for row in rows:
+        album = {field: row[field] for field in ALBUM_INFO_FIELDS}
+        album["artist"] = {
+            field: row[f"artist__{field}"] for field in ARTIST_INFO_FIELDS
+        }
+        album["download_path"] = os.path.join(
+            settings.DOWNLOAD_FOLDER, album.pop("folder_name"), ""
+        )
+        albums.append(album)
+    return albums
+
+
+async def paginate_album_infos(query: QuerySet[Album], params: Params):
+    raw_params = params.to_raw_params()
+    total = await query.count()
+    items = await fetch_album_infos(
+        query.offset(raw_params.offset).limit(raw_params.limit)
+    )
+    return create_page(items, total, params)
+
+
+def albums_by_status(status: TrackingStatus) -> QuerySet[Album]:
+    return Album.filter(status=status, eligible=True)
+
+
+def albums_ready_upload() -> QuerySet[Album]:
+    return Album.filter(
+        status__in=[TrackingStatus.Reviewed, TrackingStatus.Downloaded],
+        eligible=True,
+    )
+
+
 @router.get("/albums")
 async def get_albums(params: Params = Depends()) -> Page[AlbumInfo]:
-    results = await paginate(Album.all().prefetch_related("artist"), params)
-    return results
+    return await paginate_album_infos(Album.all(), params)  # type: ignore
+
+
+# Declared before /albums/{status} so that "cursor" isn't taken for a status
+@router.get("/albums/cursor")
+async def get_albums_cursor(
+    params: CursorParams = Depends(),
+) -> CursorPage[AlbumInfo]:
+    return await keyset_paginate(
+        Album.all(), params, ALBUM_KEYS, "albums", fetch=fetch_album_infos
+    )  # type: ignore
 
 
 @router.get("/albums/{status}")
 async def get_albums_by_status(
     status: TrackingStatus, params: Params = Depends()
 ) -> Page[AlbumInfo]:
-    results = await paginate(
-        Album.filter(status=status)
-        .exclude(artist__disabled=True, record_type=RecordType.Single)
-        .order_by("-release_date")
-        .prefetch_related("artist"),
+    return await paginate_album_infos(
+        albums_by_status(status).order_by("-release_date"), params
+    )  # type: ignore
+
+
+@router.get("/albums/{status}/cursor")
+async def get_albums_by_status_cursor(
+    status: TrackingStatus, params: CursorParams = Depends()
+) -> CursorPage[AlbumInfo]:
+    return await keyset_paginate(
+        albums_by_status(status),
         params,
-    )
-    return results
+        ALBUM_KEYS,
+        f"albums/{status.value}",
+        fetch=fetch_album_infos,
+    )  # type: ignore
 
 
 @router.get("/albums/upload/ready")
 async def get_albums_ready_upload(params: Params = Depends()) -> Page[AlbumInfo]:
-    results = await paginate(
-        Album.filter(status__in=[TrackingStatus.Reviewed, TrackingStatus.Downloaded])
-        .exclude(artist__disabled=True, record_type=RecordType.Single)
-        .order_by("-release_date")
-        .prefetch_related("artist"),
+    return await paginate_album_infos(
+        albums_ready_upload().order_by("-release_date"), params
+    )  # type: ignore
+
+
+@router.get("/albums/upload/ready/cursor")
+async def get_albums_ready_upload_cursor(
+    params: CursorParams = Depends(),
+) -> CursorPage[AlbumInfo]:
+    return await keyset_paginate(
+        albums_ready_upload(),
         params,
-    )
-    return results
+        ALBUM_KEYS,
+        "albums/upload/ready",
+        fetch=fetch_album_infos,
+    )  # type: ignore
 
 
 @router.get("/album/{id}")
@@ -79,8 +172,7 @@ async def get_album(album: Album = Depends(get_album_or_404)) -> AlbumInfo:
 async def add_album_upload_queue(
     album: Album = Depends(get_album_or_404),
 ) -> AlbumInfo:
-    album.status = TrackingStatus.Reviewed
-    await album.save()
+    await set_album_status(album, TrackingStatus.Reviewed)
 
     return album  # type: ignore
 
@@ -89,65 +181,111 @@ async def add_album_upload_queue(
 async def remove_album_upload_queue(
     album: Album = Depends(get_album_or_404),
 ) -> AlbumInfo:
-    album.status = TrackingStatus.Disabled  # type: ignore
-    await album.save()
+    await set_album_status(album, TrackingStatus.Disabled)
 
     try:
         shutil.rmtree(album.download_path)
     except FileNotFoundError:
         pass
+    await forget_album(album)
 
     return album  # type: ignore
 
 
 @router.put("/album/{id}/download")
 async def download_album_from_deezer(
-    background_tasks: BackgroundTasks, album: Album = Depends(get_album_or_404)
+    album: Album = Depends(get_album_or_404),
 ) -> AlbumInfo:
-    async def download():
-        download_album(album.id)
-        album.status = TrackingStatus.Downloaded
-        await album.save()
-
-    background_tasks.add_task(download)
+    await download_manager.enqueue(album)
     return album  # type: ignore
 
 
+@router.get("/album/{id}/download")
+async def get_album_download(
+    album: Album = Depends(get_album_or_404),
+) -> DownloadJobInfo:
+    job = await DownloadJob.filter(album_id=album.id).order_by("-id").first()
+    if job is None:
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND, detail="Album was never queued for download"
+        )
+    return download_job_info(job)
+
+
+@router.get("/downloads")
+async def get_downloads(params: Params = Depends()) -> Page[DownloadJobInfo]:
+    query = DownloadJob.all().order_by("-id")
+    raw_params = params.to_raw_params()
+    total = await query.count()
+    jobs = await query.offset(raw_params.offset).limit(raw_params.limit)
+    return create_page([download_job_info(job) for job in jobs], total, params)
+
+
+def download_job_info(job: DownloadJob) -> DownloadJobInfo:
+    info = DownloadJobInfo.from_orm(job)
+    info.progress = download_manager.progress(job)
+    return info
+
+
 @router.put("/album/{id}/upload")
-@atomic()
 async def upload_album(
     album: Album = Depends(get_album_or_404),
-    manager: UploadManager = Depends(UploadManager),
     tracker_code: TrackerCode = TrackerCode.RED,
+    client: httpx.AsyncClient = Depends(get_tracker_client),
+    qbittorrent: QBittorrentSession = Depends(get_qbittorrent_client),
 ) -> TrackerAPIResponse:
+    return await uploads.upload_album(album, tracker_code, client, qbittorrent)
+
 
-    if not all(verify_downloaded_contents(album).values()):
+@router.put("/album/{id}/seed")
+async def seed_album(
+    album: Album = Depends(get_album_or_404),
+    qbittorrent: QBittorrentSession = Depends(get_qbittorrent_client),
+) -> dict[str, int]:
+    # For uploads whose torrent couldn't be added to qBittorrent right after
+    # the upload:
+    album_uploads = await Upload.filter(album=album)
+    if not album_uploads:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Album not uploaded")
+    if not await uploads.seed_uploads(album_uploads, qbittorrent):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Downloaded audio content does not conform to verification",
+            status.HTTP_502_BAD_GATEWAY, detail="qBittorrent did not add the torrent"
         )
+    return {"seeded": len(album_uploads)}
 
-    torrent = manager.generate_torrent(album.download_path, tracker_code)
-    params = UploadParameters.from_album(album)
-    upload = await Upload.create(
-        infohash=torrent.infohash,
-        upload_parameters=params.dict(by_alias=True),
-        file=torrent.dump(),
-        tracker_code=tracker_code,
-        album=album,
-    )
-
-    async with httpx.AsyncClient() as client:
-        tracker_response = await manager.process_upload(
-            client, params, tracker_code, upload.file
-        )
-    upload.update_from_dict(tracker_response.dict(exclude_unset=True))
-    await upload.save()
-    manager.add_to_qbittorrent(upload.file)
-    album.status = TrackingStatus.Uploaded
-    await album.save()
 
-    return tracker_response
+@router.put("/albums/upload")
+async def upload_albums(
+    batch: UploadBatch,
+    tracker_code: TrackerCode = TrackerCode.RED,
+    client: httpx.AsyncClient = Depends(get_tracker_client),
+    qbittorrent: QBittorrentSession = Depends(get_qbittorrent_client),
+) -> StreamingResponse:
+    if batch.all_ready:
+        query = albums_ready_upload()
+    else:
+        query = Album.filter(id__in=batch.album_ids)
+    albums = await query.order_by("id").prefetch_related("artist")
+
+    missing = set(batch.album_ids) - {album.id for album in albums}
+
+    async def results():
+        for id in sorted(missing):
+            result = UploadResult(album_id=id, ok=False, error="Album not found")
+            yield result.json() + "\n"
+        async for result in uploads.upload_albums(
+            albums, tracker_code, client, qbittorrent
+        ):
+            yield result.json() + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.get("/album/{id}/upload/progress")
+async def get_album_hashing_progress(
+    album: Album = Depends(get_album_or_404),
+) -> dict[str, Optional[float]]:
+    return {"hashed": hashing_progress.get(album.download_path)}
 
 
 @router.get("/album/{id}/preview")
@@ -162,8 +300,7 @@ async def get_album(
     status: TrackingStatus,
     album: Album = Depends(get_album_or_404),
 ) -> AlbumInfo:
-    album.status = status
-    await album.save()
+    await set_album_status(album, status)
     return album  # type: ignore
 
 
@@ -172,41 +309,22 @@ async def verify_downloaded_album(
     album: Album = Depends(get_album_or_404),
 ) -> dict[str, bool]:
 
-    verifications = verify_downloaded_contents(album)
+    verifications = await verify_downloaded_contents(album)
     return verifications
 
 
-def verify_downloaded_contents(album: Album) -> dict[str, bool]:
-    parsed_files = []
+@router.get("/album/{id}/verifications/stream")
+async def stream_downloaded_album_verifications(
+    album: Album = Depends(get_album_or_404),
+) -> StreamingResponse:
+    filepaths = downloaded_filepaths(album)
 
-    try:
-        filenames = os.listdir(album.download_path)
-    except FileNotFoundError:
-        raise HTTPException(
-            status.HTTP_404_NOT_FOUND, detail="Album not downloaded yet"
-        )
+    async def results():
+        async for filepath, verified in iter_verifications(album, filepaths):
+            yield json.dumps({"filepath": filepath, "verified": verified}) + "\n"
 
-    for filename in filenames:
-        if not filename.endswith((".flac", "cover.jpg")):
-            raise HTTPException(
-                status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Encountered unexpected file in download folder: {filename}",
-            )
-        if not filename.endswith(".flac"):
-            continue
-        filepath = os.path.join(album.download_path, filename)
-        parsed_files.append(ParsedAudioFile.from_filepath(filepath))
-    parsed_files = list(sorted(parsed_files, key=lambda x: x.position))
-
-    if len(album.tracks) != len(parsed_files):
-        raise HTTPException(
-            status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Number of tracks downloaded does not match album tracks",
-        )
-    results = {}
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
-    for parsed, track in zip(parsed_files, album.tracks):
-        track = DeezerTrack(**track)
-        results[parsed.filepath] = parsed.verify(album, track)
 
-    return results
+async def verify_downloaded_contents(album: Album) -> dict[str, bool]:
+    return await verify_album(album, downloaded_filepaths(album))
@@ -4,9 +4,11 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi_pagination.ext.tortoise import paginate
 from fastapi_pagination import Params, Page
 from tortoise.exceptions import DoesNotExist
+from tortoise.transactions import in_transaction
 
 
 from app.models import (
+    Album,
     Artist,
 )
 from app.schemas import (
@@ -14,11 +16,17 @@ from app.schemas import (
     DeezerArtistAlbums,
     GazelleSearchResult,
     TrackerCode,
+    TrackingStatus,
 )
+from app.clients import get_tracker_client
 from app.external import (
     GazelleAPI,
     TRACKER_APIS,
 )
+from app.matching import Matcher
+from app.pagination import ARTIST_KEYS, CursorPage, CursorParams, keyset_paginate
+from app.review_queue import review_queue
+from app.scheduler import crawl_scheduler
 from app.settings import settings
 
 router = APIRouter()
@@ -37,6 +45,15 @@ async def get_artists(params: Params = Depends()) -> Page[DeezerArtist]:
     return artists
 
 
+@router.get("/artists/cursor")
+async def get_artists_cursor(
+    params: CursorParams = Depends(),
+) -> CursorPage[DeezerArtist]:
+    return await keyset_paginate(
+        Artist.all(), params, ARTIST_KEYS, "artists"
+    )  # type: ignore
+
+
 @router.get("/artist/{id}")
 async def get_artist(
     artist: DeezerArtist = Depends(get_artist_or_404),
@@ -57,7 +74,14 @@ async def disable_artist(
     artist: Artist = Depends(get_artist_or_404),
 ) -> DeezerArtist:
     artist.disabled = True  # type: ignore
-    await artist.save()
+    async with in_transaction():
+        await artist.save()
+        albums = Album.filter(artist_id=artist.id, eligible=True)
+        queued = await albums.filter(status=TrackingStatus.Added).count()
+        await albums.update(eligible=False)
+        await review_queue.add(-queued)
+    # Its albums just left the review queue:
+    crawl_scheduler.notify()
 
     return artist  # type: ignore
 
@@ -76,9 +100,18 @@ def get_tracker_or_404(tracker_code: TrackerCode) -> GazelleAPI:
 async def search_redacted(
     artist: Artist = Depends(get_artist_or_404),
     tracker=Depends(get_tracker_or_404),
+    client: httpx.AsyncClient = Depends(get_tracker_client),
 ) -> list[GazelleSearchResult]:
 
-    async with httpx.AsyncClient() as client:
-        results = await tracker.search_artist(client, artist.name)
+    results = await tracker.search_artist(client, artist.name)
+
+    albums = await Album.filter(artist_id=artist.id).values_list("id", "title")
+    matcher = Matcher([title for _, title in albums])
+    matches = matcher.best_matches([result.title for result in results])
+    for result, (row, score) in zip(results, matches):
+        result.match = score
+        if row is not None:
+            result.album_id = albums[row][0]
+    results.sort(key=lambda result: result.match, reverse=True)
 
     return results
@@ -0,0 +1,306 @@
+import os
+import re
+import time
+import asyncio
+import sqlite3
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.settings import settings
+
+
+T = TypeVar("T")
+
+# Time to live in seconds for each kind of Deezer endpoint. Album and track
+# metadata practically never changes once published; an artist's fan count
+# and album listing do.
+ENDPOINT_TTLS = {
+    "artist": 24 * 60 * 60,
+    "artist_albums": 6 * 60 * 60,
+    "album": 7 * 24 * 60 * 60,
+    "track": 30 * 24 * 60 * 60,
+}
+
+ENDPOINT_PATTERNS = [
+    ("artist_albums", re.compile(r"^/artist/\d+/albums$")),
+    ("artist", re.compile(r"^/artist/\d+$")),
+    ("album", re.compile(r"^/album/\d+$")),
+    ("track", re.compile(r"^/track/\d+$")),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS response (
+    url TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS response_last_access ON response (last_access);
+"""
+
+
+class CacheMissError(Exception):
+    """Raised in offline mode when a request has no recorded response."""
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    endpoint: str
+    body: bytes
+    etag: Optional[str]
+    stored_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.stored_at < ENDPOINT_TTLS[self.endpoint]
+
+    def to_response(self) -> httpx.Response:
+        headers = {"content-type": "application/json"}
+        if self.etag:
+            headers["etag"] = self.etag
+        return httpx.Response(
+            200,
+            content=self.body,
+            headers=headers,
+            request=httpx.Request("GET", self.url),
+        )
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    revalidated: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+
+class ResponseCache:
+    """Size bounded LRU cache of Deezer API responses kept in SQLite.
+
+    Entries expire per endpoint (see ``ENDPOINT_TTLS``). An expired entry
+    with an ETag is revalidated with ``If-None-Match`` instead of being
+    refetched. In offline mode entries never expire and a miss raises
+    ``CacheMissError`` instead of going to the network, which together with
+    ``load_fixtures`` lets the crawler run without network access.
+
+    The methods are blocking. From the event loop they go through run(),
+    which calls them on the cache's own single thread, so SQLite never
+    blocks the loop and calls never overlap. A hit doesn't write its access
+    time right away: accesses are kept in memory and written together every
+    ``TOUCH_BATCH`` hits or ``TOUCH_INTERVAL`` seconds, and before evicting.
+    """
+
+    TOUCH_BATCH = 500
+    TOUCH_INTERVAL = 30.0
+
+    def __init__(self, path: str, max_bytes: int, offline: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.stats = CacheStats()
+        self._db: Optional[sqlite3.Connection] = None
+        self._total_bytes = 0
+        # url -> last access time not written yet:
+        self._touched: dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="deezer-cache")
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            # This is a cache: losing the last few writes on a power cut is
+            # fine, paying an fsync on every stored response is not.
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=OFF")
+            self._db.executescript(SCHEMA)
+            (total,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM response"
+            ).fetchone()
+            self._total_bytes = total
+        return self._db
+
+    def close(self):
+        # On the cache's thread, after whatever is still running there:
+        self._executor.submit(self._close).result()
+
+    def _close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    @staticmethod
+    def endpoint(url: str) -> Optional[str]:
+        path = urlsplit(url).path
+        for name, pattern in ENDPOINT_PATTERNS:
+            if pattern.match(path):
+                return name
+        return None
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        endpoint = self.endpoint(url)
+        if endpoint is None:
+            return None
+
+        row = self.db.execute(
+            "SELECT body, etag, stored_at FROM response WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            if self.offline:
+                raise CacheMissError(url)
+            return None
+
+        body, etag, stored_at = row
+        entry = CacheEntry(url, endpoint, body, etag, stored_at)
+        if entry.fresh or self.offline:
+            self.stats.hits += 1
+            self._touch(url)
+        else:
+            self.stats.misses += 1
+        return entry
+
+    def store(self, url: str, response: httpx.Response):
+        endpoint = self.endpoint(url)
+        if endpoint is None or response.status_code != 200:
+            return
+        body = response.content
+        # Deezer reports errors (missing ids, exceeded quota) with a 200 and
+        # an error object; those must not be served back later.
+        if body.lstrip().startswith(b'{"error"'):
+            return
+        self._write(url, endpoint, body, response.headers.get("etag"))
+        self.stats.stores += 1
+        self._evict()
+
+    def revalidate(self, entry: CacheEntry, response: httpx.Response):
+        """Refreshes an expired entry after the server answered 304."""
+        now = time.time()
+        etag = response.headers.get("etag", entry.etag)
+        self.db.execute(
+            "UPDATE response SET stored_at = ?, last_access = ?, etag = ? "
+            "WHERE url = ?",
+            (now, now, etag, entry.url),
+        )
+        self.db.commit()
+        self._touched.pop(entry.url, None)
+        self.stats.revalidated += 1
+
+    def load_fixtures(self, directory: str, base_url: str) -> int:
+        """Imports recorded responses, e.g. ``album/302127.json`` is stored
+        as the response for ``{base_url}/album/302127``."""
+        count = 0
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if not filename.endswith(".json"):
+                    continue
+                filepath = os.path.join(root, filename)
+                relpath = os.path.relpath(filepath, directory)[: -len(".json")]
+                url = f"{base_url}/{relpath.replace(os.sep, '/')}"
+                endpoint = self.endpoint(url)
+                if endpoint is None:
+                    continue
+                with open(filepath, "rb") as f:
+                    self._write(url, endpoint, f.read(), None)
+                count += 1
+        self._evict()
+        return count
+
+    def export_fixtures(self, directory: str):
+        """Writes every cached response out in the ``load_fixtures`` layout."""
+        for url, body in self.db.execute("SELECT url, body FROM response"):
+            filepath = os.path.join(directory, urlsplit(url).path.lstrip("/"))
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath + ".json", "wb") as f:
+                f.write(body)
+
+    def info(self) -> dict:
+        (entries,) = self.db.execute("SELECT COUNT(*) FROM response").fetchone()
+        requests = self.stats.hits + self.stats.misses
+        return {
+            **self.stats.__dict__,
+            "hit_rate": self.stats.hits / requests if requests else 0.0,
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "offline": self.offline,
+        }
+
+    def _write(self, url: str, endpoint: str, body: bytes, etag: Optional[str]):
+        now = time.time()
+        previous = self.db.execute(
+            "SELECT size FROM response WHERE url = ?", (url,)
+        ).fetchone()
+        if previous is not None:
+            self._total_bytes -= previous[0]
+        self.db.execute(
+            "INSERT OR REPLACE INTO response "
+            "(url, endpoint, body, etag, size, stored_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, endpoint, body, etag, len(body), now, now),
+        )
+        self.db.commit()
+        self._touched.pop(url, None)
+        self._total_bytes += len(body)
+
+    def _touch(self, url: str):
+        self._touched[url] = time.time()
+        if (
+            len(self._touched) >= self.TOUCH_BATCH
+            or time.monotonic() - self._last_flush >= self.TOUCH_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        """Writes the access times kept since the last flush."""
+        self._last_flush = time.monotonic()
+        if not self._touched:
+            return
+        self.db.executemany(
+            "UPDATE response SET last_access = ? WHERE url = ?",
+            [(accessed, url) for url, accessed in self._touched.items()],
+        )
+        self.db.commit()
+        self._touched.clear()
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Least recently used by the access times as they are now:
+        self.flush()
+        # Evict down to 90% of the budget so that a full cache doesn't end up
+        # running an eviction on every single store:
+        target = int(self.max_bytes * 0.9)
+        evicted = []
+        for url, size in self.db.execute(
+            "SELECT url, size FROM response ORDER BY last_access"
+        ):
+            if self._total_bytes <= target:
+                break
+            evicted.append((url,))
+            self._total_bytes -= size
+        self.db.executemany("DELETE FROM response WHERE url = ?", evicted)
+        self.db.commit()
+        self.stats.evictions += len(evicted)
+
+
+deezer_cache = ResponseCache(
+    settings.DEEZER_CACHE_PATH,
+    settings.DEEZER_CACHE_MAX_BYTES,
+    offline=settings.DEEZER_CACHE_OFFLINE,
+)
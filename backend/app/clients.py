@@ -0,0 +1,100 @@
+from typing import Optional
+
+import httpx
+
+from app.qbittorrent import QBittorrentSession
+from app.settings import settings
+
+
+# Deezer gets the widest pool: the crawler fans out over albums and tracks
+# and every request should land on an already warm connection.
+DEEZER_LIMITS = httpx.Limits(
+    max_connections=settings.DEEZER_API_MAX_CONCURRENCY,
+    max_keepalive_connections=settings.DEEZER_API_MAX_CONCURRENCY,
+    keepalive_expiry=60,
+)
+TRACKER_LIMITS = httpx.Limits(
+    max_connections=5, max_keepalive_connections=5, keepalive_expiry=60
+)
+# Torrent uploads post the .torrent file and can take a while on a busy
+# tracker, so allow a longer read than for the Deezer JSON endpoints:
+DEEZER_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+TRACKER_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+# Retries only cover failures to establish a connection; a request that
+# reached the server is never replayed.
+CONNECT_RETRIES = 3
+
+
+class ClientRegistry:
+    """Application scoped HTTP clients, one connection pool per upstream.
+
+    Opened by the FastAPI startup hook and closed on shutdown. Routes get
+    clients through the ``get_*_client`` dependencies below rather than
+    opening an ``httpx.AsyncClient`` per request.
+    """
+
+    def __init__(self):
+        self._deezer: Optional[httpx.AsyncClient] = None
+        self._tracker: Optional[httpx.AsyncClient] = None
+        self._qbittorrent: Optional[QBittorrentSession] = None
+
+    async def start(self):
+        self._deezer = self._build_client(DEEZER_LIMITS, DEEZER_TIMEOUT)
+        self._tracker = self._build_client(TRACKER_LIMITS, TRACKER_TIMEOUT)
+        # Logs in on first use and keeps its cookie until shutdown:
+        self._qbittorrent = QBittorrentSession(
+            host=settings.QBITTORRENT_HOST,
+            port=settings.QBITTORRENT_PORT,
+            username=settings.QBITTORRENT_USERNAME,
+            password=settings.QBITTORRENT_PASSWORD,
+        )
+
+    async def close(self):
+        for client in (self._deezer, self._tracker):
+            if client is not None:
+                await client.aclose()
+        if self._qbittorrent is not None:
+            await self._qbittorrent.close()
+        self._deezer = self._tracker = self._qbittorrent = None
+
+    @property
+    def deezer(self) -> httpx.AsyncClient:
+        return self._require(self._deezer)
+
+    @property
+    def tracker(self) -> httpx.AsyncClient:
+        return self._require(self._tracker)
+
+    @property
+    def qbittorrent(self) -> QBittorrentSession:
+        return self._require(self._qbittorrent)
+
+    @staticmethod
+    def _build_client(limits: httpx.Limits, timeout: httpx.Timeout):
+        # When a transport is given, httpx ignores the client level http2 and
+        # limits arguments so they have to be set on the transport:
+        transport = httpx.AsyncHTTPTransport(
+            http2=True, limits=limits, retries=CONNECT_RETRIES
+        )
+        return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+    @staticmethod
+    def _require(client):
+        if client is None:
+            raise RuntimeError("Clients are not started, is the app running?")
+        return client
+
+
+clients = ClientRegistry()
+
+
+def get_deezer_client() -> httpx.AsyncClient:
+    return clients.deezer
+
+
+def get_tracker_client() -> httpx.AsyncClient:
+    return clients.tracker
+
+
+def get_qbittorrent_client() -> QBittorrentSession:
+    return clients.qbittorrent
@@ -1,122 +1,154 @@
-import asyncio
-import functools
+from datetime import date, datetime
 
-import asynciolimiter
 import httpx
 
-from tortoise.functions import Max
-from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
 
+from app.cache import deezer_cache
 from app.external import DeezerAPI
-from app.models import Artist, Album, RecordType
-from app.schemas import TrackingStatus
+from app.frontier import Frontier
+from app.limiter import deezer_limiter
+from app.metrics import DB_QUERY_SECONDS, count_new_albums
+from app.models import Artist, Album, CrawlState, RecordType, artist_check_interval
+from app.pipeline import CrawlBatch, CrawlPipeline, CrawlRunStats, Scraped
+from app.review_queue import review_queue
+from app.schemas import DeezerAlbum, TrackingStatus
 from app.settings import settings
 
 
-# Lifted directly from fastapi-utils:
-# https://github.com/dmontagu/fastapi-utils/blob/master/fastapi_utils/tasks.py
-def repeat_every(*, minutes: int):
-    def decorator(func):
-        @functools.wraps(func)
-        async def wrapped() -> None:
-            async def run_forever() -> None:
-                while True:
-                    try:
-                        await func()  # type: ignore
-                    except Exception as exc:
-                        raise exc
-                    await asyncio.sleep(minutes * 60)
-
-            asyncio.ensure_future(run_forever())
-
-        return wrapped
-
-    return decorator
-
-
 async def num_albums_in_queue() -> int:
-    count = (
-        await Album.filter(status=TrackingStatus.Added)
-        .exclude(artist__disabled=True, record_type=RecordType.Single)
-        .count()
-    )
-    return count
+    return await review_queue.size()
 
 
 class DeezerCrawler:
 
+    # Number of ids claimed from the frontier at once and of artists written
+    # per transaction:
     BATCH_SIZE = 10
-    BATCH_LIMIT = 5
 
     def __init__(self):
-        self.counter = 0
-        self.is_active = False
-        self.limiter = asynciolimiter.StrictLimiter(settings.DEEZER_API_RATE_LIMIT)
-        self.deezer_api = DeezerAPI(self.limiter)
-
-    async def find_start_point(self) -> int:
-        id: int = (
-            await Artist.all()
-            .annotate(start_id=Max("id"))
-            .first()
-            .values_list("start_id", flat=True)
-        )  # type: ignore
-        print(f"Start point {id}")
-        if id is None:
-            return settings.DEEZER_ARTIST_START_ID
-        return id
-
-    def reset_counter(self):
-        self.counter = 0
-
-    async def crawl_deezer(self):
+        # Shared between crawls so the backed off rate carries over:
+        self.limiter = deezer_limiter
+        self.deezer_api = DeezerAPI(
+            self.limiter,
+            cache=deezer_cache if settings.DEEZER_CACHE_ENABLED else None,
+        )
+        self.frontier = Frontier()
+
+    async def crawl_deezer(self, client: httpx.AsyncClient) -> CrawlRunStats:
         print("Starting to maybe crawl...")
-        queue_size = await num_albums_in_queue()
-        self.reset_counter()
-
-        while (
-            queue_size < settings.DEEZER_QUEUE_LIMIT and self.counter < self.BATCH_LIMIT
-        ):
-            artist_id = await self.find_start_point()
-            async with httpx.AsyncClient() as client:
-                await self.crawl_range(client, artist_id, artist_id + self.BATCH_SIZE)
-
-            queue_size = await num_albums_in_queue()
-            self.counter += 1
-
-    async def crawl_range(self, client: httpx.AsyncClient, start: int, end: int):
-        tasks = []
-        for id in range(start, end):
-            tasks.append(self.scrape_artist(client, id))
-        await asyncio.gather(*tasks)
-
-    async def scrape_artist(
-        self,
-        client: httpx.AsyncClient,
-        id: int,
-    ):
-        if await Artist.get_or_none(id=id):
-            return None
-
+        if await self.queue_full():
+            return CrawlRunStats()
+        await self.frontier.recover()
+
+        pipeline = CrawlPipeline(self, client, budget=settings.MAX_CRAWLS_PER_RUN)
+        stats = await pipeline.run()
+        print(
+            f"Crawl finished: {stats.fetched} fetched, {stats.fetch_errors} "
+            f"failed, queues {pipeline.info()}"
+        )
+        if stats.fetch_errors:
+            print(f"Last crawl error: {stats.last_error}")
+        return stats
+
+    async def queue_full(self) -> bool:
+        return await num_albums_in_queue() >= settings.DEEZER_QUEUE_LIMIT
+
+    async def known_ids(self, ids: list[int]) -> set[int]:
+        # One query for a whole range instead of a lookup per id
+        with DB_QUERY_SECONDS.labels("known_ids").time():
+            known = await Artist.filter(id__in=ids).values_list("id", flat=True)
+        return set(known)  # type: ignore
+
+    async def fetch(self, client: httpx.AsyncClient, id: int) -> Scraped:
         artist = await self.deezer_api.fetch_artist(client, id)
         print(f"Artist: {artist}")
-        if artist:
-            await Artist.create(**artist.dict())
-            albums = await self.deezer_api.fetch_albums(client, id)
-
-            for album in albums:
-                # Some albums don't have genres listed. Deezer identifies these
-                # by setting genre_id=-1. Redacted requires
-                # every album to have a genre, though. Automatically disable these
-                if not album.genres:
-                    album.status = TrackingStatus.Disabled
-                if album.release_date.year < settings.DEEZER_MINIMUM_RELEASE_YEAR:
-                    album.status = TrackingStatus.Disabled
-                try:
-                    # print(f"Artist {artist.id} | {album.id}")
-                    album = await Album.create(**album.dict())
-                # An album can belong to multiple Artists. We may encounter
-                # a unique constraint database error if this album was previously
-                # added through another artist:
-                except IntegrityError:
-                    continue
+        if not artist:
+            return Scraped(id)
+
+        albums = await self.deezer_api.fetch_albums(client, id)
+        return Scraped(id, artist=artist, albums=albums)
+
+    def apply_filters(self, albums: list[DeezerAlbum]):
+        for album in albums:
+            # Some albums don't have genres listed. Deezer identifies these
+            # by setting genre_id=-1. Redacted requires
+            # every album to have a genre, though. Automatically disable these
+            if not album.genres:
+                album.status = TrackingStatus.Disabled
+            if album.release_date.year < settings.DEEZER_MINIMUM_RELEASE_YEAR:
+                album.status = TrackingStatus.Disabled
+
+    async def persist(self, batch: CrawlBatch) -> int:
+        """Writes a batch in a single transaction, together with the frontier
+        state, so a crash keeps either the whole batch or none of it.
+        Returns the number of new albums."""
+        with DB_QUERY_SECONDS.labels("persist").time():
+            albums = await self._persist(batch)
+        # Only counted once the transaction has committed:
+        count_new_albums(album.status for album in albums)
+        return len(albums)
+
+    async def _persist(self, batch: CrawlBatch) -> list[DeezerAlbum]:
+        # Crawling an artist is its first check for new releases:
+        now = datetime.now()
+        latest = latest_releases(batch.albums)
+        artists = []
+        for artist in batch.artists:
+            interval = artist_check_interval(artist.nb_fan, latest.get(artist.id))
+            artists.append(
+                Artist(**artist.dict(), last_checked=now, next_check=now + interval)
+            )
+
+        async with in_transaction():
+            await Artist.bulk_create(artists, ignore_conflicts=True)
+            albums = await insert_albums(batch.albums)
+
+            await self.frontier.mark(batch.done_ids, CrawlState.Done)
+            await self.frontier.mark(batch.missing_ids, CrawlState.Missing)
+        return albums
+
+
+async def insert_albums(albums: list[DeezerAlbum]) -> list[DeezerAlbum]:
+    """Stores the albums that aren't stored yet and counts the ones that
+    enter the review queue. Call it inside the transaction of the batch.
+    Returns the albums stored."""
+    # An album can belong to multiple Artists. It may have been added
+    # through another artist before or through another artist in this very
+    # batch:
+    new = {album.id: album for album in albums}
+    existing = await Album.filter(id__in=list(new)).values_list("id", flat=True)
+    for id in existing:
+        del new[id]
+    # A listing can hold albums whose main artist is another one, e.g. a
+    # compilation or a guest appearance. Unless that artist is stored they
+    # would fail the foreign key, and with it the whole batch:
+    artist_ids = {album.artist_id for album in new.values()}
+    stored = set(
+        await Artist.filter(id__in=list(artist_ids)).values_list("id", flat=True)
+    )
+    foreign = [id for id, album in new.items() if album.artist_id not in stored]
+    for id in foreign:
+        del new[id]
+    if foreign:
+        print(f"Skipped albums of artists that aren't stored: {foreign}")
+    created = [
+        Album(
+            **album.dict(),
+            eligible=album.record_type != RecordType.Single,
+        )
+        for album in new.values()
+    ]
+    await Album.bulk_create(created, ignore_conflicts=True)
+    queued = [album for album in created if album.status == TrackingStatus.Added]
+    await review_queue.add(sum(album.eligible for album in queued))
+    return list(new.values())
+
+
+def latest_releases(albums: list[DeezerAlbum]) -> dict[int, date]:
+    latest: dict[int, date] = {}
+    for album in albums:
+        previous = latest.get(album.artist_id)
+        if previous is None or album.release_date > previous:
+            latest[album.artist_id] = album.release_date
+    return latest
@@ -0,0 +1,160 @@
+import random
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from deezer import Deezer
+
+from app.external import download_album, login_deezer
+from app.metrics import ALBUM_STAGE_SECONDS
+from app.models import Album, DownloadJob, DownloadState, TrackingStatus
+from app.settings import settings
+from app.statuses import set_album_status
+
+
+class DeezerSession:
+    """One logged in Deezer client shared by every download thread, so the
+    ARL login happens once instead of once per album."""
+
+    def __init__(self):
+        self._deezer: Optional[Deezer] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Deezer:
+        with self._lock:
+            if self._deezer is None or not self._deezer.logged_in:
+                self._deezer = login_deezer()
+            return self._deezer
+
+    def reset(self):
+        # After a failure the session may be what's broken (expired ARL,
+        # dropped connection); the next download logs in again.
+        with self._lock:
+            self._deezer = None
+
+
+class ProgressListener:
+    """Receives deemix's download events from the worker thread."""
+
+    def __init__(self):
+        self.progress = 0
+
+    def send(self, key: str, value=None):
+        if key == "updateQueue" and isinstance(value, dict) and "progress" in value:
+            self.progress = value["progress"]
+
+
+class DownloadManager:
+    """Downloads albums in the background, ``workers`` at a time.
+
+    Jobs live in the DownloadJob table so that queued and interrupted jobs
+    survive a restart. The actual downloads are blocking deemix calls and run
+    in a thread pool, never on the event loop. Failed jobs are retried with
+    a growing delay up to ``max_attempts`` times.
+    """
+
+    RETRY_DELAY = 30
+
+    def __init__(self, workers: int, max_attempts: int):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.session = DeezerSession()
+        self.queue: asyncio.Queue[int] = asyncio.Queue()
+        self.listeners: dict[int, ProgressListener] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="download")
+        # Whatever was running when the app stopped starts over:
+        await DownloadJob.filter(state=DownloadState.Running).update(
+            state=DownloadState.Queued
+        )
+        queued = await (
+            DownloadJob.filter(state=DownloadState.Queued)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        for id in queued:
+            self.queue.put_nowait(id)  # type: ignore
+        self._tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def enqueue(self, album: Album) -> DownloadJob:
+        job = await DownloadJob.filter(
+            album_id=album.id,
+            state__in=[DownloadState.Queued, DownloadState.Running],
+        ).first()
+        if job is not None:
+            return job
+        job = await DownloadJob.create(album=album)
+        self.queue.put_nowait(job.id)
+        return job
+
+    def progress(self, job: DownloadJob) -> int:
+        listener = self.listeners.get(job.id)
+        if listener is not None:
+            return listener.progress
+        return job.progress
+
+    async def worker(self):
+        while True:
+            id = await self.queue.get()
+            try:
+                await self.run(id)
+            except Exception as exc:
+                # Never let one job take a worker down with it
+                print(f"Download job {id} crashed: {exc!r}")
+
+    async def run(self, id: int):
+        job = await DownloadJob.get(id=id).prefetch_related("album")
+        if job.state != DownloadState.Queued:
+            return
+        job.state = DownloadState.Running
+        job.attempts += 1
+        job.update_date = datetime.now()
+        await job.save()
+
+        listener = ProgressListener()
+        self.listeners[job.id] = listener
+        loop = asyncio.get_running_loop()
+        try:
+            with ALBUM_STAGE_SECONDS.labels("download").time():
+                await loop.run_in_executor(
+                    self._pool, self.download, job.album.id, listener
+                )
+        except Exception as exc:
+            self.session.reset()
+            job.error = repr(exc)
+            job.progress = listener.progress
+            if job.attempts < self.max_attempts:
+                job.state = DownloadState.Queued
+                delay = self.RETRY_DELAY * 2 ** (job.attempts - 1)
+                delay *= random.uniform(0.5, 1.5)
+                loop.call_later(delay, self.queue.put_nowait, job.id)
+            else:
+                job.state = DownloadState.Failed
+        else:
+            job.state = DownloadState.Done
+            job.progress = 100
+            await set_album_status(job.album, TrackingStatus.Downloaded)
+        finally:
+            self.listeners.pop(job.id, None)
+            job.update_date = datetime.now()
+            await job.save()
+
+    def download(self, deezer_id: int, listener: ProgressListener):
+        download_album(deezer_id, self.session.get(), listener)
+
+
+download_manager = DownloadManager(
+    workers=settings.DOWNLOAD_WORKERS, max_attempts=settings.DOWNLOAD_MAX_ATTEMPTS
+)
@@ -1,13 +1,15 @@
 import abc
-import difflib
+import time
+import random
+import asyncio
 
+from collections import OrderedDict
 from datetime import datetime, date
 from io import BytesIO
 from typing import Optional
 
 import httpx
 import torf
-import qbittorrentapi
 import pydantic
 
 
@@ -15,7 +17,9 @@ from deezer import Deezer
 from deemix.itemgen import generateAlbumItem
 from deemix.downloader import Downloader
 
-from .models import TrackerCode, RecordType
+from .cache import ResponseCache
+from .metrics import DEEZER_REQUESTS, DEEZER_REQUEST_SECONDS, deezer_endpoint
+from .models import TrackerCode, RecordType, album_folder_name
 from .schemas import (
     DeezerArtist,
     DeezerAlbum,
@@ -27,21 +31,109 @@ from .schemas import (
 )
 
 from .settings import settings, DEEMIX_SETTINGS
+from .torrents import generate_torrent
+
+
+class DeezerQuotaError(Exception):
+    """Deezer kept rejecting a request for exceeding the quota."""
+
+
+class DeezerAPIError(Exception):
+    """Deezer answered with an error where data was expected."""
 
 
 class DeezerAPI:
 
-    API_BASE_URL = "https://api.deezer.com"
+    API_BASE_URL = settings.DEEZER_API_URL
+    # Album listings are paginated, 25 albums per page unless asked for more:
+    ALBUMS_PAGE_SIZE = 100
+    # Deezer reports an exceeded quota as a 200 with this error code:
+    # {'error': {'type': 'Exception', 'message': 'Quota limit exceeded', 'code': 4}}
+    QUOTA_ERROR_CODE = 4
 
-    def __init__(self, limiter=None):
+    def __init__(
+        self,
+        limiter=None,
+        max_concurrency: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
         self.limiter = limiter
+        self.cache = cache
+        self.release_dates = ReleaseDateResolver(self)
+        # Caps the number of requests waiting on a response at once. The
+        # limiter decides *when* a request may start, this decides how many
+        # may be open, so a large fan-out can't pile up hundreds of sockets
+        # behind the limiter:
+        if max_concurrency is None:
+            max_concurrency = settings.DEEZER_API_MAX_CONCURRENCY
+        self.semaphore = asyncio.Semaphore(max_concurrency)
 
     async def get(self, client: httpx.AsyncClient, url: str) -> httpx.Response:
-        if self.limiter is not None:
-            await self.limiter.wait()
-        response = await client.get(url)
+        endpoint = deezer_endpoint(url)
+        entry = None
+        headers = {}
+        if self.cache is not None:
+            # Cache hits never touch the limiter, they don't count against
+            # the Deezer quota:
+            entry = await self.cache.run(self.cache.lookup, url)
+            if entry is not None:
+                if entry.fresh or self.cache.offline:
+                    DEEZER_REQUESTS.labels(endpoint, "cached").inc()
+                    return entry.to_response()
+                if entry.etag:
+                    headers["If-None-Match"] = entry.etag
+
+        response = await self._get_with_retries(client, url, headers, endpoint)
+
+        if self.cache is not None:
+            if response.status_code == 304 and entry is not None:
+                DEEZER_REQUESTS.labels(endpoint, "not_modified").inc()
+                await self.cache.run(self.cache.revalidate, entry, response)
+                return entry.to_response()
+            await self.cache.run(self.cache.store, url, response)
         return response
 
+    async def _get_with_retries(
+        self, client: httpx.AsyncClient, url: str, headers: dict, endpoint: str
+    ) -> httpx.Response:
+        for attempt in range(settings.DEEZER_API_MAX_RETRIES + 1):
+            async with self.semaphore:
+                if self.limiter is not None:
+                    await self.limiter.wait()
+                started = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                elapsed = time.perf_counter() - started
+            DEEZER_REQUEST_SECONDS.labels(endpoint).observe(elapsed)
+
+            if not self.is_throttled(response):
+                if response.status_code != 304:
+                    DEEZER_REQUESTS.labels(endpoint, "ok").inc()
+                if self.limiter is not None:
+                    self.limiter.success()
+                return response
+
+            DEEZER_REQUESTS.labels(endpoint, "throttled").inc()
+            if self.limiter is not None:
+                self.limiter.throttle()
+            # Exponential backoff with full jitter so that all the requests
+            # throttled together don't come back together:
+            delay = random.uniform(0, min(30, 2**attempt))
+            if "retry-after" in response.headers:
+                delay = max(delay, float(response.headers["retry-after"]))
+            await asyncio.sleep(delay)
+
+        raise DeezerQuotaError(url)
+
+    def is_throttled(self, response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        if response.status_code != 200:
+            return False
+        if not response.content.lstrip().startswith(b'{"error"'):
+            return False
+        error = response.json()["error"]
+        return error.get("code") == self.QUOTA_ERROR_CODE
+
     async def fetch_artist(
         self, client: httpx.AsyncClient, id: int
     ) -> Optional[DeezerArtist]:
@@ -66,20 +158,52 @@ class DeezerAPI:
         self, client: httpx.AsyncClient, id: int
     ) -> list[DeezerAlbum]:
         """Retrieves a list of albums given a specific artist ID"""
-        url = f"{self.API_BASE_URL}/artist/{id}/albums"
-        response = await self.get(client, url)
-        data = response.json()
+        records = await self.fetch_album_listing(client, id)
+        ids = [record["id"] for record in records]
+        return await self.fetch_albums_by_id(client, ids)
 
-        albums = []
-        for record in data["data"]:
-            album_id = record["id"]
-            try:
-                album = await self.fetch_album_details(client, album_id)
-            # Sometimes album metadata is incomplete like missing image_url:
-            except pydantic.ValidationError:
-                continue
-            albums.append(album)
-        return albums
+    async def fetch_album_listing(
+        self, client: httpx.AsyncClient, id: int
+    ) -> list[dict]:
+        """Every album record of an artist, one request per page. Records
+        only have the album's id, title, release date and record type; the
+        details cost a request per album."""
+        url = f"{self.API_BASE_URL}/artist/{id}/albums?limit={self.ALBUMS_PAGE_SIZE}"
+        records = []
+        while url:
+            response = await self.get(client, url)
+            data = response.json()
+            if "error" in data:
+                raise DeezerAPIError(url, data["error"])
+            records.extend(data["data"])
+            url = data.get("next")
+        return records
+
+    async def fetch_albums_by_id(
+        self, client: httpx.AsyncClient, ids: list[int]
+    ) -> list[DeezerAlbum]:
+        tasks = [
+            asyncio.create_task(self._fetch_album_or_none(client, id)) for id in ids
+        ]
+        try:
+            albums = await asyncio.gather(*tasks)
+        except BaseException:
+            # The artist's albums are dropped as a whole, so don't keep
+            # spending requests on the ones still being fetched:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return [album for album in albums if album is not None]
+
+    async def _fetch_album_or_none(
+        self, client: httpx.AsyncClient, id: int
+    ) -> Optional[DeezerAlbum]:
+        try:
+            return await self.fetch_album_details(client, id)
+        # Sometimes album metadata is incomplete like missing image_url:
+        except pydantic.ValidationError:
+            return None
 
     async def fetch_album_details(
         self, client: httpx.AsyncClient, id: int
@@ -92,30 +216,41 @@ class DeezerAPI:
         # The Deezer album APIs only return the release date of the digital stream
         # not the actual physical release of the album. And the only way to get this
         # information is to access the 'album' field in the Track endpoint...
-        # Have to make an extra API call to the Track endpoint to get this info:
-        physical_release_date = await self._fetch_release_date(client, data)
+        # That costs an extra API call, so only pay it for albums that could
+        # actually end up in the review queue:
+        resolved = self.needs_release_date(data)
+        if resolved:
+            physical_release_date = await self.release_dates.resolve(client, data)
+        else:
+            # The physical release never comes after the digital one, so the
+            # digital date is an upper bound and the crawler's year filter
+            # disables these just the same. Stored as the release date but
+            # marked unresolved, it's looked up if the album is ever uploaded.
+            physical_release_date = parse_date(data["release_date"])
         return self.parse_album_details(
-            data, physical_release_date=physical_release_date
+            data,
+            physical_release_date=physical_release_date,
+            release_date_resolved=resolved,
         )
 
-    async def _fetch_release_date(
-        self, client: httpx.AsyncClient, album_raw_response: dict
-    ) -> date:
-        try:
-            raw_tracks = album_raw_response["tracks"]["data"]
-        except KeyError:
-            print(album_raw_response)
-            raise
-
-        for track in raw_tracks:
-            track_details = await self.fetch_track_details(client, track["id"])
-            try:
-                release_date = track_details["album"]["release_date"]
-            except KeyError:
-                continue
-            release_date = datetime.strptime(release_date, "%Y-%m-%d").date()
-            return release_date
-        raise ValueError("Can not find album release date from Deezer track details.")
+    async def fetch_release_date(self, client: httpx.AsyncClient, id: int) -> date:
+        """Looks up the physical release date of an album whose lookup was
+        skipped when it was crawled."""
+        url = f"{self.API_BASE_URL}/album/{id}"
+        response = await self.get(client, url)
+        return await self.release_dates.resolve(client, response.json())
+
+    @staticmethod
+    def needs_release_date(raw_data: dict) -> bool:
+        # Mirrors the cheap filters in DeezerCrawler: albums without genres
+        # get disabled, singles are never queued and anything digitally
+        # released before the minimum year can't have a later physical date.
+        if not raw_data.get("genres", {}).get("data"):
+            return False
+        if raw_data.get("record_type") == RecordType.Single.value:
+            return False
+        digital_release_date = parse_date(raw_data["release_date"])
+        return digital_release_date.year >= settings.DEEZER_MINIMUM_RELEASE_YEAR
 
     async def fetch_track_details(self, client: httpx.AsyncClient, id: int) -> dict:
         url = f"{self.API_BASE_URL}/track/{id}"
@@ -124,7 +259,10 @@ class DeezerAPI:
         return data
 
     def parse_album_details(
-        self, raw_data: dict, physical_release_date: date
+        self,
+        raw_data: dict,
+        physical_release_date: date,
+        release_date_resolved: bool = True,
     ) -> DeezerAlbum:
         genres = [genre["name"] for genre in raw_data["genres"]["data"]]
 
@@ -149,25 +287,114 @@ class DeezerAPI:
             role = contrib["role"]
             contributors[name] = role
 
+        title = raw_data["title"]
         album = DeezerAlbum(
             id=raw_data["id"],
             artist_id=raw_data["artist"]["id"],
-            title=raw_data["title"],
+            title=title,
             image_url=raw_data["cover_medium"],
-            digital_release_date=datetime.strptime(
-                raw_data["release_date"], "%Y-%m-%d"
-            ).date(),
+            digital_release_date=parse_date(raw_data["release_date"]),
             release_date=physical_release_date,
+            release_date_resolved=release_date_resolved,
             record_type=RecordType(raw_data["record_type"]),
             genres=genres,
             label=raw_data["label"],
             tracks=tracks,
             contributors=contributors,
             upc=raw_data["upc"],
+            folder_name=album_folder_name(
+                raw_data["artist"]["name"], title, physical_release_date
+            ),
         )
         return album
 
 
+class LRUCache(OrderedDict):
+    """dict that forgets its least recently used entries past ``maxsize``."""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class ReleaseDateResolver:
+    """Looks up physical release dates through the Deezer track endpoint.
+
+    Results are memoized by album id and UPC, and the album each fetched
+    track belongs to is remembered as well. Albums of the same artist share
+    tracks often enough (singles, EPs and the album they end up on) that many
+    lookups are answered without another request. The resolver lives as long
+    as its DeezerAPI, one crawl run for the crawler's, and each memo keeps
+    at most ``CACHE_SIZE`` entries.
+    """
+
+    CACHE_SIZE = 10_000
+
+    def __init__(self, api: DeezerAPI):
+        self.api = api
+        self.by_album: LRUCache = LRUCache(self.CACHE_SIZE)
+        self.by_upc: LRUCache = LRUCache(self.CACHE_SIZE)
+        # track id -> album release date from the track payloads seen so far
+        self.tracks: LRUCache = LRUCache(self.CACHE_SIZE)
+
+    async def resolve(
+        self, client: httpx.AsyncClient, album_raw_response: dict
+    ) -> date:
+        album_id = album_raw_response["id"]
+        upc = album_raw_response.get("upc")
+        if album_id in self.by_album:
+            return self.by_album[album_id]
+        if upc and upc in self.by_upc:
+            return self.by_upc[upc]
+
+        try:
+            raw_tracks = album_raw_response["tracks"]["data"]
+        except KeyError:
+            print(album_raw_response)
+            raise
+
+        # Tracks we already have payloads for are free, try them first:
+        track_ids = [track["id"] for track in raw_tracks]
+        track_ids.sort(key=lambda id: id not in self.tracks)
+
+        for track_id in track_ids:
+            if track_id not in self.tracks:
+                details = await self.api.fetch_track_details(client, track_id)
+                self._remember(track_id, details)
+            release_date = self.tracks[track_id]
+            if release_date is None:
+                continue
+            self.by_album[album_id] = release_date
+            if upc:
+                self.by_upc[upc] = release_date
+            return release_date
+        raise ValueError("Can not find album release date from Deezer track details.")
+
+    def _remember(self, track_id: int, track_details: dict):
+        album = track_details.get("album", {})
+        release_date = album.get("release_date")
+        if release_date is not None:
+            release_date = parse_date(release_date)
+            if "id" in album and album["id"] not in self.by_album:
+                self.by_album[album["id"]] = release_date
+        self.tracks[track_id] = release_date
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
 class GazelleAPI(abc.ABC):
     def __init__(self, api_url: str, apikey: str):
         self.api_url = api_url
@@ -246,50 +473,36 @@ TRACKER_APIS = {
 }
 
 
-def levenshtein_distance(str1: str, str2: str) -> int:
-    counter = {"+": 0, "-": 0}
-    distance = 0
-    for edit_code, *_ in difflib.ndiff(str1, str2):
-        if edit_code == " ":
-            distance += max(counter.values())
-            counter = {"+": 0, "-": 0}
-        else:
-            counter[edit_code] += 1
-    distance += max(counter.values())
-    return distance
-
-
-def closeness(str1: str, str2: str) -> float:
-    distance = levenshtein_distance(str1.lower(), str2.lower())
+class DownloadError(Exception):
+    pass
 
-    n = max(len(str1), len(str2))
 
-    return max(n - distance, 0) / n
+def login_deezer() -> Deezer:
+    deezer = Deezer()
+    if not deezer.login_via_arl(settings.DEEZER_ARL_COOKIE):
+        raise DownloadError("Could not log in to Deezer, is the ARL cookie valid?")
+    return deezer
 
 
-def download_album(deezer_id: int):
-    deezer = Deezer()
-    deezer.login_via_arl(settings.DEEZER_ARL_COOKIE)
+def download_album(deezer_id: int, deezer: Optional[Deezer] = None, listener=None):
+    if deezer is None:
+        deezer = login_deezer()
     album = generateAlbumItem(
         deezer,
         deezer_id,
         DEEMIX_SETTINGS["maxBitrate"],
     )
 
-    Downloader(deezer, album, DEEMIX_SETTINGS).start()
+    Downloader(deezer, album, DEEMIX_SETTINGS, listener).start()
+    if album.failed:
+        raise DownloadError(f"{album.failed} tracks of album {deezer_id} failed")
 
 
 class UploadManager:
-    def generate_torrent(
+    async def generate_torrent(
         self, download_path: str, tracker_code: TrackerCode
     ) -> torf.Torrent:
-        self.torrent = torf.Torrent(
-            path=download_path,
-            trackers=[settings.REDACTED_ANNOUNCE_URL],
-            private=True,
-            source=tracker_code.value,
-        )
-        self.torrent.generate()
+        self.torrent = await generate_torrent(download_path, tracker_code)
         return self.torrent
 
     async def process_upload(
@@ -310,17 +523,3 @@ class UploadManager:
             )
         return response
 
-    def add_to_qbittorrent(self, torrent_file: bytes):
-        client = qbittorrentapi.Client(
-            host=settings.QBITTORRENT_HOST,
-            port=settings.QBITTORRENT_PORT,
-            username=settings.QBITTORRENT_USERNAME,
-            password=settings.QBITTORRENT_PASSWORD,
-        )
-        client.auth_log_in()
-
-        client.torrents_add(
-            torrent_files=torrent_file,
-            category=settings.QBITTORRENT_CATEGORY,
-            tags=settings.QBITTORRENT_TAGS,
-        )
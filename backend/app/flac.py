@@ -0,0 +1,88 @@
+import os
+import mmap
+import hashlib
+import subprocess
+
+import numpy as np
+import soundfile
+
+
+# Frames decoded per chunk. 64k stereo frames are 256KB of 16-bit PCM, so
+# memory stays flat no matter how long the track is.
+CHUNK_FRAMES = 65536
+
+BITS_PER_SUBTYPE = {"PCM_S8": 8, "PCM_16": 16, "PCM_24": 24}
+
+
+def verify_flac(filepath: str) -> bool:
+    """Test decodes a file with the reference ``flac`` binary."""
+    result = subprocess.run(["flac", "-t", filepath], capture_output=True, text=True)
+    stderr = result.stderr.strip()
+    if stderr.endswith("ok"):
+        return True
+    return False
+
+
+def verify_native(filepath: str, expected_md5: str) -> bool:
+    """Decodes every frame in process and checks the result against the
+    MD5 signature stored in STREAMINFO, like ``flac -t`` does.
+
+    Decoding goes through libFLAC (bundled with libsndfile), which checks
+    each frame's CRC and reports lost sync or CRC mismatches as read errors.
+    The file is read through a memory map, one chunk of frames at a time.
+    """
+    with open(filepath, "rb") as f:
+        # An empty file can't be mapped, and has nothing to decode anyway:
+        if os.fstat(f.fileno()).st_size == 0:
+            print(f"Can not decode {filepath}: empty file")
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return verify_mapped(mapped, expected_md5, filepath)
+
+
+def verify_mapped(mapped: mmap.mmap, expected_md5: str, filepath: str) -> bool:
+    """Like verify_native, on a file that is already mapped. Lets a caller
+    that reads the file for other reasons decode from the same pages."""
+    mapped.seek(0)
+    try:
+        return md5_matches(mapped, expected_md5)
+    except (RuntimeError, ValueError) as exc:
+        # soundfile raises LibsndfileError (a RuntimeError) on decode errors
+        print(f"Can not decode {filepath}: {exc!r}")
+        return False
+
+
+def md5_matches(fileobj, expected_md5: str) -> bool:
+    with soundfile.SoundFile(fileobj) as sound:
+        if sound.format != "FLAC":
+            return False
+        bits = BITS_PER_SUBTYPE.get(sound.subtype)
+        if bits is None:
+            return False
+
+        md5 = hashlib.md5()
+        frames = 0
+        dtype = "int16" if bits <= 16 else "int32"
+        for block in sound.blocks(CHUNK_FRAMES, dtype=dtype, always_2d=True):
+            md5.update(pcm_bytes(block, bits))
+            frames += len(block)
+
+        # A truncated stream decodes "fine" up to where it ends:
+        if frames != sound.frames:
+            return False
+    return md5.hexdigest() == expected_md5
+
+
+def pcm_bytes(block: np.ndarray, bits: int) -> bytes:
+    """Packs decoded samples the way the FLAC MD5 signature is computed:
+    interleaved, signed, little endian, in the stream's own sample width.
+
+    libsndfile hands back samples scaled up to the full width of the
+    requested dtype, so they are shifted back down first."""
+    if bits == 16:
+        return block.astype("<i2", copy=False).tobytes()
+    if bits == 8:
+        return (block >> 8).astype("i1").tobytes()
+    # 24-bit: keep the low three bytes of each little endian int32
+    samples = (block >> 8).astype("<i4").reshape(-1)
+    return samples.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
@@ -0,0 +1,118 @@
+from datetime import datetime
+from typing import Optional
+
+from tortoise.expressions import F
+from tortoise.functions import Max
+from tortoise.transactions import in_transaction
+
+from app.metrics import CRAWL_IDS
+from app.models import Artist, CrawlCursor, CrawlFrontier, CrawlState
+from app.settings import settings
+
+
+class Frontier:
+    """Persistent record of which Deezer artist ids have been crawled.
+
+    Ids are handed out in contiguous ranges from a single cursor row. Every id
+    handed out gets a frontier row marked in-flight until the crawler reports
+    it as done (artist exists) or missing (Deezer error 800), so dead ids are
+    never probed twice and a crash only costs the ids that were in flight.
+    An id that has been handed out ``max_attempts`` times without ever
+    being marked is given up on and marked failed.
+    """
+
+    CURSOR_ID = 1
+
+    def __init__(self, max_attempts: Optional[int] = None):
+        self.max_attempts = max_attempts or settings.CRAWL_MAX_ATTEMPTS
+
+    async def recover(self) -> int:
+        # Anything still in flight was claimed by a crawl that never finished
+        # (crash, restart, exception in a batch). Put them back in line so
+        # they're handed out before any fresh ids, unless they already had
+        # all their attempts: an id that fails every time would otherwise be
+        # retried by every crawl forever.
+        async with in_transaction():
+            failed: list[int] = await CrawlFrontier.filter(
+                state=CrawlState.InFlight, attempts__gte=self.max_attempts
+            ).values_list("id", flat=True)  # type: ignore
+            if failed:
+                await CrawlFrontier.filter(id__in=failed).update(
+                    state=CrawlState.Failed
+                )
+            count = await CrawlFrontier.filter(state=CrawlState.InFlight).update(
+                state=CrawlState.Pending
+            )
+        if failed:
+            CRAWL_IDS.labels("failed").inc(len(failed))
+            print(
+                f"Gave up on {len(failed)} artist ids after {self.max_attempts} "
+                f"attempts: {failed}"
+            )
+        if count:
+            print(f"Recovered {count} in-flight artist ids")
+        return count
+
+    async def claim(self, size: int) -> list[int]:
+        now = datetime.now()
+        async with in_transaction():
+            ids: list[int] = await (
+                CrawlFrontier.filter(state=CrawlState.Pending)
+                .order_by("id")
+                .limit(size)
+                .values_list("id", flat=True)
+            )  # type: ignore
+            if ids:
+                await CrawlFrontier.filter(id__in=ids).update(
+                    state=CrawlState.InFlight,
+                    attempts=F("attempts") + 1,
+                    last_attempt=now,
+                )
+
+            remaining = size - len(ids)
+            if remaining > 0:
+                cursor = await self._get_cursor()
+                start = cursor.next_id
+                cursor.next_id = start + remaining
+                await cursor.save()
+
+                fresh = list(range(start, cursor.next_id))
+                await CrawlFrontier.bulk_create(
+                    [
+                        CrawlFrontier(
+                            id=id,
+                            state=CrawlState.InFlight,
+                            attempts=1,
+                            last_attempt=now,
+                        )
+                        for id in fresh
+                    ]
+                )
+                ids.extend(fresh)
+
+        return ids
+
+    async def mark(self, ids: list[int], state: CrawlState):
+        if ids:
+            await CrawlFrontier.filter(id__in=ids).update(state=state)
+
+    async def _get_cursor(self) -> CrawlCursor:
+        cursor = await CrawlCursor.get_or_none(id=self.CURSOR_ID)
+        if cursor is not None:
+            return cursor
+
+        # First run against this database. Databases crawled before the
+        # frontier existed already have artists in them, so pick up after the
+        # highest one instead of starting over.
+        max_id: int = (
+            await Artist.all()
+            .annotate(start_id=Max("id"))
+            .first()
+            .values_list("start_id", flat=True)
+        )  # type: ignore
+        if max_id is None:
+            next_id = settings.DEEZER_ARTIST_START_ID
+        else:
+            next_id = max_id + 1
+        print(f"Start point {next_id}")
+        return await CrawlCursor.create(id=self.CURSOR_ID, next_id=next_id)
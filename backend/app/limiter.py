@@ -0,0 +1,124 @@
+import time
+import asyncio
+import collections
+
+from app.metrics import LIMITER_RATE, LIMITER_THROTTLES, LIMITER_WAIT_SECONDS
+from app.settings import settings
+
+
+class AdaptiveLimiter:
+    """Token bucket rate limiter that backs off when the server pushes back.
+
+    Tokens refill at ``rate`` per second up to ``burst``. On top of the
+    bucket, at most ``burst`` requests are let through in any ``period``
+    seconds, which is exactly how Deezer words its quota (50 calls per 5
+    seconds), so a full bucket can be spent at once without going over.
+
+    The refill rate follows AIMD: every successful request adds
+    ``increase`` requests/second back (up to the configured rate) and every
+    throttle event halves it. Throttles that arrive within one ``period`` of
+    the last are treated as the same event, since requests that were
+    already in flight will all come back throttled together.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        period: float,
+        min_rate: float = 0.5,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        name: str = "Deezer",
+    ):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.period = period
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.window: collections.deque[float] = collections.deque(maxlen=burst)
+        self.last_throttle = float("-inf")
+        # asyncio.Lock wakes waiters in FIFO order, so requests go out in the
+        # order they asked:
+        self._lock = asyncio.Lock()
+
+        self.requests = 0
+        self.throttle_events = 0
+        self.total_wait = 0.0
+        LIMITER_RATE.labels(name).set_function(lambda: self.rate)
+
+    async def wait(self):
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                delay = self._delay()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+
+            now = time.monotonic()
+            self.tokens -= 1
+            self.window.append(now)
+            self.requests += 1
+            self.total_wait += now - started
+        LIMITER_WAIT_SECONDS.labels(self.name).observe(now - started)
+
+    def success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttle(self):
+        now = time.monotonic()
+        if now - self.last_throttle < self.period:
+            return
+        self.last_throttle = now
+        self.throttle_events += 1
+        LIMITER_THROTTLES.labels(self.name).inc()
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        # Whatever burst was saved up is what got us throttled:
+        self.tokens = 0
+        self.updated = now
+        print(f"{self.name} throttled us, slowing down to {self.rate:.2f} req/s")
+
+    def info(self) -> dict:
+        return {
+            "rate": self.rate,
+            "max_rate": self.max_rate,
+            "burst": self.burst,
+            "period": self.period,
+            "tokens": self.tokens,
+            "requests": self.requests,
+            "throttle_events": self.throttle_events,
+            "total_wait_seconds": self.total_wait,
+        }
+
+    def _delay(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        delay = 0.0
+        if self.tokens < 1:
+            delay = (1 - self.tokens) / self.rate
+        if len(self.window) == self.burst:
+            delay = max(delay, self.window[0] + self.period - now)
+        return delay
+
+
+deezer_limiter = AdaptiveLimiter(
+    rate=settings.DEEZER_API_RATE_LIMIT,
+    burst=settings.DEEZER_API_BURST,
+    period=settings.DEEZER_API_BURST_PERIOD,
+)
+
+tracker_limiter = AdaptiveLimiter(
+    rate=settings.TRACKER_API_BURST / settings.TRACKER_API_BURST_PERIOD,
+    burst=settings.TRACKER_API_BURST,
+    period=settings.TRACKER_API_BURST_PERIOD,
+    name="Tracker",
+)
@@ -0,0 +1,264 @@
+import re
+import unicodedata
+import collections
+
+from typing import Optional
+
+import numpy as np
+
+
+# Titles less close than this are not considered the same release:
+MIN_SCORE = 0.7
+
+TRIGRAM = 3
+# Never equal to a character's code point, pads candidates to equal length:
+PADDING = -1
+
+
+def normalize(title: str) -> str:
+    """Case, accents and punctuation don't make two titles different
+    releases: "Beyoncé - B'Day" and "beyonce b day" normalize the same."""
+    title = unicodedata.normalize("NFKD", title.casefold())
+    title = "".join(char for char in title if not unicodedata.combining(char))
+    return re.sub(r"[\W_]+", " ", title).strip()
+
+
+def levenshtein_distance(str1: str, str2: str, cutoff: Optional[int] = None) -> int:
+    """Edit distance between two strings, O(len(str1) * len(str2)) with two
+    rows of memory.
+
+    With a ``cutoff``, gives up as soon as the distance is known to be
+    larger and returns ``cutoff + 1``."""
+    if len(str1) < len(str2):
+        str1, str2 = str2, str1
+    if cutoff is not None and len(str1) - len(str2) > cutoff:
+        return cutoff + 1
+
+    previous = list(range(len(str2) + 1))
+    for i, char1 in enumerate(str1, 1):
+        current = [i]
+        for j, char2 in enumerate(str2, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char1 != char2),
+                )
+            )
+        # Distances never decrease from one row to the next:
+        if cutoff is not None and min(current) > cutoff:
+            return cutoff + 1
+        previous = current
+    if cutoff is not None:
+        return min(previous[-1], cutoff + 1)
+    return previous[-1]
+
+
+def closeness(str1: str, str2: str) -> float:
+    n = max(len(str1), len(str2))
+    if n == 0:
+        return 1.0
+    distance = levenshtein_distance(str1.lower(), str2.lower())
+    return max(n - distance, 0) / n
+
+
+def trigrams(text: str) -> collections.Counter:
+    padded = f"  {text} "
+    return collections.Counter(
+        padded[i : i + TRIGRAM] for i in range(len(padded) - TRIGRAM + 1)
+    )
+
+
+class Matcher:
+    """Finds the closest of many candidate titles for each query title.
+
+    Titles are normalized first. For a query, candidates are narrowed down
+    with a trigram index: a string within edit distance ``d`` of another
+    shares at least ``max(#trigrams) - 3 * d`` trigrams with it (the q-gram
+    lemma), so anything sharing fewer can't reach ``min_score`` and is
+    skipped without computing a distance. The remaining distances are
+    computed for all candidates at once with numpy, one row of the edit
+    distance table per query character.
+    """
+
+    def __init__(self, candidates: list[str], min_score: float = MIN_SCORE):
+        self.min_score = min_score
+        self.titles = [normalize(title) for title in candidates]
+        self.codes, self.lengths = encode(self.titles)
+
+        # Character histograms: each edit changes at most one character in
+        # or out, so the histogram difference is a lower bound of the edit
+        # distance that is cheap to take against all candidates at once.
+        self.alphabet = {
+            char: column
+            for column, char in enumerate(sorted(set("".join(self.titles))))
+        }
+        self.histograms = np.zeros(
+            (len(self.titles), len(self.alphabet) + 1), dtype=np.int32
+        )
+        for row, title in enumerate(self.titles):
+            self.histograms[row] = self.histogram(title)
+
+        self.exact: dict[str, int] = {}
+        self.index: dict[str, list[tuple[int, int]]] = collections.defaultdict(list)
+        self.trigram_counts = np.zeros(len(self.titles), dtype=np.int32)
+        for row, title in enumerate(self.titles):
+            self.exact.setdefault(title, row)
+            counts = trigrams(title)
+            self.trigram_counts[row] = sum(counts.values())
+            for trigram, count in counts.items():
+                self.index[trigram].append((row, count))
+
+    def __len__(self):
+        return len(self.titles)
+
+    def histogram(self, text: str) -> np.ndarray:
+        # Characters no candidate has share the last column
+        other = len(self.alphabet)
+        columns = [self.alphabet.get(char, other) for char in text]
+        return np.bincount(columns, minlength=other + 1).astype(np.int32)
+
+    def prefilter(self, query: str) -> np.ndarray:
+        """Rows of the candidates that may be within ``min_score`` of
+        ``query``: close enough in length, characters and trigrams."""
+        longest = np.maximum(self.lengths, len(query))
+        allowed = (longest * (1 - self.min_score)).astype(np.int32)
+        rows = np.flatnonzero(np.abs(self.lengths - len(query)) <= allowed)
+
+        difference = self.histograms[rows] - self.histogram(query)
+        lower_bound = np.maximum(
+            np.clip(difference, 0, None).sum(axis=1),
+            np.clip(-difference, 0, None).sum(axis=1),
+        )
+        rows = rows[lower_bound <= allowed[rows]]
+
+        counts = trigrams(query)
+        shared = np.zeros(len(self.titles), dtype=np.int32)
+        for trigram, count in counts.items():
+            for row, candidate_count in self.index.get(trigram, ()):
+                shared[row] += min(count, candidate_count)
+        most = np.maximum(self.trigram_counts[rows], sum(counts.values()))
+        return rows[shared[rows] >= most - TRIGRAM * allowed[rows]]
+
+    def scores(self, query: str) -> np.ndarray:
+        """Closeness of ``query`` to every candidate. Candidates that can't
+        reach ``min_score`` score 0."""
+        query = normalize(query)
+        scores = np.zeros(len(self.titles))
+        rows = self.prefilter(query)
+        scores[rows] = self.score_pairs([query], np.zeros_like(rows), rows)
+        return scores
+
+    def best(self, query: str) -> tuple[Optional[int], float]:
+        """Index and score of the closest candidate, ``(None, 0.0)`` when
+        none reaches ``min_score``."""
+        return self.best_matches([query])[0]
+
+    def best_matches(self, queries: list[str]) -> list[tuple[Optional[int], float]]:
+        """best() for many queries, with the distances of every query and
+        candidate pair that passes the prefilter computed in one batch."""
+        queries = [normalize(query) for query in queries]
+        matches: list[tuple[Optional[int], float]] = [(None, 0.0)] * len(queries)
+        pair_queries, pair_rows = [], []
+        for position, query in enumerate(queries):
+            exact = self.exact.get(query)
+            if exact is not None:
+                matches[position] = (exact, 1.0)
+                continue
+            rows = self.prefilter(query)
+            pair_queries.append(np.full(len(rows), position))
+            pair_rows.append(rows)
+        if not pair_queries:
+            return matches
+
+        pair_query = np.concatenate(pair_queries)
+        pair_row = np.concatenate(pair_rows)
+        scores = self.score_pairs(queries, pair_query, pair_row)
+        # Best pair of each query: sort by query, then by descending score
+        order = np.lexsort((-scores, pair_query))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_query[order][1:] != pair_query[order][:-1]
+        for pair in order[first]:
+            if scores[pair] > 0:
+                matches[pair_query[pair]] = (int(pair_row[pair]), float(scores[pair]))
+        return matches
+
+    def score_pairs(
+        self, queries: list[str], pair_query: np.ndarray, pair_row: np.ndarray
+    ) -> np.ndarray:
+        if len(pair_row) == 0:
+            return np.zeros(0)
+        codes, lengths = encode(queries)
+        query_lengths = lengths[pair_query]
+        row_lengths = self.lengths[pair_row]
+        longest = np.maximum(query_lengths, row_lengths)
+        cutoffs = (longest * (1 - self.min_score)).astype(np.int32)
+
+        distances = pairwise_levenshtein(
+            codes[pair_query],
+            query_lengths,
+            self.codes[pair_row, : row_lengths.max()],
+            row_lengths,
+            cutoffs,
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            close = np.where(longest > 0, (longest - distances) / longest, 1.0)
+        return np.where(close >= self.min_score, close, 0.0)
+
+
+def encode(titles: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Code points of ``titles`` as rows of one array, padded with PADDING,
+    and the length of each."""
+    lengths = np.array([len(title) for title in titles], dtype=np.int32)
+    codes = np.full((len(titles), max(lengths, default=0)), PADDING, dtype=np.int32)
+    for row, title in enumerate(titles):
+        codes[row, : len(title)] = [ord(char) for char in title]
+    return codes, lengths
+
+
+def pairwise_levenshtein(
+    left: np.ndarray,
+    left_lengths: np.ndarray,
+    right: np.ndarray,
+    right_lengths: np.ndarray,
+    cutoffs: np.ndarray,
+) -> np.ndarray:
+    """Edit distances between each row of ``left`` and the same row of
+    ``right`` (as returned by encode), all pairs computed at once.
+
+    Step i computes row i of every pair's table. The insertions along a row
+    are a running minimum: row[j] is the smallest ``partial[k] + (j - k)``
+    for k <= j, i.e. ``j + cummin(partial - k)``. A pair leaves the batch
+    when its left string is exhausted, or once its whole row is over its
+    cutoff, in which case its distance is reported as ``cutoff + 1``.
+    """
+    count, width = right.shape
+    distances = cutoffs + 1
+    columns = np.arange(width + 1, dtype=np.int32)
+
+    # Empty left strings: the distance is the length of the right one
+    alive = np.flatnonzero(left_lengths > 0)
+    done = left_lengths == 0
+    distances[done] = np.minimum(right_lengths[done], cutoffs[done] + 1)
+
+    row = np.tile(columns, (len(alive), 1))
+    for i in range(1, left.shape[1] + 1):
+        if len(alive) == 0:
+            break
+        cost = (right[alive] != left[alive, i - 1, None]).astype(np.int32)
+        partial = np.empty_like(row)
+        partial[:, 0] = i
+        partial[:, 1:] = np.minimum(row[:, 1:] + 1, row[:, :-1] + cost)
+        row = columns + np.minimum.accumulate(partial - columns, axis=1)
+
+        ends = right_lengths[alive]
+        finished = left_lengths[alive] == i
+        final = row[finished, ends[finished]]
+        distances[alive[finished]] = np.minimum(final, cutoffs[alive[finished]] + 1)
+
+        # Only the columns up to each right string's length count:
+        in_range = columns <= ends[:, None]
+        smallest = np.where(in_range, row, np.iinfo(np.int32).max).min(axis=1)
+        keep = ~finished & (smallest <= cutoffs[alive])
+        alive, row = alive[keep], row[keep]
+    return distances
@@ -0,0 +1,106 @@
+import re
+
+from typing import Iterable
+
+from prometheus_client import Counter, Gauge, Histogram
+from tortoise.functions import Count
+
+from app.models import Album, TrackingStatus
+
+
+# Served at /metrics. Everything here is in process memory and starts over
+# with the app, except the album gauges which are loaded from the database
+# once at startup (see load_album_statuses).
+
+DEEZER_REQUESTS = Counter(
+    "deezer_requests",
+    "Deezer API requests by endpoint and outcome: ok, throttled, cached "
+    "(answered from the response cache) or not_modified (revalidated)",
+    ["endpoint", "outcome"],
+)
+DEEZER_REQUEST_SECONDS = Histogram(
+    "deezer_request_seconds",
+    "Time from sending a Deezer API request to its response",
+    ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+LIMITER_WAIT_SECONDS = Histogram(
+    "limiter_wait_seconds",
+    "Time requests spent waiting on a rate limiter",
+    ["limiter"],
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+LIMITER_THROTTLES = Counter(
+    "limiter_throttles",
+    "Times a limiter backed off because the server pushed back",
+    ["limiter"],
+)
+LIMITER_RATE = Gauge(
+    "limiter_rate",
+    "Current refill rate of a limiter, in requests per second",
+    ["limiter"],
+)
+
+CRAWL_IDS = Counter(
+    "crawl_ids",
+    "Artist ids crawled, by result: found, missing, known (stored by an "
+    "earlier crawl), error or failed (given up on after too many errors)",
+    ["result"],
+)
+RECRAWL_ARTISTS = Counter(
+    "recrawl_artists",
+    "Known artists checked for new releases, by result: ok or failed",
+    ["result"],
+)
+CRAWL_RUN_SECONDS = Histogram(
+    "crawl_run_seconds",
+    "Duration of a crawl run",
+    buckets=(1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds",
+    "Time spent in the crawler's database operations",
+    ["operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+ALBUM_STAGE_SECONDS = Histogram(
+    "album_stage_seconds",
+    "Time to process one album, by stage: download, verify, hash, "
+    "verify_and_hash and upload",
+    ["stage"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+ALBUMS = Gauge("albums", "Albums by tracking status", ["status"])
+
+
+# Ids in Deezer URLs would make a label value per artist:
+ID_SEGMENT = re.compile(r"/\d+")
+
+
+def deezer_endpoint(url: str) -> str:
+    """``https://api.deezer.com/artist/27/albums`` -> ``/artist/{id}/albums``"""
+    path = url.split("://", 1)[-1].partition("/")[2]
+    return ID_SEGMENT.sub("/{id}", "/" + path.partition("?")[0])
+
+
+def count_new_albums(statuses: Iterable[TrackingStatus]):
+    for status in statuses:
+        ALBUMS.labels(status.value).inc()
+
+
+async def load_album_statuses():
+    # The one time albums are counted, on startup:
+    rows = await (
+        Album.annotate(count=Count("id"))
+        .group_by("status")
+        .values_list("status", "count")
+    )
+    counts = dict.fromkeys(TrackingStatus, 0)
+    for status, count in rows:
+        counts[TrackingStatus(status)] = count
+    for status, count in counts.items():
+        ALBUMS.labels(status.value).set(count)
@@ -0,0 +1,142 @@
+from datetime import date, datetime
+from typing import Awaitable, Callable, Union
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from .models import album_folder_name, artist_check_interval
+
+
+Step = Union[str, Callable[[BaseDBAsyncClient], Awaitable[None]]]
+
+
+async def backfill_album_folder_names(conn: BaseDBAsyncClient):
+    rows = await conn.execute_query_dict(
+        'SELECT "album"."id", "album"."title", "album"."release_date", '
+        '"artist"."name" FROM "album" '
+        'JOIN "artist" ON "artist"."id" = "album"."artist_id"'
+    )
+    values = []
+    for row in rows:
+        release_date = row["release_date"]
+        if isinstance(release_date, str):
+            release_date = date.fromisoformat(release_date)
+        folder_name = album_folder_name(row["name"], row["title"], release_date)
+        values.append([folder_name, row["id"]])
+    await conn.execute_many(
+        'UPDATE "album" SET "folder_name" = ? WHERE "id" = ?', values
+    )
+
+
+async def backfill_artist_next_checks(conn: BaseDBAsyncClient):
+    # Artists crawled before re-checking existed come due one interval after
+    # they were crawled, most of them right away, popular ones first.
+    rows = await conn.execute_query_dict(
+        'SELECT "artist"."id", "artist"."nb_fan", "artist"."create_date", '
+        'MAX("album"."release_date") AS "latest_release" FROM "artist" '
+        'LEFT JOIN "album" ON "album"."artist_id" = "artist"."id" '
+        'GROUP BY "artist"."id"'
+    )
+    values = []
+    for row in rows:
+        create_date = row["create_date"]
+        if isinstance(create_date, str):
+            create_date = datetime.fromisoformat(create_date)
+        latest_release = row["latest_release"]
+        if isinstance(latest_release, str):
+            latest_release = date.fromisoformat(latest_release)
+        next_check = create_date + artist_check_interval(
+            row["nb_fan"], latest_release
+        )
+        # The format Tortoise writes datetimes in:
+        values.append([next_check.isoformat(" "), row["id"]])
+    await conn.execute_many(
+        'UPDATE "artist" SET "next_check" = ? WHERE "id" = ?', values
+    )
+
+
+# Tortoise's generate_schemas only creates missing tables and indexes, it
+# never alters an existing table. Changes to tables that already hold data
+# go here as (name, steps) pairs and are applied once, in order, before the
+# schema is generated. A step is either a SQL statement or a coroutine
+# function taking the connection. A brand new database gets the current
+# schema from generate_schemas directly, so every migration is just
+# recorded as applied.
+#
+# A migration's steps and its schema_migration row are committed together:
+# each SQL step is a single statement run with execute_query, because
+# execute_script (sqlite3's executescript) commits on its own. The steps
+# are written for SQLite, the only database this app runs on: "?"
+# placeholders, 0/1 booleans and SQLite's ALTER TABLE.
+MIGRATIONS: list[tuple[str, list[Step]]] = [
+    (
+        "0001_album_eligible",
+        [
+            'ALTER TABLE "album" ADD COLUMN "eligible" INT NOT NULL DEFAULT 1',
+            'UPDATE "album" SET "eligible" = 0 WHERE "record_type" = \'single\' '
+            'OR "artist_id" IN (SELECT "id" FROM "artist" WHERE "disabled" = 1)',
+        ],
+    ),
+    (
+        "0002_album_folder_name",
+        [
+            'ALTER TABLE "album" ADD COLUMN "folder_name" TEXT NOT NULL DEFAULT \'\'',
+            backfill_album_folder_names,
+        ],
+    ),
+    (
+        "0003_artist_checks",
+        [
+            'ALTER TABLE "artist" ADD COLUMN "last_checked" TIMESTAMP',
+            'ALTER TABLE "artist" ADD COLUMN "next_check" TIMESTAMP',
+            backfill_artist_next_checks,
+        ],
+    ),
+    (
+        "0004_album_release_date_resolved",
+        [
+            # Albums crawled until now all had their release date looked up:
+            'ALTER TABLE "album" ADD COLUMN "release_date_resolved" INT NOT NULL '
+            "DEFAULT 1",
+        ],
+    ),
+]
+
+
+async def table_exists(conn: BaseDBAsyncClient, table: str) -> bool:
+    try:
+        await conn.execute_query(f'SELECT 1 FROM "{table}" LIMIT 1')
+    except Exception:
+        return False
+    return True
+
+
+async def migrate():
+    conn = Tortoise.get_connection("default")
+    await conn.execute_script(
+        'CREATE TABLE IF NOT EXISTS "schema_migration" '
+        '("name" VARCHAR(255) PRIMARY KEY, "applied_date" TIMESTAMP NOT NULL)'
+    )
+    rows = await conn.execute_query_dict('SELECT "name" FROM "schema_migration"')
+    applied = {row["name"] for row in rows}
+    fresh = not await table_exists(conn, "album")
+
+    for name, steps in MIGRATIONS:
+        if name in applied:
+            continue
+        async with in_transaction() as transaction:
+            if not fresh:
+                print(f"Applying migration {name}")
+                for step in steps:
+                    if isinstance(step, str):
+                        await transaction.execute_query(step)
+                    else:
+                        await step(transaction)
+            await transaction.execute_query(
+                'INSERT INTO "schema_migration" ("name", "applied_date") '
+                "VALUES (?, ?)",
+                [name, datetime.now().isoformat()],
+            )
+
+    await Tortoise.generate_schemas(safe=True)
@@ -1,7 +1,10 @@
 import os
 import enum
+import math
+import random
 
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from typing import Optional
 
 from tortoise import fields
 from tortoise.models import Model
@@ -31,6 +34,22 @@ class TrackingStatus(enum.Enum):
     Disabled = "disabled"
 
 
+class DownloadState(enum.Enum):
+    Queued = "queued"
+    Running = "running"
+    Done = "done"
+    Failed = "failed"
+
+
+class CrawlState(enum.Enum):
+    Pending = "pending"
+    InFlight = "in_flight"
+    Missing = "missing"
+    Done = "done"
+    # Handed out CRAWL_MAX_ATTEMPTS times without ever being marked:
+    Failed = "failed"
+
+
 class Artist(Model):
     id = fields.IntField(pk=True)
     name = fields.TextField()
@@ -39,6 +58,27 @@ class Artist(Model):
     nb_fan = fields.IntField()
     disabled = fields.BooleanField(default=False)
     create_date = fields.DatetimeField(default=datetime.now)
+    # When the album listing was last checked for new releases, and when it
+    # is due again (see app/recrawl.py):
+    last_checked = fields.DatetimeField(null=True)
+    next_check = fields.DatetimeField(null=True, index=True)
+
+
+def artist_check_interval(
+    nb_fan: int, latest_release: Optional[date], found_new: bool = False
+) -> timedelta:
+    """How long until an artist's albums are checked again. Every factor of
+    ten in fans halves the wait, and so do a release in the last year and
+    having just found new albums. Jittered so that artists crawled together
+    don't all come due together."""
+    fans = max(nb_fan, 0)
+    days = settings.RECRAWL_MAX_INTERVAL_DAYS / 2 ** math.log10(1 + fans)
+    if latest_release is not None and (date.today() - latest_release).days < 365:
+        days /= 2
+    if found_new:
+        days /= 2
+    days = max(days, settings.RECRAWL_MIN_INTERVAL_DAYS)
+    return timedelta(days=days * random.uniform(0.9, 1.1))
 
 
 class Album(Model):
@@ -51,6 +91,10 @@ class Album(Model):
     image_url = fields.TextField()
     digital_release_date = fields.DateField()
     release_date = fields.DateField()
+    # False when release_date is the digital release date standing in for
+    # a physical one that was never looked up (see
+    # DeezerAPI.needs_release_date). It's looked up before uploading.
+    release_date_resolved = fields.BooleanField(default=True)
     create_date = fields.DatetimeField(default=datetime.now)
     record_type = fields.CharEnumField(RecordType)
     status = fields.CharEnumField(TrackingStatus, default=TrackingStatus.Added)
@@ -59,6 +103,20 @@ class Album(Model):
     tracks = fields.JSONField()
     contributors = fields.JSONField()
     upc = fields.TextField()
+    # Denormalized "can show up in the review queue": not a single and the
+    # artist isn't disabled. Kept up to date by the crawler and
+    # disable_artist so the queue queries don't have to join artist.
+    eligible = fields.BooleanField(default=True)
+    # Name of the folder deemix downloads this album into, computed once
+    # with album_folder_name when the album is crawled:
+    folder_name = fields.TextField()
+
+    class Meta:
+        indexes = (
+            ("status", "release_date"),
+            ("eligible", "status", "release_date"),
+            ("artist_id",),
+        )
 
     @property
     def album_url(self) -> str:
@@ -66,20 +124,21 @@ class Album(Model):
 
     @property
     def download_path(self) -> str:
-        # Reproduced and modified from the deemix-py source code:
-        # https://gitlab.com/RemixDev/deemix-py/-/blob/main/deemix/utils/pathtemplates.py#L65
-        foldername = DEEMIX_SETTINGS["albumNameTemplate"]
-        substitutions = [
-            ("%artist%", self.artist.name),
-            ("%album%", self.title),
-            ("%year%", str(self.release_date.year)),
-        ]
-        for template, value in substitutions:
-            foldername = foldername.replace(template, value)
-
-        return os.path.join(
-            settings.DOWNLOAD_FOLDER, deemix_normalize_path(foldername), ""
-        )
+        return os.path.join(settings.DOWNLOAD_FOLDER, self.folder_name, "")
+
+
+def album_folder_name(artist_name: str, title: str, release_date: date) -> str:
+    # Reproduced and modified from the deemix-py source code:
+    # https://gitlab.com/RemixDev/deemix-py/-/blob/main/deemix/utils/pathtemplates.py#L65
+    foldername = DEEMIX_SETTINGS["albumNameTemplate"]
+    substitutions = [
+        ("%artist%", artist_name),
+        ("%album%", title),
+        ("%year%", str(release_date.year)),
+    ]
+    for template, value in substitutions:
+        foldername = foldername.replace(template, value)
+    return deemix_normalize_path(foldername)
 
 
 class Upload(Model):
@@ -95,3 +154,61 @@ class Upload(Model):
     infohash = fields.CharField(max_length=40, unique=True)
     upload_parameters = fields.JSONField()
     file = fields.BinaryField()
+
+
+class CrawlFrontier(Model):
+    # One row per Deezer artist id the crawler has handed out. The id is the
+    # Deezer artist id itself, so looking up or updating an id is a pk access.
+    id = fields.IntField(pk=True)
+    state = fields.CharEnumField(CrawlState, default=CrawlState.Pending, index=True)
+    attempts = fields.IntField(default=0)
+    last_attempt = fields.DatetimeField(null=True)
+
+
+class CrawlCursor(Model):
+    # Single row table holding the next never-handed-out artist id. Claiming a
+    # fresh range is a read and an increment of this row rather than a
+    # MAX(id) scan over the artist table.
+    id = fields.IntField(pk=True)
+    next_id = fields.IntField()
+
+
+class ReviewQueueSize(Model):
+    # Single row table counting the albums in the review queue (added and
+    # eligible). Updated in the same transactions that change those albums,
+    # so the queue size is a pk lookup rather than a COUNT, and reconciled
+    # with a full count now and then (see app/review_queue.py).
+    id = fields.IntField(pk=True)
+    size = fields.IntField()
+
+
+class TrackVerification(Model):
+    # Result of verifying one downloaded file. Only valid for as long as the
+    # file's size, mtime and inode still match what was verified.
+    filepath = fields.CharField(max_length=1024, pk=True)
+    size = fields.BigIntField()
+    mtime_ns = fields.BigIntField()
+    inode = fields.BigIntField()
+    backend = fields.CharField(max_length=16)
+    # ParsedAudioFile fields, null when the tags couldn't be parsed:
+    parsed = fields.JSONField(null=True)
+    contents_ok = fields.BooleanField()
+    verify_date = fields.DatetimeField(default=datetime.now)
+
+
+class DownloadJob(Model):
+    id = fields.IntField(pk=True, generated=True)
+    album = fields.ForeignKeyField(
+        "models.Album",
+        related_name="download_jobs",
+    )
+    state = fields.CharEnumField(
+        DownloadState, default=DownloadState.Queued, index=True
+    )
+    attempts = fields.IntField(default=0)
+    # Percent, only written when a job stops running. Live progress of a
+    # running job is kept in memory by the DownloadManager.
+    progress = fields.IntField(default=0)
+    error = fields.TextField(null=True)
+    create_date = fields.DatetimeField(default=datetime.now)
+    update_date = fields.DatetimeField(default=datetime.now)
@@ -0,0 +1,142 @@
+import time
+import json
+import base64
+
+from datetime import date
+from typing import Any, Callable, Generic, Optional, Sequence, TypeVar
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel
+from pydantic.generics import GenericModel
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+
+
+T = TypeVar("T")
+
+# (field name, function that turns the JSON value back into the field type)
+Key = tuple[str, Callable[[Any], Any]]
+
+ALBUM_KEYS: Sequence[Key] = (("release_date", date.fromisoformat), ("id", int))
+ARTIST_KEYS: Sequence[Key] = (("id", int),)
+
+# Counting a large table is exactly what keyset pagination avoids, so the
+# total is only computed on request and then reused for a while:
+APPROXIMATE_TOTAL_TTL = 60
+_approximate_totals: dict[str, tuple[float, int]] = {}
+
+
+class CursorParams(BaseModel):
+    cursor: Optional[str] = Query(None, description="Opaque page cursor")
+    size: int = Query(50, ge=1, le=100, description="Page size")
+    include_total: bool = Query(False, description="Include an approximate total")
+
+
+class CursorPage(GenericModel, Generic[T]):
+    items: list[T]
+    size: int
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    approximate_total: Optional[int] = None
+
+
+def encode_cursor(values: list, direction: str) -> str:
+    payload = json.dumps({"k": values, "d": direction}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, keys: Sequence[Key]) -> tuple[list, str]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values = [parse(value) for (_, parse), value in zip(keys, payload["k"])]
+        direction = payload["d"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if len(values) != len(keys) or direction not in ("next", "prev"):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values, direction
+
+
+def seek(keys: Sequence[Key], values: list, lookup: str) -> Q:
+    # Lexicographic comparison of the key tuple against the cursor, e.g. for
+    # (release_date, id) going forward:
+    #   release_date < d OR (release_date = d AND id < i)
+    clauses = []
+    for i, (name, _) in enumerate(keys):
+        equal = {keys[j][0]: values[j] for j in range(i)}
+        clauses.append(Q(**equal, **{f"{name}__{lookup}": values[i]}))
+    return Q(*clauses, join_type="OR")
+
+
+async def approximate_total(query: QuerySet, cache_key: str) -> int:
+    now = time.monotonic()
+    cached = _approximate_totals.get(cache_key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    total = await query.count()
+    _approximate_totals[cache_key] = (now + APPROXIMATE_TOTAL_TTL, total)
+    return total
+
+
+async def keyset_paginate(
+    query: QuerySet,
+    params: CursorParams,
+    keys: Sequence[Key],
+    cache_key: str,
+    fetch: Optional[Callable] = None,
+) -> dict:
+    """Pages through ``query`` newest first on ``keys`` without OFFSET or
+    COUNT. The cost of a page doesn't depend on how deep it is, as long as
+    an index covers the filter and the keys.
+
+    ``fetch`` runs the final (filtered, ordered, limited) queryset and
+    returns the items; by default the queryset is simply awaited. Returns
+    the fields of a ``CursorPage``.
+    """
+    page = query
+    direction = "next"
+    if params.cursor is not None:
+        values, direction = decode_cursor(params.cursor, keys)
+        page = page.filter(seek(keys, values, "lt" if direction == "next" else "gt"))
+
+    # Going backwards walks the keys ascending from the cursor and flips the
+    # result, so both directions read only size + 1 rows.
+    prefix = "-" if direction == "next" else ""
+    page = page.order_by(*(f"{prefix}{name}" for name, _ in keys))
+    page = page.limit(params.size + 1)
+    items = list(await (fetch(page) if fetch is not None else page))
+
+    has_more = len(items) > params.size
+    items = items[: params.size]
+    if direction == "prev":
+        items.reverse()
+
+    def cursor_for(item, direction: str) -> str:
+        return encode_cursor([key_value(item, name) for name, _ in keys], direction)
+
+    next_cursor = prev_cursor = None
+    if items:
+        if direction == "prev" or has_more:
+            next_cursor = cursor_for(items[-1], "next")
+        if (direction == "next" and params.cursor is not None) or (
+            direction == "prev" and has_more
+        ):
+            prev_cursor = cursor_for(items[0], "prev")
+
+    total = None
+    if params.include_total:
+        total = await approximate_total(query, cache_key)
+
+    return {
+        "items": items,
+        "size": params.size,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "approximate_total": total,
+    }
+
+
+def key_value(item: Any, name: str) -> Any:
+    if isinstance(item, dict):
+        return item[name]
+    return getattr(item, name)
@@ -0,0 +1,262 @@
+import time
+import asyncio
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
+
+import httpx
+
+from app.metrics import CRAWL_IDS, CRAWL_RUN_SECONDS, DB_QUERY_SECONDS
+from app.schemas import DeezerAlbum, DeezerArtist
+from app.settings import settings
+
+if TYPE_CHECKING:
+    from app.crawler import DeezerCrawler
+
+
+# Marks the end of the stream on every queue:
+DONE = object()
+
+
+class MeteredQueue(asyncio.Queue):
+    """asyncio.Queue that keeps track of how full it gets and of how long
+    producers spend blocked on it, i.e. how much backpressure it applies."""
+
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(maxsize)
+        self.name = name
+        self.max_depth = 0
+        self.items = 0
+        self.blocked_seconds = 0.0
+
+    async def put(self, item: Any):
+        started = time.monotonic()
+        await super().put(item)
+        self.blocked_seconds += time.monotonic() - started
+        self.items += 1
+        self.max_depth = max(self.max_depth, self.qsize())
+
+    def info(self) -> dict:
+        return {
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "items": self.items,
+            "blocked_seconds": self.blocked_seconds,
+        }
+
+
+@dataclass
+class Scraped:
+    id: int
+    # None when Deezer has no artist under this id (error 800):
+    artist: Optional[DeezerArtist] = None
+    albums: list[DeezerAlbum] = field(default_factory=list)
+    # Set for ids whose artist was stored by an earlier crawl:
+    known: bool = False
+
+
+@dataclass
+class CrawlBatch:
+    done_ids: list[int] = field(default_factory=list)
+    missing_ids: list[int] = field(default_factory=list)
+    artists: list[DeezerArtist] = field(default_factory=list)
+    albums: list[DeezerAlbum] = field(default_factory=list)
+
+    def add(self, scraped: Scraped):
+        if scraped.known:
+            self.done_ids.append(scraped.id)
+        elif scraped.artist is None:
+            self.missing_ids.append(scraped.id)
+        else:
+            self.done_ids.append(scraped.id)
+            self.artists.append(scraped.artist)
+            self.albums.extend(scraped.albums)
+
+    def __len__(self) -> int:
+        return len(self.done_ids) + len(self.missing_ids)
+
+
+@dataclass
+class CrawlRunStats:
+    """Outcome of the fetches of one crawl run, for its caller to act on."""
+
+    # Ids fetched, whether or not Deezer had an artist under them:
+    fetched: int = 0
+    fetch_errors: int = 0
+    last_error: Optional[str] = None
+
+    @property
+    def attempted(self) -> int:
+        return self.fetched + self.fetch_errors
+
+
+@dataclass
+class PipelineMetrics:
+    runs: int = 0
+    ids_claimed: int = 0
+    artists_found: int = 0
+    artists_missing: int = 0
+    fetch_errors: int = 0
+    batches_written: int = 0
+    albums_written: int = 0
+    last_run_seconds: float = 0.0
+    queues: dict[str, dict] = field(default_factory=dict)
+
+
+# Kept across runs and served at /crawl-pipeline:
+pipeline_metrics = PipelineMetrics()
+
+
+class CrawlPipeline:
+    """Streams artist ids through the crawler in four stages.
+
+        producer -> ids -> fetch workers -> fetched -> filter -> parsed -> writer
+
+    The producer claims ids from the frontier until the run's budget is used
+    up or the review queue is full. ``workers`` fetch workers share the
+    crawler's limiter, so a slow artist with hundreds of albums only holds
+    up its own worker while the others keep the limiter busy. The writer
+    persists whatever has arrived every ``write_batch_size`` artists or
+    ``FLUSH_INTERVAL`` seconds. Every queue is bounded so a slow stage
+    pushes back on the stages before it.
+    """
+
+    FLUSH_INTERVAL = 2.0
+
+    def __init__(
+        self,
+        crawler: "DeezerCrawler",
+        client: httpx.AsyncClient,
+        budget: int,
+        workers: Optional[int] = None,
+        write_batch_size: Optional[int] = None,
+    ):
+        self.crawler = crawler
+        self.client = client
+        self.budget = budget
+        self.workers = workers or settings.CRAWL_FETCH_WORKERS
+        self.write_batch_size = write_batch_size or crawler.BATCH_SIZE
+
+        self.ids = MeteredQueue("ids", maxsize=self.workers * 2)
+        self.fetched = MeteredQueue("fetched", maxsize=self.workers * 2)
+        self.parsed = MeteredQueue("parsed", maxsize=self.write_batch_size * 2)
+        self.queues = [self.ids, self.fetched, self.parsed]
+        self.stats = CrawlRunStats()
+
+    async def run(self) -> CrawlRunStats:
+        started = time.monotonic()
+        pipeline_metrics.runs += 1
+        workers = [
+            asyncio.create_task(self.fetch_worker()) for _ in range(self.workers)
+        ]
+        tasks = [
+            asyncio.create_task(self.produce()),
+            asyncio.create_task(self.close_fetched(workers)),
+            asyncio.create_task(self.filter()),
+            asyncio.create_task(self.write()),
+            *workers,
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            pipeline_metrics.last_run_seconds = time.monotonic() - started
+            CRAWL_RUN_SECONDS.observe(pipeline_metrics.last_run_seconds)
+            pipeline_metrics.queues = self.info()
+        return self.stats
+
+    def info(self) -> dict:
+        return {queue.name: queue.info() for queue in self.queues}
+
+    async def produce(self):
+        claimed = 0
+        while claimed < self.budget:
+            if await self.crawler.queue_full():
+                print("Review queue is full, stopping crawl")
+                break
+            size = min(self.crawler.BATCH_SIZE, self.budget - claimed)
+            with DB_QUERY_SECONDS.labels("claim").time():
+                ids = await self.crawler.frontier.claim(size)
+            claimed += len(ids)
+            pipeline_metrics.ids_claimed += len(ids)
+
+            # Artists stored by an earlier, interrupted crawl go straight to
+            # the writer so the frontier gets marked:
+            known = await self.crawler.known_ids(ids)
+            for id in ids:
+                if id in known:
+                    await self.parsed.put(Scraped(id, known=True))
+                else:
+                    await self.ids.put(id)
+
+        for _ in range(self.workers):
+            await self.ids.put(DONE)
+
+    async def fetch_worker(self):
+        while True:
+            id = await self.ids.get()
+            if id is DONE:
+                return
+            try:
+                scraped = await self.crawler.fetch(self.client, id)
+            except Exception as exc:
+                # Leave the id in flight, the next crawl retries it through
+                # Frontier.recover. One bad artist doesn't end the run, the
+                # caller decides from the run's stats whether it failed.
+                self.stats.fetch_errors += 1
+                self.stats.last_error = repr(exc)
+                pipeline_metrics.fetch_errors += 1
+                CRAWL_IDS.labels("error").inc()
+                print(f"Failed to crawl artist {id}: {exc!r}")
+                continue
+            self.stats.fetched += 1
+            await self.fetched.put(scraped)
+
+    async def close_fetched(self, workers: list[asyncio.Task]):
+        await asyncio.gather(*workers)
+        await self.fetched.put(DONE)
+
+    async def filter(self):
+        while True:
+            scraped = await self.fetched.get()
+            if scraped is not DONE:
+                self.crawler.apply_filters(scraped.albums)
+            await self.parsed.put(scraped)
+            if scraped is DONE:
+                return
+
+    async def write(self):
+        batch = CrawlBatch()
+        finished = False
+        while not finished:
+            try:
+                scraped = await asyncio.wait_for(
+                    self.parsed.get(), timeout=self.FLUSH_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                batch = await self.flush(batch)
+                continue
+
+            if scraped is DONE:
+                finished = True
+            else:
+                batch.add(scraped)
+            if finished or len(batch) >= self.write_batch_size:
+                batch = await self.flush(batch)
+
+    async def flush(self, batch: CrawlBatch) -> CrawlBatch:
+        if len(batch):
+            albums_written = await self.crawler.persist(batch)
+            pipeline_metrics.batches_written += 1
+            pipeline_metrics.artists_found += len(batch.artists)
+            pipeline_metrics.artists_missing += len(batch.missing_ids)
+            pipeline_metrics.albums_written += albums_written
+            known = len(batch.done_ids) - len(batch.artists)
+            CRAWL_IDS.labels("found").inc(len(batch.artists))
+            CRAWL_IDS.labels("missing").inc(len(batch.missing_ids))
+            CRAWL_IDS.labels("known").inc(known)
+        return CrawlBatch()
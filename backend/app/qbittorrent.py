@@ -0,0 +1,70 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import qbittorrentapi
+
+from app.settings import settings
+
+
+T = TypeVar("T")
+
+
+class QBittorrentSession:
+    """One logged in qBittorrent WebUI session for the lifetime of the app.
+
+    The SID cookie from the first login is reused by every call. When
+    qBittorrent forgets it (WebUI restarted, session timed out) the call
+    fails with 403, qbittorrentapi logs in again and retries the call once.
+
+    That re-login rebuilds the client's requests session, which breaks any
+    call another thread has in flight on it. So every call runs on the
+    session's own single thread: the event loop never blocks on
+    qBittorrent, and calls never overlap.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str):
+        self.client = qbittorrentapi.Client(
+            host=host,
+            port=port,
+            username=username,
+            password=password,
+            REQUESTS_ARGS={"timeout": (5, 30)},
+        )
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="qbittorrent")
+        self._logged_in = False
+
+    def call(self, func: Callable[[qbittorrentapi.Client], T]) -> T:
+        if not self._logged_in:
+            self.client.auth_log_in()
+            self._logged_in = True
+        return func(self.client)
+
+    async def run(self, func: Callable[[qbittorrentapi.Client], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.call, func)
+
+    async def add_torrents(self, torrent_files: list[bytes]):
+        """Adds any number of .torrent files in a single request."""
+        if not torrent_files:
+            return
+        result = await self.run(
+            lambda client: client.torrents_add(
+                torrent_files=torrent_files,
+                category=settings.QBITTORRENT_CATEGORY,
+                tags=settings.QBITTORRENT_TAGS,
+            )
+        )
+        if result != "Ok.":
+            raise qbittorrentapi.APIError(f"qBittorrent did not add torrents: {result}")
+
+    async def close(self):
+        if self._logged_in:
+            try:
+                await self.run(lambda client: client.auth_log_out())
+            except qbittorrentapi.APIError as exc:
+                print(f"Could not log out of qBittorrent: {exc!r}")
+            self._logged_in = False
+        self._executor.shutdown(wait=False)
+
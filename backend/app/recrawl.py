@@ -0,0 +1,165 @@
+import asyncio
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import httpx
+
+from tortoise.transactions import in_transaction
+
+from app.crawler import DeezerCrawler, insert_albums
+from app.external import parse_date
+from app.metrics import DB_QUERY_SECONDS, RECRAWL_ARTISTS, count_new_albums
+from app.models import Album, Artist, artist_check_interval
+from app.schemas import DeezerAlbum
+from app.settings import settings
+
+
+@dataclass
+class Recheck:
+    artist: Artist
+    # Album ids in the artist's listing, None when the check failed:
+    listed: Optional[list[int]] = None
+    latest_release: Optional[date] = None
+    albums: list[DeezerAlbum] = field(default_factory=list)
+
+
+class Recrawler:
+    """Checks stored artists for albums released since they were crawled.
+
+    Each artist has a ``next_check`` date, set from its fan count and how
+    recently it released something (see artist_check_interval). Due artists
+    are checked in batches, most overdue first: one request for the album
+    listing (a page holds ALBUMS_PAGE_SIZE albums), then one query for the
+    whole batch to find the listed albums that aren't stored yet. Only
+    those cost detail requests, so an artist without new releases costs a
+    single request.
+    """
+
+    def __init__(self, crawler: DeezerCrawler, budget: int):
+        self.crawler = crawler
+        self.budget = budget
+        self.checked = 0
+        self.failed = 0
+        self.albums_written = 0
+
+    async def run(self, client: httpx.AsyncClient):
+        while self.checked < self.budget:
+            if await self.crawler.queue_full():
+                break
+            size = min(self.crawler.BATCH_SIZE, self.budget - self.checked)
+            with DB_QUERY_SECONDS.labels("due_artists").time():
+                artists = await (
+                    Artist.filter(disabled=False, next_check__lte=datetime.now())
+                    .order_by("next_check")
+                    .limit(size)
+                )
+            if not artists:
+                break
+            rechecks = await self.check(client, artists)
+            await self.persist(rechecks)
+            self.checked += len(artists)
+        if self.checked:
+            print(f"Recrawl finished: {self.info()}")
+
+    def info(self) -> dict:
+        return {
+            "checked": self.checked,
+            "failed": self.failed,
+            "albums_written": self.albums_written,
+        }
+
+    async def check(
+        self, client: httpx.AsyncClient, artists: list[Artist]
+    ) -> list[Recheck]:
+        api = self.crawler.deezer_api
+        rechecks = [Recheck(artist) for artist in artists]
+        listings = await asyncio.gather(
+            *(api.fetch_album_listing(client, artist.id) for artist in artists),
+            return_exceptions=True,
+        )
+        for recheck, listing in zip(rechecks, listings):
+            if isinstance(listing, BaseException):
+                print(f"Failed to recheck artist {recheck.artist.id}: {listing!r}")
+                continue
+            recheck.listed = [record["id"] for record in listing]
+            dates = [
+                parse_date(record["release_date"])
+                for record in listing
+                if record.get("release_date")
+            ]
+            recheck.latest_release = max(dates, default=None)
+
+        listed = [id for recheck in rechecks for id in recheck.listed or []]
+        known = set(await Album.filter(id__in=listed).values_list("id", flat=True))
+        unseen = [
+            [id for id in recheck.listed or [] if id not in known]
+            for recheck in rechecks
+        ]
+        albums = await asyncio.gather(
+            *(api.fetch_albums_by_id(client, ids) for ids in unseen),
+            return_exceptions=True,
+        )
+        for recheck, found in zip(rechecks, albums):
+            if isinstance(found, BaseException):
+                print(f"Failed to recheck artist {recheck.artist.id}: {found!r}")
+                recheck.listed = None
+                continue
+            self.crawler.apply_filters(found)
+            recheck.albums = found
+        return rechecks
+
+    async def persist(self, rechecks: list[Recheck]):
+        now = datetime.now()
+        try:
+            albums = await self._persist(rechecks, now)
+        except Exception as exc:
+            # One artist's albums mustn't keep the whole batch due, and
+            # failing again on every run: store them artist by artist.
+            print(f"Failed to store rechecks, storing them one by one: {exc!r}")
+            albums = []
+            for recheck in rechecks:
+                try:
+                    albums += await self._persist([recheck], now)
+                except Exception as exc:
+                    print(f"Failed to store recheck of {recheck.artist.id}: {exc!r}")
+                    recheck.listed = None
+                    recheck.albums = []
+                    await self.reschedule(recheck, now)
+        count_new_albums(album.status for album in albums)
+
+        failed = sum(recheck.listed is None for recheck in rechecks)
+        self.failed += failed
+        self.albums_written += len(albums)
+        RECRAWL_ARTISTS.labels("ok").inc(len(rechecks) - failed)
+        RECRAWL_ARTISTS.labels("failed").inc(failed)
+
+    async def _persist(
+        self, rechecks: list[Recheck], now: datetime
+    ) -> list[DeezerAlbum]:
+        with DB_QUERY_SECONDS.labels("recheck_persist").time():
+            async with in_transaction():
+                albums = await insert_albums(
+                    [album for recheck in rechecks for album in recheck.albums]
+                )
+                for recheck in rechecks:
+                    await self.reschedule(recheck, now)
+        return albums
+
+    async def reschedule(self, recheck: Recheck, now: datetime):
+        artist = recheck.artist
+        if recheck.listed is None:
+            # Tried again after the shortest interval, not on the next run:
+            interval = timedelta(days=settings.RECRAWL_MIN_INTERVAL_DAYS)
+            await Artist.filter(id=artist.id).update(next_check=now + interval)
+            return
+
+        interval = artist_check_interval(
+            artist.nb_fan, recheck.latest_release, found_new=bool(recheck.albums)
+        )
+        await Artist.filter(id=artist.id).update(
+            nb_album=len(recheck.listed),
+            last_checked=now,
+            next_check=now + interval,
+        )
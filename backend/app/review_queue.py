@@ -0,0 +1,76 @@
+import asyncio
+
+from typing import Optional
+
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from app.metrics import DB_QUERY_SECONDS
+from app.models import Album, ReviewQueueSize, TrackingStatus
+from app.settings import settings
+
+
+class ReviewQueue:
+    """Size of the review queue: albums that are added and eligible.
+
+    The size is a counter row. Whatever adds albums to the queue or takes
+    them out moves it by the same amount with add(), inside the
+    transaction making the change, so reading it never counts albums. A
+    full count corrects any drift every ``reconcile_interval`` seconds, and
+    once on startup.
+    """
+
+    ROW_ID = 1
+
+    def __init__(self, reconcile_interval: float):
+        self.reconcile_interval = reconcile_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.reconcile()
+        self._task = asyncio.create_task(self.reconcile_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def size(self) -> int:
+        with DB_QUERY_SECONDS.labels("queue_size").time():
+            row = await ReviewQueueSize.get_or_none(id=self.ROW_ID)
+        if row is None:
+            # Not started, e.g. from a script:
+            return await self.reconcile()
+        return row.size
+
+    async def add(self, count: int):
+        if count:
+            await ReviewQueueSize.filter(id=self.ROW_ID).update(
+                size=F("size") + count
+            )
+
+    async def reconcile(self) -> int:
+        async with in_transaction():
+            with DB_QUERY_SECONDS.labels("queue_reconcile").time():
+                count = await Album.filter(
+                    status=TrackingStatus.Added, eligible=True
+                ).count()
+            row = await ReviewQueueSize.get_or_none(id=self.ROW_ID)
+            if row is None:
+                await ReviewQueueSize.create(id=self.ROW_ID, size=count)
+            elif row.size != count:
+                print(f"Review queue size was {row.size}, counted {count}")
+                row.size = count
+                await row.save()
+        return count
+
+    async def reconcile_forever(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as exc:
+                print(f"Failed to reconcile the review queue size: {exc!r}")
+
+
+review_queue = ReviewQueue(reconcile_interval=settings.QUEUE_RECONCILE_INTERVAL)
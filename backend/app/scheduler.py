@@ -0,0 +1,159 @@
+import random
+import asyncio
+
+from typing import Optional
+
+from app.clients import clients
+from app.crawler import DeezerCrawler, num_albums_in_queue
+from app.recrawl import Recrawler
+from app.settings import settings
+
+
+class CrawlRunFailed(Exception):
+    """A crawl run whose requests mostly failed, although nothing raised."""
+
+
+class CrawlScheduler:
+    """Runs the crawler whenever the review queue needs albums.
+
+    A run first checks known artists that are due for new releases (see
+    app/recrawl.py), then crawls new artist ids. The queue is kept between
+    two water marks: once it holds ``high_water`` albums the crawler
+    pauses, and it only starts again when reviews have drained it below
+    ``low_water``. Anything that takes albums out of the
+    queue calls notify(), which wakes the scheduler right away instead of
+    at the next tick of a timer; ``idle_interval`` is only a fallback.
+    While below the high water mark, crawl runs follow each other with
+    ``min_interval`` seconds in between.
+
+    A run fails when it raises, when none of its fetches succeeded, or when
+    more than ``max_error_ratio`` of them failed (Deezer down or throttling
+    every request). A failed run is retried after an exponential backoff
+    with jitter, from ``min_backoff`` up to ``max_backoff`` seconds, so the
+    loop never dies and never hammers an API that keeps failing.
+    """
+
+    def __init__(
+        self,
+        low_water: int,
+        high_water: int,
+        idle_interval: float,
+        min_interval: float,
+        min_backoff: float,
+        max_backoff: float,
+        max_error_ratio: float,
+    ):
+        self.low_water = low_water
+        self.high_water = high_water
+        self.idle_interval = idle_interval
+        self.min_interval = min_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_error_ratio = max_error_ratio
+
+        self.wake = asyncio.Event()
+        self.paused = False
+        self.runs = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def notify(self):
+        self.wake.set()
+
+    def info(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "paused": self.paused,
+            "low_water": self.low_water,
+            "high_water": self.high_water,
+            "runs": self.runs,
+            "consecutive_failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+    async def run(self):
+        while True:
+            # Cleared before looking at the queue, so a change made during
+            # the crawl wakes the next wait right away:
+            self.wake.clear()
+            try:
+                crawled = await self.step()
+            except Exception as exc:
+                self.failures += 1
+                self.last_error = repr(exc)
+                delay = self.backoff()
+                print(f"Crawl failed: {exc!r}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.failures = 0
+            if crawled:
+                await asyncio.sleep(self.min_interval)
+            else:
+                await self.sleep()
+
+    async def step(self) -> bool:
+        """Crawls once if the queue needs it. Returns whether it did, raises
+        CrawlRunFailed when it did and too many of its fetches failed."""
+        size = await num_albums_in_queue()
+        if size >= self.high_water:
+            self.paused = True
+        elif size < self.low_water:
+            self.paused = False
+        if self.paused:
+            return False
+
+        self.runs += 1
+        crawler = DeezerCrawler()
+        # Known artists first: their new releases are the likeliest to be
+        # worth reviewing, and checking one costs about a request.
+        recrawler = Recrawler(crawler, budget=settings.RECRAWL_PER_RUN)
+        recrawl_error = None
+        try:
+            await recrawler.run(clients.deezer)
+        except Exception as exc:
+            # Counted as one failed fetch, new artists are crawled regardless
+            print(f"Recrawl failed: {exc!r}")
+            recrawl_error = repr(exc)
+        stats = await crawler.crawl_deezer(clients.deezer)
+
+        attempted = recrawler.checked + stats.attempted + (recrawl_error is not None)
+        errors = recrawler.failed + stats.fetch_errors + (recrawl_error is not None)
+        if attempted and (
+            errors == attempted or errors / attempted > self.max_error_ratio
+        ):
+            raise CrawlRunFailed(
+                f"{errors} of {attempted} fetches failed, last: "
+                f"{stats.last_error or recrawl_error}"
+            )
+        return True
+
+    async def sleep(self):
+        try:
+            await asyncio.wait_for(self.wake.wait(), timeout=self.idle_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    def backoff(self) -> float:
+        delay = min(self.max_backoff, self.min_backoff * 2 ** (self.failures - 1))
+        return random.uniform(delay / 2, delay)
+
+
+crawl_scheduler = CrawlScheduler(
+    low_water=settings.DEEZER_QUEUE_LOW_WATER,
+    high_water=settings.DEEZER_QUEUE_LIMIT,
+    idle_interval=settings.CRAWL_IDLE_INTERVAL,
+    min_interval=settings.CRAWL_MIN_INTERVAL,
+    min_backoff=settings.CRAWL_RETRY_MIN_DELAY,
+    max_backoff=settings.CRAWL_RETRY_MAX_DELAY,
+    max_error_ratio=settings.CRAWL_MAX_ERROR_RATIO,
+)
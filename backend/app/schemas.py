@@ -2,7 +2,6 @@ import enum
 import re
 import os
 import math
-import subprocess
 
 from datetime import datetime, date, timedelta
 from typing import Optional
@@ -11,7 +10,9 @@ import audio_metadata
 from pydantic import BaseModel, HttpUrl, validator, Field
 
 
-from .models import RecordType, TrackerCode, TrackingStatus, Album
+from . import flac
+from .models import RecordType, TrackerCode, TrackingStatus, DownloadState, Album
+from .settings import settings
 
 
 DEEZER_RECORD_TYPES = {
@@ -45,6 +46,8 @@ class GazelleSearchResult(BaseModel):
     artist: str
     title: str
     match: Optional[float] = None
+    # The artist's album this result is closest to, if any is close enough
+    album_id: Optional[int] = None
 
 
 class DeezerTrack(BaseModel):
@@ -61,6 +64,7 @@ class DeezerAlbum(BaseModel):
     image_url: HttpUrl
     digital_release_date: date
     release_date: date
+    release_date_resolved: bool = True
     create_date: datetime = Field(default_factory=datetime.now)
     record_type: RecordType
     status: TrackingStatus = TrackingStatus.Added
@@ -69,6 +73,7 @@ class DeezerAlbum(BaseModel):
     tracks: list[DeezerTrack]
     contributors: dict[str, str]
     upc: str
+    folder_name: str
 
     @property
     def album_url(self) -> str:
@@ -106,6 +111,20 @@ class AlbumInfo(BaseModel):
         orm_mode = True
 
 
+class DownloadJobInfo(BaseModel):
+    id: int
+    album_id: int
+    state: DownloadState
+    attempts: int
+    progress: int
+    error: Optional[str]
+    create_date: datetime
+    update_date: datetime
+
+    class Config:
+        orm_mode = True
+
+
 class DeezerArtistAlbums(DeezerArtist):
     albums: list[DeezerAlbum]
 
@@ -121,6 +140,19 @@ class TrackerAPIResponse(BaseModel):
     url: Optional[int] = None
 
 
+class UploadBatch(BaseModel):
+    album_ids: list[int] = []
+    # Upload every album that is ready instead of album_ids:
+    all_ready: bool = False
+
+
+class UploadResult(BaseModel):
+    album_id: int
+    ok: bool
+    response: Optional[TrackerAPIResponse] = None
+    error: Optional[str] = None
+
+
 class UploadParameters(BaseModel):
     # This should always be set to 0
     # Music->0, Applications->1, E-Books->2, Audiobooks->3, etc.
@@ -300,13 +332,9 @@ class ParsedAudioFile(BaseModel):
         return True
 
     def verify_contents(self) -> bool:
-        result = subprocess.run(
-            ["flac", "-t", self.filepath], capture_output=True, text=True
-        )
-        stderr = result.stderr.strip()
-        if stderr.endswith("ok"):
-            return True
-        return False
+        if settings.FLAC_VERIFY_BACKEND == "flac":
+            return flac.verify_flac(self.filepath)
+        return flac.verify_native(self.filepath, self.md5)
 
     def tracklength_close(self, expected_duration_sec: int) -> bool:
         # Track must be within 5 seconds of the expected duration provided by
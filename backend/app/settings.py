@@ -1,5 +1,6 @@
 import os
 from datetime import datetime
+from typing import Literal, Optional
 
 from pydantic import BaseSettings
 from deemix.settings import DEFAULTS
@@ -17,20 +18,85 @@ class Settings(BaseSettings):
     # In terms of requests per second:
     # The actual rate limit is 50 calls per 5 seconds or 10 requests / second
     # https://developers.deezer.com/api
-    DEEZER_API_RATE_LIMIT: int = 5
+    # The limiter is adaptive (see app/limiter.py) and backs off on its own
+    # when Deezer reports the quota exceeded, so this is the ceiling:
+    DEEZER_API_RATE_LIMIT: int = 10
+    DEEZER_API_BURST: int = 50
+    DEEZER_API_BURST_PERIOD: float = 5.0
+    # How many times a throttled request is retried before giving up:
+    DEEZER_API_MAX_RETRIES: int = 5
+    # Maximum number of Deezer requests awaiting a response at the same time:
+    DEEZER_API_MAX_CONCURRENCY: int = 20
     DEEZER_ARL_COOKIE: str
+    # Can point at a local stand-in, see fakes/deezer.py:
+    DEEZER_API_URL: str = "https://api.deezer.com"
+    # The crawler fills the review queue up to DEEZER_QUEUE_LIMIT albums and
+    # resumes once reviews have drained it below DEEZER_QUEUE_LOW_WATER
+    # (see app/scheduler.py):
     DEEZER_QUEUE_LIMIT: int = 50
+    DEEZER_QUEUE_LOW_WATER: int = 25
+    # Seconds between full counts correcting the review queue size:
+    QUEUE_RECONCILE_INTERVAL: float = 3600.0
     DEEZER_MINIMUM_RELEASE_YEAR: int = datetime.now().year - 1
     DEEZER_ARTIST_START_ID = 13000
+    # On-disk cache of artist/album/track responses (see app/cache.py). In
+    # offline mode only cached or fixture responses are served:
+    DEEZER_CACHE_ENABLED: bool = True
+    DEEZER_CACHE_PATH: str = os.path.join(ROOT_FOLDER, "deezer_cache.sqlite")
+    DEEZER_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    DEEZER_CACHE_OFFLINE: bool = False
 
+    # Number of artist ids the crawler works through per run:
     MAX_CRAWLS_PER_RUN: int = 75
+    # Artists fetched concurrently by the crawl pipeline (see app/pipeline.py):
+    CRAWL_FETCH_WORKERS: int = 5
+    # Times an artist id is handed out to the crawler before it is given up
+    # on and marked failed:
+    CRAWL_MAX_ATTEMPTS: int = 3
+    # Known artists checked for new releases per crawl run, before any new
+    # artist ids (see app/recrawl.py):
+    RECRAWL_PER_RUN: int = 200
+    # Bounds of the wait between two checks of the same artist, popular and
+    # active artists get the shorter waits:
+    RECRAWL_MIN_INTERVAL_DAYS: float = 1.0
+    RECRAWL_MAX_INTERVAL_DAYS: float = 60.0
+    # Seconds the scheduler waits for a change to the queue before checking
+    # it anyway:
+    CRAWL_IDLE_INTERVAL: float = 300.0
+    # Seconds between two crawl runs while the queue needs albums:
+    CRAWL_MIN_INTERVAL: float = 1.0
+    # A crawl run where more than this share of the fetches failed counts
+    # as failed and is retried after a backoff:
+    CRAWL_MAX_ERROR_RATIO: float = 0.5
+    # Backoff after a failed crawl, doubling from the min up to the max:
+    CRAWL_RETRY_MIN_DELAY: float = 5.0
+    CRAWL_RETRY_MAX_DELAY: float = 600.0
 
     REDACTED_API_KEY: str
     REDACTED_ANNOUNCE_URL: str
     REDACTED_API_URL: str
+    # Gazelle trackers allow 10 API calls per 10 seconds per key. Uploads
+    # stay below that so a search from the UI still gets through:
+    TRACKER_API_BURST: int = 5
+    TRACKER_API_BURST_PERIOD: float = 10.0
+    # Albums verified and hashed at once by a batch upload:
+    UPLOAD_PREPARE_CONCURRENCY: int = 2
 
     ROOT_FOLDER: str = ROOT_FOLDER
 
+    # Processes used to verify downloaded FLAC files, defaults to one per core:
+    VERIFY_WORKERS: Optional[int] = None
+    # "native" decodes in process (see app/flac.py), "flac" shells out to
+    # the reference `flac -t` binary:
+    FLAC_VERIFY_BACKEND: Literal["native", "flac"] = "native"
+    # Threads hashing torrent pieces, defaults to one per core:
+    TORRENT_HASH_THREADS: Optional[int] = None
+
+    # Albums downloaded from Deezer at the same time (see app/downloads.py):
+    DOWNLOAD_WORKERS: int = 2
+    # Attempts per download job before it is marked failed:
+    DOWNLOAD_MAX_ATTEMPTS: int = 3
+
     QBITTORRENT_HOST: str
     QBITTORRENT_PORT: int
     QBITTORRENT_USERNAME: str
@@ -0,0 +1,35 @@
+from tortoise.transactions import in_transaction
+
+from app.metrics import ALBUMS
+from app.models import Album, TrackingStatus
+from app.review_queue import review_queue
+from app.scheduler import crawl_scheduler
+
+
+async def set_album_status(album: Album, status: TrackingStatus):
+    """Saves a new status for ``album``. Every status change of a stored
+    album goes through here: it moves the album between the status gauges,
+    so they never need a COUNT, keeps the review queue size in step and
+    wakes the crawl scheduler when the album leaves the queue."""
+    async with in_transaction():
+        # The album may have been loaded a while ago, e.g. when its download
+        # started, and changed since: the queue counter goes by the row.
+        current = (
+            await Album.select_for_update()
+            .only("id", "status", "eligible")
+            .get(id=album.id)
+        )
+        old = current.status
+        queued = (status == TrackingStatus.Added) - (old == TrackingStatus.Added)
+        await Album.filter(id=album.id).update(status=status)
+        if current.eligible:
+            await review_queue.add(queued)
+    album.status = status
+    album.eligible = current.eligible
+    if old == status:
+        return
+
+    ALBUMS.labels(old.value).dec()
+    ALBUMS.labels(status.value).inc()
+    if old == TrackingStatus.Added:
+        crawl_scheduler.notify()
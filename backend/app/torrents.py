@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+import hashlib
+
+from typing import Optional
+
+import torf
+
+from app.metrics import ALBUM_STAGE_SECONDS
+from app.models import TrackerCode
+from app.settings import settings
+
+
+KiB = 1024
+MiB = 1024 * KiB
+GiB = 1024 * MiB
+
+# (total size up to, piece size), the usual table for music torrents. Small
+# pieces keep partial seeding useful on small albums, large albums don't end
+# up with an oversized piece list.
+PIECE_SIZES = (
+    (50 * MiB, 32 * KiB),
+    (150 * MiB, 64 * KiB),
+    (350 * MiB, 128 * KiB),
+    (512 * MiB, 256 * KiB),
+    (1 * GiB, 512 * KiB),
+    (2 * GiB, 1 * MiB),
+)
+MAX_PIECE_SIZE = 2 * MiB
+
+
+# What hash_file_pieces returns for one file: (head, piece hashes, tail)
+FilePieces = tuple[bytes, list[bytes], bytes]
+
+
+def piece_size_for(total_size: int) -> int:
+    for limit, piece_size in PIECE_SIZES:
+        if total_size <= limit:
+            return piece_size
+    return MAX_PIECE_SIZE
+
+
+class HashingProgress:
+    """Pieces hashed so far for each torrent being generated, keyed by the
+    download path. Written from the hashing thread, read by the API."""
+
+    def __init__(self):
+        self._progress: dict[str, tuple[int, int]] = {}
+
+    def update(self, path: str, hashed: int, total: int):
+        self._progress[os.path.normpath(path)] = (hashed, total)
+
+    def finish(self, path: str):
+        self._progress.pop(os.path.normpath(path), None)
+
+    def get(self, path: str) -> Optional[float]:
+        path = os.path.normpath(path)
+        if path not in self._progress:
+            return None
+        hashed, total = self._progress[path]
+        return hashed / total if total else 1.0
+
+
+hashing_progress = HashingProgress()
+
+
+def new_torrent(download_path: str, tracker_code: TrackerCode) -> torf.Torrent:
+    torrent = torf.Torrent(
+        path=download_path,
+        trackers=[settings.REDACTED_ANNOUNCE_URL],
+        private=True,
+        source=tracker_code.value,
+    )
+    torrent.piece_size = piece_size_for(torrent.size)
+    return torrent
+
+
+def file_offsets(torrent: torf.Torrent) -> list[tuple[str, int]]:
+    """Each file of ``torrent`` with the position of its first byte in the
+    torrent's concatenated contents, in the order pieces are laid out."""
+    offsets = []
+    offset = 0
+    for filepath, file in zip(torrent.filepaths, torrent.files):
+        offsets.append((str(filepath), offset))
+        offset += file.size
+    return offsets
+
+
+def hash_file_pieces(data, offset: int, piece_size: int) -> FilePieces:
+    """Hashes the pieces that lie entirely inside one file's ``data``.
+
+    Returns the leading bytes that finish a piece started in the previous
+    file, the SHA1 digests of the pieces in between, and the trailing bytes
+    that start a piece completed by the next file. join_piece_hashes puts
+    the files back together, so files can be hashed independently.
+    """
+    view = memoryview(data)
+    head_size = min(-offset % piece_size, len(view))
+    hashes = []
+    start = head_size
+    while len(view) - start >= piece_size:
+        hashes.append(hashlib.sha1(view[start : start + piece_size]).digest())
+        start += piece_size
+    return bytes(view[:head_size]), hashes, bytes(view[start:])
+
+
+def join_piece_hashes(parts: list[FilePieces], piece_size: int) -> bytes:
+    """Combines hash_file_pieces results, in file order, into the torrent's
+    ``pieces`` string."""
+    pieces = []
+    pending = b""
+    for head, hashes, tail in parts:
+        pending += head
+        if len(pending) == piece_size:
+            pieces.append(hashlib.sha1(pending).digest())
+            pending = b""
+        pieces.extend(hashes)
+        # A file holding no piece boundary has no tail, its bytes stay pending
+        pending += tail
+    if pending:
+        pieces.append(hashlib.sha1(pending).digest())
+    return b"".join(pieces)
+
+
+def hash_torrent(torrent: torf.Torrent, threads: Optional[int] = None):
+    """Hashes all pieces of ``torrent``. Blocks; run it in a thread.
+
+    torf reads the files sequentially and hands pieces to ``threads``
+    hasher threads. hashlib releases the GIL while hashing, so with one
+    thread per core the read speed of the disk is the limit, not SHA1."""
+    path = str(torrent.path)
+    started = time.perf_counter()
+
+    def callback(torrent, filepath, hashed, total):
+        hashing_progress.update(path, hashed, total)
+
+    try:
+        torrent.generate(
+            threads=threads or settings.TORRENT_HASH_THREADS or os.cpu_count(),
+            callback=callback,
+            interval=0.5,
+        )
+    finally:
+        hashing_progress.finish(path)
+    elapsed = time.perf_counter() - started
+    ALBUM_STAGE_SECONDS.labels("hash").observe(elapsed)
+    print(
+        f"Hashed {torrent.size / MiB:.1f} MiB into {torrent.pieces} pieces "
+        f"of {torrent.piece_size // KiB} KiB in {elapsed:.2f}s"
+    )
+
+
+async def generate_torrent(
+    download_path: str, tracker_code: TrackerCode
+) -> torf.Torrent:
+    torrent = new_torrent(download_path, tracker_code)
+    await asyncio.to_thread(hash_torrent, torrent)
+    return torrent
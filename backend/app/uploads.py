@@ -0,0 +1,213 @@
+import os
+import asyncio
+
+from typing import AsyncIterator
+
+import httpx
+import torf
+
+from fastapi import HTTPException, status
+from tortoise.transactions import in_transaction
+
+from app.cache import deezer_cache
+from app.clients import clients
+from app.external import DeezerAPI, UploadManager
+from app.limiter import deezer_limiter, tracker_limiter
+from app.metrics import ALBUM_STAGE_SECONDS
+from app.models import Album, Upload
+from app.schemas import (
+    TrackerAPIResponse,
+    TrackerCode,
+    TrackingStatus,
+    UploadParameters,
+    UploadResult,
+)
+from app.qbittorrent import QBittorrentSession
+from app.settings import settings
+from app.statuses import set_album_status
+from app.torrents import new_torrent
+from app.verification import verify_and_hash
+
+
+def downloaded_filepaths(album: Album) -> list[str]:
+    filepaths = []
+
+    try:
+        filenames = os.listdir(album.download_path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND, detail="Album not downloaded yet"
+        )
+
+    for filename in filenames:
+        if not filename.endswith((".flac", "cover.jpg")):
+            raise HTTPException(
+                status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Encountered unexpected file in download folder: {filename}",
+            )
+        if not filename.endswith(".flac"):
+            continue
+        filepaths.append(os.path.join(album.download_path, filename))
+
+    if len(album.tracks) != len(filepaths):
+        raise HTTPException(
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Number of tracks downloaded does not match album tracks",
+        )
+    return filepaths
+
+
+async def resolve_release_date(album: Album, client: httpx.AsyncClient):
+    """Looks up the physical release date the crawler skipped for ``album``.
+    The folder name keeps the year it was downloaded under."""
+    api = DeezerAPI(
+        deezer_limiter, cache=deezer_cache if settings.DEEZER_CACHE_ENABLED else None
+    )
+    album.release_date = await api.fetch_release_date(client, album.id)
+    album.release_date_resolved = True
+    await album.save(update_fields=["release_date", "release_date_resolved"])
+
+
+async def prepare_upload(album: Album, tracker_code: TrackerCode) -> torf.Torrent:
+    if not album.release_date_resolved:
+        await resolve_release_date(album, clients.deezer)
+    # Verifying and hashing read the whole album, once, and never inside a
+    # transaction so that no database lock is held meanwhile.
+    torrent = new_torrent(album.download_path, tracker_code)
+    filepaths = downloaded_filepaths(album)
+    verifications = await verify_and_hash(album, filepaths, torrent)
+    # Every downloaded track has to be verified, not just the ones found:
+    if set(verifications) != set(filepaths) or not all(verifications.values()):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Downloaded audio content does not conform to verification",
+        )
+    return torrent
+
+
+async def submit_upload(
+    album: Album,
+    torrent: torf.Torrent,
+    tracker_code: TrackerCode,
+    client: httpx.AsyncClient,
+    qbittorrent: QBittorrentSession,
+) -> TrackerAPIResponse:
+    manager = UploadManager()
+    params = UploadParameters.from_album(album)
+
+    file = torrent.dump()
+
+    await tracker_limiter.wait()
+    with ALBUM_STAGE_SECONDS.labels("upload").time():
+        # Sent before touching the database so that no transaction is held
+        # open while waiting on the tracker:
+        tracker_response = await manager.process_upload(
+            client, params, tracker_code, file
+        )
+    tracker_limiter.success()
+
+    # Committed as soon as the tracker accepted the upload: from then on the
+    # album is uploaded, whether or not seeding it works.
+    async with in_transaction():
+        upload = await Upload.create(
+            infohash=torrent.infohash,
+            upload_parameters=params.dict(by_alias=True),
+            file=file,
+            tracker_code=tracker_code,
+            torrent_id=tracker_response.torrentid,
+            group_id=tracker_response.groupid,
+            album=album,
+        )
+        await set_album_status(album, TrackingStatus.Uploaded)
+
+    # Only seeded once committed: seeding retries for a while, which must
+    # neither hold the transaction open nor roll the upload back.
+    await seed_uploads([upload], qbittorrent)
+    return tracker_response
+
+
+# Tries at adding uploaded torrents to qBittorrent, the delay between two
+# doubling each time:
+SEED_ATTEMPTS = 3
+SEED_RETRY_DELAY = 2.0
+
+
+async def seed_uploads(uploads: list[Upload], qbittorrent: QBittorrentSession) -> bool:
+    """Adds the torrents of ``uploads`` to qBittorrent, retrying a few times.
+    Returns whether it worked; a failure is logged and can be retried with
+    PUT /album/{id}/seed, adding a torrent twice is harmless."""
+    for attempt in range(1, SEED_ATTEMPTS + 1):
+        try:
+            await qbittorrent.add_torrents([upload.file for upload in uploads])
+        except Exception as exc:
+            ids = [upload.id for upload in uploads]
+            print(f"Failed to seed uploads {ids} (attempt {attempt}): {exc!r}")
+            if attempt < SEED_ATTEMPTS:
+                await asyncio.sleep(SEED_RETRY_DELAY * 2 ** (attempt - 1))
+        else:
+            return True
+    return False
+
+
+async def upload_album(
+    album: Album,
+    tracker_code: TrackerCode,
+    client: httpx.AsyncClient,
+    qbittorrent: QBittorrentSession,
+) -> TrackerAPIResponse:
+    torrent = await prepare_upload(album, tracker_code)
+    return await submit_upload(album, torrent, tracker_code, client, qbittorrent)
+
+
+async def upload_albums(
+    albums: list[Album],
+    tracker_code: TrackerCode,
+    client: httpx.AsyncClient,
+    qbittorrent: QBittorrentSession,
+) -> AsyncIterator[UploadResult]:
+    """Uploads ``albums``, yielding each album's result as it finishes.
+
+    Albums are verified and hashed a few at a time in the background while
+    finished ones are sent to the tracker one after the other, at the pace
+    of the tracker's rate limit. A failing album is reported and skipped.
+    """
+    semaphore = asyncio.Semaphore(settings.UPLOAD_PREPARE_CONCURRENCY)
+
+    async def prepare(album: Album) -> tuple[Album, torf.Torrent]:
+        async with semaphore:
+            try:
+                return album, await prepare_upload(album, tracker_code)
+            except Exception as exc:
+                raise BatchUploadError(album, exc)
+
+    tasks = [asyncio.create_task(prepare(album)) for album in albums]
+    try:
+        for task in asyncio.as_completed(tasks):
+            try:
+                album, torrent = await task
+                response = await submit_upload(
+                    album, torrent, tracker_code, client, qbittorrent
+                )
+            except BatchUploadError as exc:
+                yield UploadResult(album_id=exc.album.id, ok=False, error=exc.reason)
+            except Exception as exc:
+                yield UploadResult(album_id=album.id, ok=False, error=describe(exc))
+            else:
+                yield UploadResult(album_id=album.id, ok=True, response=response)
+    finally:
+        # The client went away or the batch failed outright:
+        for task in tasks:
+            task.cancel()
+
+
+class BatchUploadError(Exception):
+    def __init__(self, album: Album, exc: Exception):
+        super().__init__(album.id, exc)
+        self.album = album
+        self.reason = describe(exc)
+
+
+def describe(exc: Exception) -> str:
+    if isinstance(exc, HTTPException):
+        return str(exc.detail)
+    return repr(exc)
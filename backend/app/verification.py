@@ -0,0 +1,274 @@
+import os
+import mmap
+import time
+import asyncio
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Optional
+
+import torf
+
+from app import flac
+from app.metrics import ALBUM_STAGE_SECONDS
+from app.models import Album, TrackVerification
+from app.schemas import DeezerTrack, ParsedAudioFile
+from app.settings import settings
+from app.torrents import (
+    FilePieces,
+    file_offsets,
+    hash_file_pieces,
+    hashing_progress,
+    join_piece_hashes,
+)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawned rather than forked: the parent runs an event loop and
+        # client threads that a forked child would inherit in whatever state
+        # they happened to be in.
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.VERIFY_WORKERS or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def inspect_track(filepath: str) -> tuple[str, Optional[ParsedAudioFile], bool]:
+    """Parses the tags and test decodes a single file. Runs in a worker
+    process; this is where all the CPU time of a verification goes."""
+    try:
+        parsed = ParsedAudioFile.from_filepath(filepath)
+    except Exception as exc:
+        # Unreadable tags or an unset STREAMINFO MD5 fail just this track
+        print(f"Can not parse {filepath}: {exc!r}")
+        return filepath, None, False
+    return filepath, parsed, parsed.verify_contents()
+
+
+def inspect_and_hash(
+    filepath: str, offset: int, piece_size: int, verify: bool
+) -> tuple[str, Optional[ParsedAudioFile], bool, FilePieces]:
+    """Hashes the torrent pieces of a file and, for tracks, verifies it,
+    reading the file from disk once. Runs in a worker process.
+
+    The file is memory mapped: hashing pulls every page in, the decoder then
+    reads the same pages from memory instead of going back to the disk."""
+    parsed, contents_ok = None, False
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return filepath, None, False, hash_file_pieces(b"", offset, piece_size)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            pieces = hash_file_pieces(mapped, offset, piece_size)
+            if verify:
+                try:
+                    parsed = ParsedAudioFile.from_filepath(filepath)
+                except Exception as exc:
+                    print(f"Can not parse {filepath}: {exc!r}")
+                else:
+                    if settings.FLAC_VERIFY_BACKEND == "native":
+                        contents_ok = flac.verify_mapped(mapped, parsed.md5, filepath)
+                    else:
+                        contents_ok = parsed.verify_contents()
+    return filepath, parsed, contents_ok, pieces
+
+
+def verify_metadata(album: Album, parsed: ParsedAudioFile) -> bool:
+    # Tracks are matched on their tag's track number, the same order the
+    # Deezer album endpoint lists them in:
+    if not 1 <= parsed.position <= len(album.tracks):
+        return False
+    track = DeezerTrack(**album.tracks[parsed.position - 1])
+    return parsed.verify_metadata(album, track)
+
+
+def fingerprint(filepath: str) -> tuple[int, int, int]:
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+async def cached_inspections(
+    filepaths: list[str],
+) -> dict[str, tuple[Optional[ParsedAudioFile], bool]]:
+    rows = await TrackVerification.filter(
+        filepath__in=filepaths, backend=settings.FLAC_VERIFY_BACKEND
+    )
+    cached = {}
+    gone = []
+    for row in rows:
+        try:
+            current = fingerprint(row.filepath)
+        except OSError:
+            # Deleted or unreadable since: a miss, and the row is of no use
+            gone.append(row.filepath)
+            continue
+        if (row.size, row.mtime_ns, row.inode) != current:
+            continue
+        parsed = ParsedAudioFile(**row.parsed) if row.parsed is not None else None
+        cached[row.filepath] = (parsed, row.contents_ok)
+    if gone:
+        await TrackVerification.filter(filepath__in=gone).delete()
+    return cached
+
+
+async def store_inspection(
+    filepath: str, parsed: Optional[ParsedAudioFile], contents_ok: bool
+):
+    size, mtime_ns, inode = fingerprint(filepath)
+    await TrackVerification.update_or_create(
+        filepath=filepath,
+        defaults={
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "inode": inode,
+            "backend": settings.FLAC_VERIFY_BACKEND,
+            "parsed": parsed.dict() if parsed is not None else None,
+            "contents_ok": contents_ok,
+        },
+    )
+
+
+async def forget_album(album: Album):
+    await TrackVerification.filter(filepath__startswith=album.download_path).delete()
+
+
+async def iter_verifications(
+    album: Album, filepaths: list[str]
+) -> AsyncIterator[tuple[str, bool]]:
+    """Verifies all tracks of an album in parallel, yielding
+    ``(filepath, verified)`` as each track finishes. The event loop only
+    waits on the pool, it never decodes anything itself.
+
+    Decode results are cached per file and reused for as long as the file's
+    size, mtime and inode don't change, so only new or modified files are
+    decoded again. The metadata checks against the album are cheap and
+    always rerun. A file can be yielded again, as failed, when a later file
+    turns out to have the same track number."""
+    positions = TrackPositions(album)
+    cached = await cached_inspections(filepaths)
+    for filepath, (parsed, contents_ok) in cached.items():
+        for result in positions.verify(filepath, parsed, contents_ok):
+            yield result
+
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    futures = [
+        loop.run_in_executor(pool, inspect_track, filepath)
+        for filepath in filepaths
+        if filepath not in cached
+    ]
+    for future in asyncio.as_completed(futures):
+        filepath, parsed, contents_ok = await future
+        await store_inspection(filepath, parsed, contents_ok)
+        for result in positions.verify(filepath, parsed, contents_ok):
+            yield result
+
+
+class TrackPositions:
+    """Verifies the tracks of one album as they come in, one at a time.
+
+    Tracks are matched to the album's tracklist on their track number, so
+    on its own a file with the track number of another one passes. Every
+    file sharing a track number fails instead. With each track number in
+    1..len(album.tracks) (checked by verify_metadata) and as many files as
+    tracks (checked by downloaded_filepaths), unique numbers mean the files
+    cover the tracklist exactly."""
+
+    def __init__(self, album: Album):
+        self.album = album
+        self.files: dict[int, list[str]] = {}
+
+    def verify(
+        self, filepath: str, parsed: Optional[ParsedAudioFile], contents_ok: bool
+    ) -> list[tuple[str, bool]]:
+        """Returns the new results: this file's, or when its track number is
+        taken, a failure for every file with that number."""
+        if parsed is None:
+            return [(filepath, False)]
+        files = self.files.setdefault(parsed.position, [])
+        files.append(filepath)
+        if len(files) > 1:
+            print(f"Track number {parsed.position} found in several files: {files}")
+            return [(file, False) for file in files]
+        return [(filepath, is_verified(self.album, parsed, contents_ok))]
+
+
+def is_verified(
+    album: Album, parsed: Optional[ParsedAudioFile], contents_ok: bool
+) -> bool:
+    return parsed is not None and contents_ok and verify_metadata(album, parsed)
+
+
+async def verify_album(album: Album, filepaths: list[str]) -> dict[str, bool]:
+    results = {}
+    with ALBUM_STAGE_SECONDS.labels("verify").time():
+        async for filepath, verified in iter_verifications(album, filepaths):
+            results[filepath] = verified
+    return dict(sorted(results.items()))
+
+
+async def verify_and_hash(
+    album: Album, filepaths: list[str], torrent: torf.Torrent
+) -> dict[str, bool]:
+    """Verifies ``filepaths`` and hashes every file of ``torrent`` in a
+    single read of the album.
+
+    Each file is hashed on its own in the worker pool; the pieces spanning
+    two files are finished here from the bytes the workers send back. Sets
+    the torrent's piece hashes and returns the verifications like
+    verify_album. Verification results are stored in the cache but not read
+    from it: the files have to be read for hashing anyway.
+    """
+    started = time.perf_counter()
+    # torf normalizes the torrent's paths, "./downloads/a" becomes
+    # "downloads/a", so tracks are matched on their real path:
+    tracks = {os.path.realpath(filepath): filepath for filepath in filepaths}
+    offsets = file_offsets(torrent)
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    futures = [
+        loop.run_in_executor(
+            pool,
+            inspect_and_hash,
+            filepath,
+            offset,
+            torrent.piece_size,
+            os.path.realpath(filepath) in tracks,
+        )
+        for filepath, offset in offsets
+    ]
+
+    path = album.download_path
+    positions = TrackPositions(album)
+    parts = {}
+    results = {}
+    try:
+        for future in asyncio.as_completed(futures):
+            filepath, parsed, contents_ok, pieces = await future
+            parts[filepath] = pieces
+            hashing_progress.update(path, len(parts), len(offsets))
+            track = tracks.get(os.path.realpath(filepath))
+            if track is not None:
+                await store_inspection(track, parsed, contents_ok)
+                results.update(positions.verify(track, parsed, contents_ok))
+    finally:
+        hashing_progress.finish(path)
+
+    torrent.metainfo["info"]["pieces"] = join_piece_hashes(
+        [parts[filepath] for filepath, _ in offsets], torrent.piece_size
+    )
+    elapsed = time.perf_counter() - started
+    ALBUM_STAGE_SECONDS.labels("verify_and_hash").observe(elapsed)
+    return dict(sorted(results.items()))
@@ -0,0 +1,315 @@
+"""End to end crawler benchmark against the local Deezer stand-in.
+
+    python benchmarks/crawl.py [--artists 500] [--latency 0.02] [--json]
+
+Serves fakes/deezer.py in process through httpx.ASGITransport (no sockets,
+no network) and runs, against a fresh SQLite database:
+
+  fetch_albums   DeezerAPI.fetch_albums for --sample existing artists
+  crawl          DeezerCrawler.crawl_deezer over --artists ids, through the
+                 whole pipeline: frontier, fetch workers, filters, writes
+  recrawl        Recrawler over every artist the crawl stored, after the
+                 catalog has released new albums for --new-releases of them
+
+and reports requests/s, artists/s, database rows/s (over the time spent in
+DeezerCrawler.persist) and p50/p99 request latency. The catalog is generated
+from --seed and the limiter is off unless --rate is given, so runs on two
+commits measure the crawler and nothing else. --json prints one record per
+run, tagged with the commit, to keep alongside earlier results.
+
+Run from the backend folder so ``app`` and ``fakes`` are importable.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import statistics
+import subprocess
+
+from datetime import datetime
+from typing import Optional
+
+BACKEND_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_FOLDER)
+
+# Required by app.settings, none of them is used by the crawler:
+for key, value in {
+    "DOWNLOAD_FOLDER": tempfile.gettempdir(),
+    "DEEZER_ARL_COOKIE": "benchmark",
+    "REDACTED_API_KEY": "benchmark",
+    "REDACTED_ANNOUNCE_URL": "http://localhost/announce",
+    "REDACTED_API_URL": "http://localhost/ajax.php",
+    "QBITTORRENT_HOST": "localhost",
+    "QBITTORRENT_PORT": "8080",
+    "QBITTORRENT_USERNAME": "benchmark",
+    "QBITTORRENT_PASSWORD": "benchmark",
+}.items():
+    os.environ.setdefault(key, value)
+
+import httpx  # noqa: E402
+
+from tortoise import Tortoise  # noqa: E402
+
+from app.crawler import DeezerCrawler  # noqa: E402
+from app.recrawl import Recrawler  # noqa: E402
+from app.external import DeezerAPI  # noqa: E402
+from app.limiter import AdaptiveLimiter  # noqa: E402
+from app.models import Album, Artist, CrawlFrontier  # noqa: E402
+from app.settings import settings  # noqa: E402
+from fakes.deezer import FakeCatalog, FakeDeezerConfig, create_app  # noqa: E402
+
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    """Records how long every request takes to come back."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.latencies: list[float] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        self.latencies.append(time.perf_counter() - started)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def percentiles(latencies: list[float]) -> dict:
+    if len(latencies) < 2:
+        return {"p50_ms": None, "p99_ms": None}
+    cuts = statistics.quantiles(latencies, n=100)
+    return {"p50_ms": cuts[49] * 1000, "p99_ms": cuts[98] * 1000}
+
+
+def new_limiter(args) -> Optional[AdaptiveLimiter]:
+    if not args.rate:
+        return None
+    return AdaptiveLimiter(rate=args.rate, burst=args.burst, period=args.period)
+
+
+async def bench_fetch_albums(args, config: FakeDeezerConfig) -> dict:
+    catalog = FakeCatalog(config)
+    artist_ids = []
+    id = settings.DEEZER_ARTIST_START_ID
+    while len(artist_ids) < args.sample:
+        if catalog.artist_exists(id):
+            artist_ids.append(id)
+        id += 1
+
+    transport = TimedTransport(httpx.ASGITransport(app=create_app(config)))
+    api = DeezerAPI(new_limiter(args), cache=None)
+    async with httpx.AsyncClient(transport=transport) as client:
+        started = time.perf_counter()
+        albums = 0
+        for artist_id in artist_ids:
+            albums += len(await api.fetch_albums(client, artist_id))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "artists": len(artist_ids),
+        "albums": albums,
+        "requests": len(transport.latencies),
+        "seconds": elapsed,
+        "requests_per_s": len(transport.latencies) / elapsed,
+        "albums_per_s": albums / elapsed,
+        **percentiles(transport.latencies),
+    }
+
+
+async def bench_crawl(args, config: FakeDeezerConfig) -> dict[str, dict]:
+    settings.DEEZER_CACHE_ENABLED = False
+    settings.DEEZER_QUEUE_LIMIT = 10**9
+    settings.MAX_CRAWLS_PER_RUN = args.artists
+    if args.workers:
+        settings.CRAWL_FETCH_WORKERS = args.workers
+
+    with tempfile.TemporaryDirectory() as folder:
+        await Tortoise.init(
+            db_url="sqlite://" + os.path.join(folder, "crawl.sqlite"),
+            modules={"models": ["app.models"]},
+        )
+        await Tortoise.generate_schemas()
+        app = create_app(config)
+        try:
+            return {
+                "crawl": await run_crawl(args, app),
+                "recrawl": await run_recrawl(args, app),
+            }
+        finally:
+            await Tortoise.close_connections()
+
+
+async def run_crawl(args, app) -> dict:
+    crawler = DeezerCrawler()
+    crawler.limiter = crawler.deezer_api.limiter = new_limiter(args)
+
+    # Time spent writing, to report database throughput on its own:
+    write_seconds = 0.0
+    persist = crawler.persist
+
+    async def timed_persist(batch):
+        nonlocal write_seconds
+        started = time.perf_counter()
+        try:
+            return await persist(batch)
+        finally:
+            write_seconds += time.perf_counter() - started
+
+    crawler.persist = timed_persist  # type: ignore
+
+    transport = TimedTransport(httpx.ASGITransport(app=app))
+    output = contextlib.nullcontext() if args.verbose else quiet()
+    async with httpx.AsyncClient(transport=transport) as client:
+        started = time.perf_counter()
+        with output:
+            stats = await crawler.crawl_deezer(client)
+        elapsed = time.perf_counter() - started
+
+    artists = await Artist.all().count()
+    albums = await Album.all().count()
+    frontier = await CrawlFrontier.all().count()
+    rows = artists + albums + frontier
+    return {
+        "ids": args.artists,
+        "artists": artists,
+        "albums": albums,
+        "requests": len(transport.latencies),
+        "quota_errors": app.state.stats.quota_errors,
+        "fetch_errors": stats.fetch_errors,
+        "seconds": elapsed,
+        "requests_per_s": len(transport.latencies) / elapsed,
+        "artists_per_s": artists / elapsed,
+        "rows": rows,
+        "write_seconds": write_seconds,
+        "rows_per_s": rows / write_seconds if write_seconds else None,
+        **percentiles(transport.latencies),
+    }
+
+
+async def run_recrawl(args, app) -> dict:
+    app.state.catalog.advance()
+    artists = await Artist.all().count()
+    albums_before = await Album.all().count()
+    await Artist.all().update(next_check=datetime.now())
+
+    crawler = DeezerCrawler()
+    crawler.limiter = crawler.deezer_api.limiter = new_limiter(args)
+    recrawler = Recrawler(crawler, budget=artists)
+    transport = TimedTransport(httpx.ASGITransport(app=app))
+    output = contextlib.nullcontext() if args.verbose else quiet()
+    async with httpx.AsyncClient(transport=transport) as client:
+        started = time.perf_counter()
+        with output:
+            await recrawler.run(client)
+        elapsed = time.perf_counter() - started
+
+    requests = len(transport.latencies)
+    return {
+        "artists": recrawler.checked,
+        "failed": recrawler.failed,
+        "new_albums": await Album.all().count() - albums_before,
+        "requests": requests,
+        "requests_per_artist": requests / max(recrawler.checked, 1),
+        "seconds": elapsed,
+        "requests_per_s": requests / elapsed,
+        "artists_per_s": recrawler.checked / elapsed,
+        **percentiles(transport.latencies),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    # The crawler prints a line per artist
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_FOLDER,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(name: str, result: dict):
+    def fmt(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    rates = "  ".join(
+        f"{key.removesuffix('_per_s')}/s {fmt(value)}"
+        for key, value in result.items()
+        if key.endswith("_per_s")
+    )
+    print(
+        f"{name:<13} {result['requests']:>6} requests in {result['seconds']:.2f}s"
+        f"  {rates}  p50 {fmt(result['p50_ms'])} ms  p99 {fmt(result['p99_ms'])} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--artists", type=int, default=500)
+    parser.add_argument("--sample", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--missing", type=float, default=0.3)
+    parser.add_argument("--quota-errors", type=float, default=0.0)
+    parser.add_argument("--new-releases", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=0, help="0: no limiter")
+    parser.add_argument("--burst", type=int, default=settings.DEEZER_API_BURST)
+    parser.add_argument(
+        "--period", type=float, default=settings.DEEZER_API_BURST_PERIOD
+    )
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    config = FakeDeezerConfig(
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        missing=args.missing,
+        quota_errors=args.quota_errors,
+        new_releases=args.new_releases,
+    )
+    results = {
+        "fetch_albums": await bench_fetch_albums(args, config),
+        **await bench_crawl(args, config),
+    }
+
+    if args.json:
+        record = {"commit": commit(), "args": vars(args), "results": results}
+        print(json.dumps(record))
+        return
+    for name, result in results.items():
+        report(name, result)
+    crawl = results["crawl"]
+    print(
+        f"\n{crawl['artists']} artists and {crawl['albums']} albums written, "
+        f"{crawl['rows']} rows in {crawl['write_seconds']:.2f}s of writes"
+    )
+    recrawl = results["recrawl"]
+    print(
+        f"{recrawl['artists']} artists rechecked with "
+        f"{recrawl['requests_per_artist']:.2f} requests each, "
+        f"{recrawl['new_albums']} new albums found"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
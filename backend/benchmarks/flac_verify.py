@@ -0,0 +1,96 @@
+"""Compares the two FLAC verification backends on real files.
+
+    python benchmarks/flac_verify.py ~/Music/some-album/ [--repeat 3]
+
+Times ``flac -t`` (one subprocess per file) against the in-process decoder
+in app/flac.py and checks that both agree on every file. Run from the
+backend folder so ``app`` is importable.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.flac import verify_flac, verify_native  # noqa: E402
+
+
+def streaminfo_md5(filepath: str) -> str:
+    # STREAMINFO is always the first metadata block: "fLaC", a 4 byte block
+    # header, then 34 bytes of which the last 16 are the MD5.
+    with open(filepath, "rb") as f:
+        header = f.read(42)
+    if header[:4] != b"fLaC":
+        raise ValueError(f"{filepath} is not a FLAC file")
+    return header[26:42].hex()
+
+
+def collect(paths: list[str]) -> list[str]:
+    filepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                filepaths.extend(
+                    os.path.join(root, name)
+                    for name in sorted(filenames)
+                    if name.endswith(".flac")
+                )
+        else:
+            filepaths.append(path)
+    return filepaths
+
+
+def timed(func, *args) -> tuple[bool, float]:
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    filepaths = collect(args.paths)
+    if not filepaths:
+        parser.error("no .flac files found")
+
+    totals = {"flac": 0.0, "native": 0.0}
+    mismatches = 0
+    for filepath in filepaths:
+        md5 = streaminfo_md5(filepath)
+        size_mb = os.path.getsize(filepath) / 1_000_000
+        timings: dict[str, list[float]] = {"flac": [], "native": []}
+        results = {}
+        for _ in range(args.repeat):
+            results["flac"], elapsed = timed(verify_flac, filepath)
+            timings["flac"].append(elapsed)
+            results["native"], elapsed = timed(verify_native, filepath, md5)
+            timings["native"].append(elapsed)
+
+        medians = {name: statistics.median(t) for name, t in timings.items()}
+        for name, median in medians.items():
+            totals[name] += median
+        agree = results["flac"] == results["native"]
+        mismatches += not agree
+        print(
+            f"{os.path.basename(filepath)[:48]:<48} {size_mb:7.1f} MB"
+            f"  flac {medians['flac'] * 1000:8.1f} ms"
+            f"  native {medians['native'] * 1000:8.1f} ms"
+            f"  {'ok' if results['native'] else 'FAILED'}"
+            f"{'' if agree else '  (backends disagree)'}"
+        )
+
+    print(
+        f"\n{len(filepaths)} files: flac {totals['flac']:.2f} s, "
+        f"native {totals['native']:.2f} s "
+        f"({totals['flac'] / totals['native']:.2f}x), "
+        f"{mismatches} disagreements"
+    )
+
+
+if __name__ == "__main__":
+    main()
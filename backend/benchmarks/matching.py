@@ -0,0 +1,93 @@
+"""Times duplicate detection of a discography against tracker search results.
+
+    python benchmarks/matching.py [--albums 50] [--groups 500] [--repeat 5]
+
+Generates album titles and tracker groups (some of them the same releases
+with edition suffixes, typos or different punctuation), then times
+app.matching.Matcher against scoring every pair with the scalar edit
+distance, and checks both find the same matches. Run from the backend
+folder so ``app`` is importable.
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.matching import MIN_SCORE, Matcher, levenshtein_distance, normalize  # noqa
+
+SUFFIXES = (" (Deluxe Edition)", " (Remastered)", " - EP", " [Live]")
+
+
+def random_title(rng: random.Random) -> str:
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        for _ in range(rng.randint(1, 6))
+    ]
+    return " ".join(words).title()
+
+
+def variant(rng: random.Random, title: str) -> str:
+    change = rng.randrange(3)
+    if change == 0:
+        return title + rng.choice(SUFFIXES)
+    if change == 1:
+        typo = rng.randrange(len(title))
+        return title[:typo] + rng.choice(string.ascii_lowercase) + title[typo + 1 :]
+    return title.upper().replace(" ", ", ")
+
+
+def brute_force(queries: list[str], candidates: list[str]) -> list[float]:
+    best = []
+    for query in map(normalize, queries):
+        score = 0.0
+        for candidate in map(normalize, candidates):
+            n = max(len(query), len(candidate))
+            close = (n - levenshtein_distance(query, candidate)) / n if n else 1.0
+            score = max(score, close if close >= MIN_SCORE else 0.0)
+        best.append(score)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--albums", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    albums = [random_title(rng) for _ in range(args.albums)]
+    groups = [random_title(rng) for _ in range(args.groups - args.albums // 2)]
+    groups += [variant(rng, title) for title in rng.sample(albums, args.albums // 2)]
+    rng.shuffle(groups)
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        matches = Matcher(albums).best_matches(groups)
+        timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    expected = brute_force(groups, albums)
+    scalar = time.perf_counter() - started
+
+    mismatches = sum(
+        abs(score - want) > 1e-9 for (_, score), want in zip(matches, expected)
+    )
+    found = sum(row is not None for row, _ in matches)
+    print(
+        f"{args.albums} albums x {len(groups)} groups: "
+        f"matcher {min(timings) * 1000:.1f} ms, "
+        f"pairwise scalar {scalar * 1000:.0f} ms "
+        f"({scalar / min(timings):.0f}x), "
+        f"{found} matches, {mismatches} disagreements"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Query plans and latencies of the review queue queries.
+
+Builds a synthetic SQLite database shaped like app.models (the schema below
+mirrors what Tortoise generates for Artist and Album) and times the queue
+queries as they were written before and after the ``eligible`` flag and the
+composite indexes:
+
+    python benchmarks/queue_queries.py --albums 1000000
+
+Only needs the standard library. The database is cached at --path so later
+runs skip the (slow) data generation.
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+import statistics
+
+from datetime import date, timedelta
+
+
+SCHEMA = """
+CREATE TABLE artist (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    disabled INT NOT NULL DEFAULT 0
+);
+CREATE TABLE album (
+    id INTEGER PRIMARY KEY,
+    artist_id INT NOT NULL REFERENCES artist (id),
+    title TEXT NOT NULL,
+    release_date DATE NOT NULL,
+    record_type VARCHAR(7) NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    eligible INT NOT NULL DEFAULT 1,
+    tracks JSON NOT NULL
+);
+"""
+
+# Same column lists as app.models.Album.Meta.indexes
+INDEXES = """
+CREATE INDEX idx_album_status_release ON album (status, release_date);
+CREATE INDEX idx_album_eligible_status_release ON album (eligible, status, release_date);
+CREATE INDEX idx_album_artist_id ON album (artist_id);
+"""
+
+RECORD_TYPES = ["album"] * 4 + ["ep"] * 2 + ["compile"] + ["single"] * 3
+# Nearly everything a long running crawl has seen ends up disabled or
+# uploaded; only a sliver is waiting in the queue.
+STATUSES = ["disabled"] * 90 + ["uploaded"] * 6 + ["reviewed", "downloaded"] + ["added"] * 2
+
+QUERIES = {
+    "queue size (join)": """
+        SELECT COUNT(*) FROM album
+        LEFT OUTER JOIN artist ON artist.id = album.artist_id
+        WHERE album.status = 'added'
+        AND NOT (artist.disabled = 1 AND album.record_type = 'single')
+    """,
+    "queue size (eligible)": """
+        SELECT COUNT(*) FROM album WHERE eligible = 1 AND status = 'added'
+    """,
+    "status page (join)": """
+        SELECT album.* FROM album
+        LEFT OUTER JOIN artist ON artist.id = album.artist_id
+        WHERE album.status = 'added'
+        AND NOT (artist.disabled = 1 AND album.record_type = 'single')
+        ORDER BY album.release_date DESC LIMIT 50 OFFSET 0
+    """,
+    "status page (eligible)": """
+        SELECT * FROM album WHERE eligible = 1 AND status = 'added'
+        ORDER BY release_date DESC LIMIT 50 OFFSET 0
+    """,
+    "ready page (eligible)": """
+        SELECT * FROM album WHERE eligible = 1
+        AND status IN ('reviewed', 'downloaded')
+        ORDER BY release_date DESC LIMIT 50 OFFSET 0
+    """,
+    "artist albums": """
+        SELECT * FROM album WHERE artist_id = 4242
+    """,
+}
+
+
+def generate(db: sqlite3.Connection, num_albums: int, seed: int = 0):
+    rng = random.Random(seed)
+    num_artists = max(1, num_albums // 8)
+    db.executescript(SCHEMA)
+    db.executemany(
+        "INSERT INTO artist (id, name, disabled) VALUES (?, ?, ?)",
+        (
+            (id, f"Artist {id}", int(rng.random() < 0.05))
+            for id in range(1, num_artists + 1)
+        ),
+    )
+    disabled = {
+        id for (id,) in db.execute("SELECT id FROM artist WHERE disabled = 1")
+    }
+
+    start = date(1990, 1, 1)
+
+    def albums():
+        for id in range(1, num_albums + 1):
+            artist_id = rng.randint(1, num_artists)
+            record_type = rng.choice(RECORD_TYPES)
+            eligible = record_type != "single" and artist_id not in disabled
+            yield (
+                id,
+                artist_id,
+                f"Album {id}",
+                (start + timedelta(days=rng.randint(0, 12_000))).isoformat(),
+                record_type,
+                rng.choice(STATUSES),
+                int(eligible),
+                '[{"id": 1, "title": "Track", "position": 1, "duration_seconds": 200}]',
+            )
+
+    db.executemany("INSERT INTO album VALUES (?, ?, ?, ?, ?, ?, ?, ?)", albums())
+    db.commit()
+
+
+def drop_indexes(db: sqlite3.Connection):
+    for (name,) in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+    ).fetchall():
+        db.execute(f"DROP INDEX {name}")
+    db.commit()
+
+
+def time_query(db: sqlite3.Connection, sql: str, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.execute(sql).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(db: sqlite3.Connection, label: str, repeat: int):
+    print(f"\n== {label} ==")
+    for name, sql in QUERIES.items():
+        plan = [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        timings = time_query(db, sql, repeat)
+        print(
+            f"{name:<24} median {statistics.median(timings):9.2f} ms"
+            f"  max {max(timings):9.2f} ms"
+        )
+        for step in plan:
+            print(f"    {step}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--albums", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--path", default=None)
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(
+        os.path.dirname(__file__), f"queue_queries_{args.albums}.sqlite"
+    )
+    exists = os.path.exists(path)
+    db = sqlite3.connect(path)
+    if not exists:
+        print(f"Generating {args.albums} albums into {path}...")
+        generate(db, args.albums)
+
+    drop_indexes(db)
+    db.execute("ANALYZE")
+    report(db, "without indexes", args.repeat)
+
+    db.executescript(INDEXES)
+    db.execute("ANALYZE")
+    report(db, "with indexes", args.repeat)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
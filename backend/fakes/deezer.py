@@ -0,0 +1,265 @@
+"""A local stand-in for api.deezer.com, serving synthetic catalog data.
+
+    python -m fakes.deezer [--port 8100] [--latency 0.05] [--missing 0.3]
+
+Serves the four endpoints the crawler uses (artist, artist albums, album,
+track). Payloads are generated from the id and the seed, so the same id
+always returns the same data. Some artist ids are missing (Deezer's error
+800) and some requests can be answered with the quota error, to exercise
+the crawler's retries. FakeCatalog.advance() (or POST /_advance) releases
+new albums for a share of the artists, to exercise re-checking known
+artists. Point DEEZER_API_URL at it to crawl offline.
+
+In process it is an ASGI app for httpx.ASGITransport, see
+benchmarks/crawl.py. Run from the backend folder.
+"""
+import random
+import asyncio
+import argparse
+import collections
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Optional
+
+from fastapi import FastAPI, Request
+
+
+MISSING = {"error": {"type": "DataException", "message": "no data", "code": 800}}
+QUOTA = {"error": {"type": "Exception", "message": "Quota limit exceeded", "code": 4}}
+
+IMAGES_URL = "https://e-cdns-images.dzcdn.net/images"
+GENRES = ["Pop", "Rock", "Rap/Hip Hop", "Electro", "Jazz", "Classical"]
+RECORD_TYPES = ["album", "ep", "single", "compile"]
+
+
+@dataclass
+class FakeDeezerConfig:
+    seed: int = 0
+    # Seconds every response is delayed by, plus up to ``jitter`` more:
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Share of artist ids that don't exist:
+    missing: float = 0.3
+    # Share of requests answered with the quota error:
+    quota_errors: float = 0.0
+    albums_per_artist: tuple[int, int] = (1, 12)
+    tracks_per_album: tuple[int, int] = (1, 16)
+    # Share of albums without genres, which the crawler disables:
+    no_genres: float = 0.1
+    # Release dates are spread over this many days before today:
+    release_days: int = 3 * 365
+    # Share of artists with a new album after each advance():
+    new_releases: float = 0.1
+    # Albums per page of an artist's listing, unless ``limit`` is given:
+    page_size: int = 25
+
+
+@dataclass
+class FakeDeezerStats:
+    requests: collections.Counter = field(default_factory=collections.Counter)
+    quota_errors: int = 0
+
+    def info(self) -> dict:
+        return {
+            "requests": sum(self.requests.values()),
+            "by_endpoint": dict(self.requests),
+            "quota_errors": self.quota_errors,
+        }
+
+
+class FakeCatalog:
+    """Deterministic synthetic catalog: album ids are ``artist id * 100 +
+    n`` and track ids ``album id * 100 + n``, so every payload can be
+    generated from its id alone."""
+
+    def __init__(self, config: FakeDeezerConfig):
+        self.config = config
+        self.epoch = 0
+
+    def rng(self, kind: str, id: int) -> random.Random:
+        return random.Random(f"{self.config.seed}:{kind}:{id}")
+
+    def artist_exists(self, id: int) -> bool:
+        return self.rng("exists", id).random() >= self.config.missing
+
+    def advance(self):
+        self.epoch += 1
+
+    def first_albums(self, artist_id: int) -> int:
+        return self.rng("albums", artist_id).randint(*self.config.albums_per_artist)
+
+    def album_ids(self, artist_id: int) -> list[int]:
+        count = self.first_albums(artist_id)
+        for epoch in range(1, self.epoch + 1):
+            if self.rng(f"new{epoch}", artist_id).random() < self.config.new_releases:
+                count += 1
+        return [artist_id * 100 + n for n in range(count)]
+
+    def artist(self, id: int) -> dict:
+        rng = self.rng("artist", id)
+        return {
+            "id": id,
+            "name": f"Artist {id}",
+            "link": f"https://www.deezer.com/artist/{id}",
+            "picture": f"{IMAGES_URL}/artist/{id:032x}/56x56.jpg",
+            "nb_album": len(self.album_ids(id)),
+            "nb_fan": int(rng.paretovariate(1.2) * 10),
+            "type": "artist",
+        }
+
+    def artist_albums(self, id: int, index: int, limit: int) -> dict:
+        album_ids = self.album_ids(id)
+        data = [
+            {
+                "id": album_id,
+                "title": f"Album {album_id}",
+                "release_date": self.release_date(album_id).isoformat(),
+                "record_type": self.record_type(album_id),
+                "type": "album",
+            }
+            for album_id in album_ids[index : index + limit]
+        ]
+        page = {"data": data, "total": len(album_ids)}
+        if index + limit < len(album_ids):
+            page["next"] = f"/artist/{id}/albums?index={index + limit}&limit={limit}"
+        return page
+
+    def record_type(self, album_id: int) -> str:
+        return self.rng("record_type", album_id).choice(RECORD_TYPES)
+
+    def release_date(self, album_id: int) -> date:
+        # Albums released by advance() come out today
+        if album_id % 100 >= self.first_albums(album_id // 100):
+            return date.today()
+        days = self.rng("released", album_id).randrange(self.config.release_days)
+        return date.today() - timedelta(days=days)
+
+    def album(self, id: int) -> dict:
+        rng = self.rng("album", id)
+        artist_id = id // 100
+        genres = []
+        if rng.random() >= self.config.no_genres:
+            genres = [{"id": 0, "name": name} for name in rng.sample(GENRES, 2)]
+        tracks = [
+            {
+                "id": id * 100 + n,
+                "title": f"Track {n + 1}",
+                "duration": rng.randint(90, 420),
+                "type": "track",
+            }
+            for n in range(rng.randint(*self.config.tracks_per_album))
+        ]
+        return {
+            "id": id,
+            "title": f"Album {id}",
+            "upc": f"{id:013d}",
+            "cover_medium": f"{IMAGES_URL}/cover/{id:032x}/250x250.jpg",
+            "genres": {"data": genres},
+            "label": rng.choice(["Fake Records", "Synthetic Music", "Label 12345"]),
+            "nb_tracks": len(tracks),
+            "release_date": self.release_date(id).isoformat(),
+            "record_type": self.record_type(id),
+            "contributors": [
+                {"id": artist_id, "name": f"Artist {artist_id}", "role": "Main"}
+            ],
+            "artist": {"id": artist_id, "name": f"Artist {artist_id}"},
+            "tracks": {"data": tracks},
+            "type": "album",
+        }
+
+    def track(self, id: int) -> dict:
+        album_id = id // 100
+        # The physical release is at most a few weeks before the digital one
+        released = self.release_date(album_id)
+        released -= timedelta(days=self.rng("physical", album_id).randrange(30))
+        return {
+            "id": id,
+            "title": f"Track {id % 100 + 1}",
+            "track_position": id % 100 + 1,
+            "album": {"id": album_id, "release_date": released.isoformat()},
+            "type": "track",
+        }
+
+
+def create_app(config: FakeDeezerConfig) -> FastAPI:
+    app = FastAPI()
+    catalog = FakeCatalog(config)
+    stats = FakeDeezerStats()
+    quota = random.Random(config.seed)
+    app.state.config = config
+    app.state.catalog = catalog
+    app.state.stats = stats
+
+    async def respond(endpoint: str, payload):
+        stats.requests[endpoint] += 1
+        if config.latency or config.jitter:
+            await asyncio.sleep(config.latency + quota.uniform(0, config.jitter))
+        if config.quota_errors and quota.random() < config.quota_errors:
+            stats.quota_errors += 1
+            return QUOTA
+        return payload()
+
+    @app.get("/artist/{id}")
+    async def get_artist(id: int):
+        if not catalog.artist_exists(id):
+            return await respond("artist", lambda: MISSING)
+        return await respond("artist", lambda: catalog.artist(id))
+
+    @app.get("/artist/{id}/albums")
+    async def get_artist_albums(
+        request: Request, id: int, index: int = 0, limit: Optional[int] = None
+    ):
+        def page():
+            data = catalog.artist_albums(id, index, limit or config.page_size)
+            if "next" in data:
+                data["next"] = str(request.base_url).rstrip("/") + data["next"]
+            return data
+
+        return await respond("artist_albums", page)
+
+    @app.get("/album/{id}")
+    async def get_album(id: int):
+        return await respond("album", lambda: catalog.album(id))
+
+    @app.get("/track/{id}")
+    async def get_track(id: int):
+        return await respond("track", lambda: catalog.track(id))
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats.info()
+
+    @app.post("/_advance")
+    async def advance():
+        catalog.advance()
+        return {"epoch": catalog.epoch}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--missing", type=float, default=0.3)
+    parser.add_argument("--quota-errors", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeDeezerConfig(
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        missing=args.missing,
+        quota_errors=args.quota_errors,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
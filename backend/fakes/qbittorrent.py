@@ -0,0 +1,221 @@
+"""A stand-in for the qBittorrent WebUI API, enough of it for this app.
+
+    python -m fakes.qbittorrent [--port 8080] [--session-lifetime 60]
+
+Point QBITTORRENT_HOST/QBITTORRENT_PORT at it to upload without a real
+client. It implements login/logout, the version endpoints qbittorrentapi
+checks after logging in, torrents/add (with any number of files) and
+torrents/info. Every endpoint but login answers 403 without a valid SID
+cookie, like qBittorrent does. Sessions can be made to expire after
+``--session-lifetime`` seconds, or all at once with expire_sessions(), to
+exercise logging in again.
+
+Run from the backend folder. It only needs the standard library and torf.
+"""
+import io
+import json
+import time
+import secrets
+import argparse
+import threading
+
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import cookies
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import torf
+
+
+API = "/api/v2"
+
+
+class FakeQBittorrent(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        username: str = "admin",
+        password: str = "adminadmin",
+        session_lifetime: Optional[float] = None,
+    ):
+        super().__init__(address, Handler)
+        self.username = username
+        self.password = password
+        self.session_lifetime = session_lifetime
+        self.sessions: dict[str, float] = {}
+        self.torrents: dict[str, dict] = {}
+        self.logins = 0
+        self.add_requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def login(self, username: str, password: str) -> Optional[str]:
+        if (username, password) != (self.username, self.password):
+            return None
+        sid = secrets.token_urlsafe(24)
+        with self.lock:
+            self.sessions[sid] = time.monotonic()
+            self.logins += 1
+        return sid
+
+    def authorized(self, sid: Optional[str]) -> bool:
+        with self.lock:
+            started = self.sessions.get(sid) if sid else None
+            if started is None:
+                return False
+            lifetime = self.session_lifetime
+            if lifetime is not None and time.monotonic() - started > lifetime:
+                del self.sessions[sid]
+                return False
+            return True
+
+    def expire_sessions(self):
+        with self.lock:
+            self.sessions.clear()
+
+    def add(self, files: list[bytes], category: str, tags: str) -> bool:
+        added = []
+        for data in files:
+            try:
+                torrent = torf.Torrent.read_stream(io.BytesIO(data))
+            except torf.TorfError:
+                return False
+            added.append(
+                {
+                    "hash": torrent.infohash,
+                    "name": torrent.name,
+                    "size": torrent.size,
+                    "category": category,
+                    "tags": tags,
+                    "state": "stalledUP",
+                    "progress": 1,
+                }
+            )
+        with self.lock:
+            self.add_requests += 1
+            for info in added:
+                self.torrents[info["hash"]] = info
+        return True
+
+    def serve_in_thread(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: FakeQBittorrent
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def dispatch(self):
+        path = urlparse(self.path).path
+        if path == f"{API}/auth/login":
+            return self.auth_login()
+        if not self.server.authorized(self.sid()):
+            return self.reply(403, "Forbidden")
+
+        if path == f"{API}/auth/logout":
+            with self.server.lock:
+                self.server.sessions.pop(self.sid(), None)
+            return self.reply(200, "")
+        if path == f"{API}/app/version":
+            return self.reply(200, "v4.5.2")
+        if path == f"{API}/app/webapiVersion":
+            return self.reply(200, "2.8.19")
+        if path == f"{API}/torrents/add":
+            return self.torrents_add()
+        if path == f"{API}/torrents/info":
+            torrents = list(self.server.torrents.values())
+            return self.reply(200, json.dumps(torrents), "application/json")
+        self.reply(404, "Not Found")
+
+    def auth_login(self):
+        form = parse_qs(self.body().decode())
+        sid = self.server.login(
+            form.get("username", [""])[0], form.get("password", [""])[0]
+        )
+        if sid is None:
+            return self.reply(200, "Fails.")
+        self.reply(200, "Ok.", headers={"Set-Cookie": f"SID={sid}; HttpOnly; path=/"})
+
+    def torrents_add(self):
+        files, fields = [], {}
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + self.body()
+            )
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if part.get_filename() is not None:
+                    files.append(part.get_payload(decode=True))
+                else:
+                    fields[name] = part.get_content().strip()
+        if not files:
+            return self.reply(200, "Fails.")
+        ok = self.server.add(files, fields.get("category", ""), fields.get("tags", ""))
+        self.reply(200, "Ok." if ok else "Fails.")
+
+    def sid(self) -> Optional[str]:
+        cookie = cookies.SimpleCookie(self.headers.get("Cookie", ""))
+        return cookie["SID"].value if "SID" in cookie else None
+
+    def body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def reply(
+        self,
+        code: int,
+        body: str,
+        content_type: str = "text/plain; charset=UTF-8",
+        headers: Optional[dict[str, str]] = None,
+    ):
+        data = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="adminadmin")
+    parser.add_argument("--session-lifetime", type=float, default=None)
+    args = parser.parse_args()
+
+    server = FakeQBittorrent(
+        (args.host, args.port),
+        username=args.username,
+        password=args.password,
+        session_lifetime=args.session_lifetime,
+    )
+    print(f"Fake qBittorrent WebUI on http://{args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import asyncio
+import tempfile
+
+import pytest
+
+# Required by app.settings. Set before any test module imports the app:
+for key, value in {
+    "DOWNLOAD_FOLDER": tempfile.gettempdir(),
+    "DEEZER_ARL_COOKIE": "test",
+    "DEEZER_CACHE_ENABLED": "false",
+    "REDACTED_API_KEY": "test",
+    "REDACTED_ANNOUNCE_URL": "http://localhost/announce",
+    "REDACTED_API_URL": "http://localhost/ajax.php",
+    "QBITTORRENT_HOST": "localhost",
+    "QBITTORRENT_PORT": "8080",
+    "QBITTORRENT_USERNAME": "admin",
+    "QBITTORRENT_PASSWORD": "adminadmin",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+@pytest.fixture
+def run_in_db(tmp_path):
+    """Runs an async test body against a fresh SQLite database. The schema
+    is only generated when ``schema`` is set, migration tests build their
+    own."""
+    from tortoise import Tortoise
+
+    def run(body, schema: bool = True):
+        async def main():
+            await Tortoise.init(
+                db_url=f"sqlite://{tmp_path / 'db.sqlite'}",
+                modules={"models": ["app.models"]},
+            )
+            try:
+                if schema:
+                    await Tortoise.generate_schemas()
+                return await body()
+            finally:
+                await Tortoise.close_connections()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,39 @@
+from datetime import date
+
+from app.models import RecordType
+from app.schemas import DeezerAlbum, DeezerArtist
+
+
+def deezer_artist(id: int, **fields) -> DeezerArtist:
+    return DeezerArtist(
+        **{
+            "id": id,
+            "name": f"Artist {id}",
+            "image_url": "https://cdn-images.dzcdn.net/images/cover.jpg",
+            "nb_album": 1,
+            "nb_fan": 100,
+            **fields,
+        }
+    )
+
+
+def deezer_album(id: int, artist_id: int, **fields) -> DeezerAlbum:
+    release_date = fields.pop("release_date", date.today())
+    return DeezerAlbum(
+        **{
+            "id": id,
+            "artist_id": artist_id,
+            "title": f"Album {id}",
+            "image_url": "https://cdn-images.dzcdn.net/images/cover.jpg",
+            "digital_release_date": release_date,
+            "release_date": release_date,
+            "record_type": RecordType.Album,
+            "genres": ["Pop"],
+            "label": "Label",
+            "tracks": [],
+            "contributors": {},
+            "upc": str(id),
+            "folder_name": f"Artist {artist_id} - Album {id}",
+            **fields,
+        }
+    )
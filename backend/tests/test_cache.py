@@ -0,0 +1,113 @@
+import time
+import asyncio
+import threading
+
+import httpx
+
+import app
+from app.cache import ENDPOINT_TTLS, ResponseCache
+
+URL = "https://api.deezer.com/album/302127"
+
+
+def response(body: bytes) -> httpx.Response:
+    return httpx.Response(200, content=body, request=httpx.Request("GET", URL))
+
+
+def last_access(cache: ResponseCache, url: str) -> float:
+    (accessed,) = cache.db.execute(
+        "SELECT last_access FROM response WHERE url = ?", (url,)
+    ).fetchone()
+    return accessed
+
+
+def test_hits_write_access_times_in_batches(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20)
+    monkeypatch.setattr(cache, "TOUCH_BATCH", 2)
+    monkeypatch.setattr(cache, "TOUCH_INTERVAL", 3600)
+    other = URL.replace("302127", "1")
+    cache.store(URL, response(b'{"id": 302127}'))
+    cache.store(other, response(b'{"id": 1}'))
+    stored = last_access(cache, URL)
+
+    assert cache.lookup(URL) is not None
+    assert cache.lookup(URL) is not None
+    assert last_access(cache, URL) == stored
+    assert cache.lookup(other) is not None
+    assert last_access(cache, URL) > stored
+
+
+def test_evicts_by_pending_access_times(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=30)
+    monkeypatch.setattr(cache, "TOUCH_INTERVAL", 3600)
+    first, second = URL, URL.replace("302127", "1")
+    cache.store(first, response(b'{"id": 302127}'))
+    cache.store(second, response(b'{"id": 1}'))
+    # Only in memory, but still makes the first one the most recent:
+    assert cache.lookup(first) is not None
+    cache.store(URL.replace("302127", "2"), response(b'{"id": 2}'))
+    assert cache.lookup(first) is not None
+    assert cache.lookup(second) is None
+
+
+def test_run_calls_on_the_cache_thread(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20)
+
+    async def main():
+        await cache.run(cache.store, URL, response(b'{"id": 302127}'))
+        entry = await cache.run(cache.lookup, URL)
+        thread = await cache.run(lambda: threading.current_thread().name)
+        return entry, thread
+
+    entry, thread = asyncio.run(main())
+    assert entry.body == b'{"id": 302127}'
+    assert thread.startswith("deezer-cache")
+
+
+def test_entries_persist_across_restarts(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path, max_bytes=1 << 20)
+    cache.store(URL, response(b'{"id": 302127}'))
+    later = time.time() + 60
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.lookup(URL) is not None
+    cache.close()
+
+    reopened = ResponseCache(path, max_bytes=1 << 20)
+    entry = reopened.lookup(URL)
+    assert entry is not None and entry.fresh
+    assert entry.body == b'{"id": 302127}'
+    assert reopened.info()["bytes"] == len(b'{"id": 302127}')
+    # The hit before closing was flushed rather than lost:
+    assert last_access(reopened, URL) == later
+
+
+def test_entries_expire_across_restarts(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path, max_bytes=1 << 20)
+    cache.store(URL, response(b'{"id": 302127}'))
+    cache.close()
+
+    later = time.time() + ENDPOINT_TTLS["album"] + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    reopened = ResponseCache(path, max_bytes=1 << 20)
+    entry = reopened.lookup(URL)
+    # Still returned, for revalidation, but counted as a miss:
+    assert entry is not None and not entry.fresh
+    assert (reopened.stats.hits, reopened.stats.misses) == (0, 1)
+
+    offline = ResponseCache(path, max_bytes=1 << 20, offline=True)
+    assert offline.lookup(URL) is not None
+    assert offline.stats.hits == 1
+
+
+def test_shutdown_closes_cache_off_the_event_loop(monkeypatch):
+    threads = []
+    monkeypatch.setattr(
+        app.deezer_cache,
+        "close",
+        lambda: threads.append(threading.current_thread()),
+    )
+    monkeypatch.setattr(app, "shutdown_pool", lambda: None)
+    asyncio.run(app.close_resources())
+    assert threads and threads[0] is not threading.main_thread()
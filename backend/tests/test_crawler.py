@@ -0,0 +1,25 @@
+from app.crawler import DeezerCrawler
+from app.models import Album, Artist, CrawlFrontier, CrawlState
+from app.pipeline import CrawlBatch
+
+from tests.factories import deezer_album, deezer_artist
+
+
+def test_persist_skips_albums_of_artists_not_stored(run_in_db):
+    async def body():
+        crawler = DeezerCrawler()
+        ids = await crawler.frontier.claim(1)
+        batch = CrawlBatch(
+            done_ids=ids,
+            artists=[deezer_artist(ids[0])],
+            # The second one is a compilation by an artist never crawled:
+            albums=[deezer_album(10, ids[0]), deezer_album(11, 999_999)],
+        )
+
+        assert await crawler.persist(batch) == 1
+        assert await Artist.filter(id=ids[0]).exists()
+        assert await Album.all().values_list("id", flat=True) == [10]
+        frontier = await CrawlFrontier.get(id=ids[0])
+        assert frontier.state == CrawlState.Done
+
+    run_in_db(body)
@@ -0,0 +1,40 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.external import DeezerAPI, LRUCache
+
+
+def test_lru_cache_forgets_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache[1] = "a"
+    cache[2] = "b"
+    assert cache[1] == "a"
+    cache[3] = "c"
+    assert 2 not in cache
+    assert list(cache.items()) == [(1, "a"), (3, "c")]
+
+
+def test_fetch_albums_by_id_cancels_siblings_on_failure():
+    cancelled = []
+
+    async def deezer(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/album/1":
+            raise httpx.ConnectError("connection reset", request=request)
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(request.url.path)
+            raise
+
+    async def main():
+        api = DeezerAPI()
+        transport = httpx.MockTransport(deezer)
+        async with httpx.AsyncClient(transport=transport) as client:
+            with pytest.raises(httpx.ConnectError):
+                await api.fetch_albums_by_id(client, [2, 1, 3])
+            # Not left running in the background once the call failed:
+            assert sorted(cancelled) == ["/album/2", "/album/3"]
+
+    asyncio.run(main())
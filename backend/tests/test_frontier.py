@@ -0,0 +1,25 @@
+from app.frontier import Frontier
+from app.models import CrawlFrontier, CrawlState
+
+
+def test_recover_gives_up_after_max_attempts(run_in_db):
+    async def body():
+        frontier = Frontier(max_attempts=2)
+        ids = await frontier.claim(3)
+        await frontier.mark(ids[:1], CrawlState.Done)
+
+        # First crawl never marked ids[1:], the second retries them:
+        assert await frontier.recover() == 2
+        assert await frontier.claim(2) == ids[1:]
+
+        assert await frontier.recover() == 0
+        states = dict(await CrawlFrontier.all().values_list("id", "state"))
+        assert states == {
+            ids[0]: CrawlState.Done,
+            ids[1]: CrawlState.Failed,
+            ids[2]: CrawlState.Failed,
+        }
+        # Failed ids are never handed out again:
+        assert ids[1] not in await frontier.claim(2)
+
+    run_in_db(body)
@@ -0,0 +1,93 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import limiter
+from app.limiter import AdaptiveLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float):
+        # A real clock always moves on, even when a sleep rounds to nothing:
+        self.now += max(delay, 1e-9)
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(limiter, "time", clock)
+    monkeypatch.setattr(
+        limiter, "asyncio", SimpleNamespace(Lock=asyncio.Lock, sleep=clock.sleep)
+    )
+    return clock
+
+
+def request_times(clock: Clock, bucket: AdaptiveLimiter, count: int) -> list[float]:
+    async def main():
+        times = []
+        for _ in range(count):
+            await bucket.wait()
+            times.append(round(clock.now - 1000.0, 4))
+        return times
+
+    return asyncio.run(main())
+
+
+def test_burst_then_refill_rate(clock):
+    bucket = AdaptiveLimiter(rate=10, burst=5, period=0.1, name="test-refill")
+    assert request_times(clock, bucket, 8) == [0, 0, 0, 0, 0, 0.1, 0.2, 0.3]
+    assert bucket.requests == 8
+
+
+def test_at_most_burst_per_period(clock):
+    bucket = AdaptiveLimiter(rate=1000, burst=3, period=5, name="test-window")
+    assert request_times(clock, bucket, 4) == [0, 0, 0, 5]
+
+
+def test_throttle_halves_rate_once_per_period(clock):
+    bucket = AdaptiveLimiter(
+        rate=8, burst=5, period=5, min_rate=1.5, name="test-decrease"
+    )
+    bucket.throttle()
+    assert bucket.rate == 4
+    assert bucket.tokens == 0
+
+    # Requests that were in flight together come back throttled together:
+    clock.now += 4.9
+    bucket.throttle()
+    assert bucket.rate == 4
+    assert bucket.throttle_events == 1
+
+    clock.now += 0.1
+    bucket.throttle()
+    assert bucket.rate == 2
+    clock.now += 5
+    bucket.throttle()
+    assert bucket.rate == 1.5
+
+
+def test_success_increases_rate_up_to_max(clock):
+    bucket = AdaptiveLimiter(
+        rate=1, burst=5, period=5, increase=0.25, name="test-increase"
+    )
+    bucket.throttle()
+    assert bucket.rate == 0.5
+    bucket.success()
+    assert bucket.rate == 0.75
+    for _ in range(10):
+        bucket.success()
+    assert bucket.rate == 1
+
+
+def test_throttle_empties_the_bucket(clock):
+    bucket = AdaptiveLimiter(rate=4, burst=5, period=0.1, name="test-empty")
+    bucket.throttle()
+    # Rate is now 2/s and the saved up burst is gone:
+    assert request_times(clock, bucket, 2) == [0.5, 1.0]
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from app.matching import MIN_SCORE, Matcher, levenshtein_distance, normalize
+
+WORDS = ["love", "night", "dream", "fire", "blue", "heart", "city", "song", "été"]
+
+
+def random_title(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 4))]
+    return rng.choice([" ", " - ", ", "]).join(words).title()
+
+
+def mutate(rng: random.Random, title: str) -> str:
+    chars = list(title)
+    for _ in range(rng.randint(0, 3)):
+        position = rng.randrange(len(chars) + 1)
+        edit = rng.choice(["insert", "delete", "replace"])
+        if edit == "insert" or not chars:
+            chars.insert(position, rng.choice("abcdeo '"))
+        elif edit == "delete":
+            del chars[min(position, len(chars) - 1)]
+        else:
+            chars[min(position, len(chars) - 1)] = rng.choice("abcdeo")
+    return "".join(chars)
+
+
+def brute_force_scores(candidates: list[str], query: str) -> list[float]:
+    query = normalize(query)
+    scores = []
+    for candidate in candidates:
+        n = max(len(query), len(candidate))
+        distance = levenshtein_distance(query, candidate)
+        scores.append(1.0 if n == 0 else (n - distance) / n)
+    return scores
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("min_score", [MIN_SCORE, 0.5])
+def test_best_matches_agrees_with_brute_force(seed, min_score):
+    rng = random.Random(seed)
+    candidates = [random_title(rng) for _ in range(150)]
+    queries = [mutate(rng, rng.choice(candidates)) for _ in range(60)]
+    queries += [random_title(rng) for _ in range(30)]
+
+    matcher = Matcher(candidates, min_score=min_score)
+    normalized = [normalize(candidate) for candidate in candidates]
+    for query, (row, score) in zip(queries, matcher.best_matches(queries)):
+        scores = brute_force_scores(normalized, query)
+        best = max(scores)
+        if best < min_score:
+            assert (row, score) == (None, 0.0), query
+            continue
+        assert score == pytest.approx(best), query
+        # Ties may go to any of the equally close titles:
+        assert scores[row] == pytest.approx(best), query
+
+
+def test_best_matches_without_candidates_close_enough():
+    matcher = Matcher(["Love Song", "Blue Night"])
+    assert matcher.best_matches(["love song", "Something Else", ""]) == [
+        (0, 1.0),
+        (None, 0.0),
+        (None, 0.0),
+    ]
@@ -0,0 +1,147 @@
+from datetime import date
+
+import pytest
+
+from tortoise import Tortoise
+
+from app import migrations
+from app.migrations import migrate
+from app.models import Album, Artist, RecordType
+from app.settings import settings
+
+
+# Albums released before are never looked at closely:
+YEAR = settings.DEEZER_MINIMUM_RELEASE_YEAR
+
+
+async def create_pre_migration_schema():
+    """The current schema minus every column a migration adds, with one
+    artist, one of its singles and one of its albums in it."""
+    await Tortoise.generate_schemas()
+    await Artist.create(
+        id=1, name="Artist", image_url="http://img", nb_album=1, nb_fan=1000
+    )
+    await Album.create(
+        id=10,
+        artist_id=1,
+        title="Song",
+        image_url="http://img",
+        digital_release_date=date(2022, 5, 1),
+        release_date=date(2022, 5, 1),
+        record_type=RecordType.Single,
+        genres=[],
+        label="Label",
+        tracks=[],
+        contributors={},
+        upc="1",
+        folder_name="",
+    )
+    await Album.create(
+        id=11,
+        artist_id=1,
+        title="Album",
+        image_url="http://img",
+        digital_release_date=date(YEAR, 5, 1),
+        release_date=date(YEAR, 3, 1),
+        record_type=RecordType.Album,
+        genres=["Pop"],
+        label="Label",
+        tracks=[],
+        contributors={},
+        upc="2",
+        folder_name="",
+    )
+
+    conn = Tortoise.get_connection("default")
+    indexes = await conn.execute_query_dict(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name IN ('album', 'artist') AND sql IS NOT NULL"
+    )
+    for index in indexes:
+        await conn.execute_query(f'DROP INDEX "{index["name"]}"')
+    for table, column in [
+        ("album", "eligible"),
+        ("album", "folder_name"),
+        ("album", "release_date_resolved"),
+        ("artist", "last_checked"),
+        ("artist", "next_check"),
+    ]:
+        await conn.execute_query(f'ALTER TABLE "{table}" DROP COLUMN "{column}"')
+
+
+async def applied_migrations() -> list[str]:
+    conn = Tortoise.get_connection("default")
+    rows = await conn.execute_query_dict('SELECT "name" FROM "schema_migration"')
+    return sorted(row["name"] for row in rows)
+
+
+async def columns(table: str) -> set[str]:
+    conn = Tortoise.get_connection("default")
+    rows = await conn.execute_query_dict(f'PRAGMA table_info("{table}")')
+    return {row["name"] for row in rows}
+
+
+def test_migrate_pre_migration_schema(run_in_db):
+    async def body():
+        await create_pre_migration_schema()
+        await migrate()
+
+        assert await applied_migrations() == [name for name, _ in migrations.MIGRATIONS]
+        album = await Album.get(id=10)
+        assert not album.eligible
+        assert album.release_date_resolved
+        assert album.folder_name == "Artist - Song (2022) [WEB FLAC]"
+        album = await Album.get(id=11)
+        assert album.eligible
+        assert album.release_date_resolved
+        assert album.folder_name == f"Artist - Album ({YEAR}) [WEB FLAC]"
+        artist = await Artist.get(id=1)
+        assert artist.next_check is not None
+        assert artist.last_checked is None
+
+        # Applied migrations are not applied again:
+        await migrate()
+
+    run_in_db(body, schema=False)
+
+
+def test_migrate_fresh_database_records_migrations(run_in_db):
+    async def body():
+        await migrate()
+        assert await applied_migrations() == [name for name, _ in migrations.MIGRATIONS]
+        assert "next_check" in await columns("artist")
+
+    run_in_db(body, schema=False)
+
+
+def test_failed_migration_is_rolled_back(run_in_db, monkeypatch):
+    async def fail(conn):
+        raise RuntimeError("backfill failed")
+
+    async def backfill(conn):
+        await conn.execute_query('UPDATE "artist" SET "extra" = 1')
+
+    async def body():
+        await migrate()
+        add_column = 'ALTER TABLE "artist" ADD COLUMN "extra" INT'
+        monkeypatch.setattr(
+            migrations,
+            "MIGRATIONS",
+            migrations.MIGRATIONS + [("9999_extra", [add_column, fail])],
+        )
+        with pytest.raises(RuntimeError):
+            await migrate()
+        assert "extra" not in await columns("artist")
+        assert "9999_extra" not in await applied_migrations()
+
+        # The next startup applies it from scratch:
+        monkeypatch.setattr(
+            migrations,
+            "MIGRATIONS",
+            migrations.MIGRATIONS[:-1] + [("9999_extra", [add_column, backfill])],
+        )
+        await migrate()
+        assert "extra" in await columns("artist")
+        assert "9999_extra" in await applied_migrations()
+
+    run_in_db(body, schema=False)
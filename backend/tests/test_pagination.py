@@ -0,0 +1,94 @@
+from datetime import date
+
+import pytest
+
+from fastapi import HTTPException
+
+from app.models import Album, Artist, RecordType
+from app.pagination import (
+    ALBUM_KEYS,
+    CursorParams,
+    decode_cursor,
+    encode_cursor,
+    keyset_paginate,
+)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor([date(2022, 5, 1), 302127], "prev")
+    assert decode_cursor(cursor, ALBUM_KEYS) == ([date(2022, 5, 1), 302127], "prev")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64 json",
+        encode_cursor([date(2022, 5, 1)], "next"),
+        encode_cursor([date(2022, 5, 1), 1], "sideways"),
+        encode_cursor(["yesterday", 1], "next"),
+    ],
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, ALBUM_KEYS)
+    assert error.value.status_code == 400
+
+
+async def create_albums(release_dates: dict[int, date]):
+    await Artist.create(
+        id=1, name="Artist", image_url="http://img", nb_album=1, nb_fan=10
+    )
+    await Album.bulk_create(
+        [
+            Album(
+                id=id,
+                artist_id=1,
+                title=f"Album {id}",
+                image_url="http://img",
+                digital_release_date=release_date,
+                release_date=release_date,
+                record_type=RecordType.Album,
+                genres=["Pop"],
+                label="Label",
+                tracks=[],
+                contributors={},
+                upc=str(id),
+                folder_name=f"Artist - Album {id}",
+            )
+            for id, release_date in release_dates.items()
+        ]
+    )
+
+
+def test_pages_break_ties_on_id(run_in_db):
+    # Most albums share a release date, pages have to split them on id:
+    release_dates = {id: date(2022, 5, 1) for id in range(1, 9)}
+    release_dates.update({9: date(2023, 1, 1), 10: date(2021, 1, 1)})
+    expected = sorted(
+        release_dates, key=lambda id: (release_dates[id], id), reverse=True
+    )
+
+    async def page(cursor=None) -> dict:
+        params = CursorParams(cursor=cursor, size=3, include_total=False)
+        return await keyset_paginate(Album.all(), params, ALBUM_KEYS, "test")
+
+    async def body():
+        await create_albums(release_dates)
+
+        pages, cursors = [], [None]
+        while True:
+            result = await page(cursors[-1])
+            pages.append([album.id for album in result["items"]])
+            if result["next_cursor"] is None:
+                break
+            cursors.append(result["next_cursor"])
+        assert [id for ids in pages for id in ids] == expected
+        assert [len(ids) for ids in pages] == [3, 3, 3, 1]
+
+        # And back from the last page:
+        result = await page(cursors[-1])
+        previous = await page(result["prev_cursor"])
+        assert [album.id for album in previous["items"]] == pages[-2]
+        assert previous["next_cursor"] is not None
+
+    run_in_db(body)
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+import qbittorrentapi
+import torf
+
+from app.qbittorrent import QBittorrentSession
+from fakes.qbittorrent import FakeQBittorrent
+
+
+@pytest.fixture
+def fake():
+    server = FakeQBittorrent()
+    server.serve_in_thread()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def torrent_file(tmp_path) -> bytes:
+    folder = tmp_path / "album"
+    folder.mkdir()
+    (folder / "01.flac").write_bytes(b"\0" * 100_000)
+    torrent = torf.Torrent(folder, trackers=["http://localhost/announce"])
+    torrent.generate()
+    return torrent.dump()
+
+
+def run(fake: FakeQBittorrent, body, password: str = "adminadmin"):
+    async def main():
+        session = QBittorrentSession("127.0.0.1", fake.port, "admin", password)
+        try:
+            return await body(session)
+        finally:
+            await session.close()
+
+    return asyncio.run(main())
+
+
+def test_session_is_reused(fake, torrent_file):
+    async def body(session):
+        await session.add_torrents([torrent_file])
+        await session.add_torrents([torrent_file])
+
+    run(fake, body)
+    assert fake.logins == 1
+    assert fake.add_requests == 2
+    assert len(fake.torrents) == 1
+
+
+def test_logs_in_again_when_session_expires(fake, torrent_file):
+    async def body(session):
+        await session.add_torrents([torrent_file])
+        fake.expire_sessions()
+        await session.add_torrents([torrent_file])
+
+    run(fake, body)
+    assert fake.logins == 2
+    assert fake.add_requests == 2
+
+
+def test_rejected_torrents_raise(fake):
+    async def body(session):
+        with pytest.raises(qbittorrentapi.APIError):
+            await session.add_torrents([b"not a torrent"])
+
+    run(fake, body)
+    assert fake.torrents == {}
+
+
+def test_nothing_to_add_sends_nothing(fake):
+    async def body(session):
+        await session.add_torrents([])
+
+    run(fake, body)
+    assert fake.logins == 0
+
+
+def test_wrong_password_fails(fake, torrent_file):
+    async def body(session):
+        with pytest.raises(qbittorrentapi.LoginFailed):
+            await session.add_torrents([torrent_file])
+
+    run(fake, body, password="wrong")
+    assert fake.torrents == {}
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from app import recrawl
+from app.crawler import DeezerCrawler
+from app.models import Album, Artist
+from app.recrawl import Recheck, Recrawler
+from app.settings import settings
+
+from tests.factories import deezer_album
+
+
+async def due_artists(*ids: int) -> list[Artist]:
+    long_ago = datetime.now() - timedelta(days=30)
+    for id in ids:
+        await Artist.create(
+            id=id,
+            name=f"Artist {id}",
+            image_url="http://img",
+            nb_album=1,
+            nb_fan=100,
+            next_check=long_ago,
+        )
+    return await Artist.filter(id__in=ids).order_by("id")
+
+
+def test_persist_skips_albums_of_artists_not_stored(run_in_db):
+    async def body():
+        (artist,) = await due_artists(1)
+        recrawler = Recrawler(DeezerCrawler(), budget=10)
+        recheck = Recheck(
+            artist,
+            listed=[10, 11],
+            albums=[deezer_album(10, 1), deezer_album(11, 999_999)],
+        )
+        await recrawler.persist([recheck])
+
+        assert await Album.all().values_list("id", flat=True) == [10]
+        artist = await Artist.get(id=1)
+        assert artist.last_checked is not None
+        assert artist.next_check.replace(tzinfo=None) > datetime.now()
+        assert recrawler.failed == 0
+
+    run_in_db(body)
+
+
+def test_failing_artist_is_rescheduled_without_the_others(run_in_db, monkeypatch):
+    insert_albums = recrawl.insert_albums
+
+    async def failing_insert(albums):
+        if any(album.id == 20 for album in albums):
+            raise RuntimeError("broken album")
+        return await insert_albums(albums)
+
+    monkeypatch.setattr(recrawl, "insert_albums", failing_insert)
+
+    async def body():
+        first, second = await due_artists(1, 2)
+        recrawler = Recrawler(DeezerCrawler(), budget=10)
+        await recrawler.persist(
+            [
+                Recheck(first, listed=[10], albums=[deezer_album(10, 1)]),
+                Recheck(second, listed=[20], albums=[deezer_album(20, 2)]),
+            ]
+        )
+
+        assert await Album.all().values_list("id", flat=True) == [10]
+        assert recrawler.failed == 1
+        assert recrawler.albums_written == 1
+        first, second = await Artist.filter(id__in=[1, 2]).order_by("id")
+        assert first.last_checked is not None
+        # Not checked, but not due again before the shortest interval either:
+        assert second.last_checked is None
+        retry = datetime.now() + timedelta(days=settings.RECRAWL_MIN_INTERVAL_DAYS)
+        next_check = second.next_check.replace(tzinfo=None)
+        assert abs(next_check - retry) < timedelta(minutes=1)
+
+    run_in_db(body)
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app import scheduler
+from app.pipeline import CrawlRunStats
+from app.scheduler import CrawlRunFailed, CrawlScheduler
+
+
+class FakeRecrawler:
+    def __init__(self, crawler, budget):
+        self.checked = 0
+        self.failed = 0
+
+    async def run(self, client):
+        pass
+
+
+def make_crawler(stats: CrawlRunStats):
+    class FakeCrawler:
+        async def crawl_deezer(self, client):
+            return stats
+
+    return FakeCrawler
+
+
+def make_scheduler() -> CrawlScheduler:
+    return CrawlScheduler(
+        low_water=5,
+        high_water=10,
+        idle_interval=60,
+        min_interval=0,
+        min_backoff=1,
+        max_backoff=8,
+        max_error_ratio=0.5,
+    )
+
+
+@pytest.fixture
+def crawl(monkeypatch):
+    async def queue_size():
+        return 0
+
+    monkeypatch.setattr(scheduler, "num_albums_in_queue", queue_size)
+    monkeypatch.setattr(scheduler, "Recrawler", FakeRecrawler)
+    monkeypatch.setattr(scheduler.clients, "_deezer", object())
+
+    def step(stats: CrawlRunStats) -> bool:
+        monkeypatch.setattr(scheduler, "DeezerCrawler", make_crawler(stats))
+        return asyncio.run(make_scheduler().step())
+
+    return step
+
+
+def test_step_succeeds_with_few_errors(crawl):
+    assert crawl(CrawlRunStats(fetched=9, fetch_errors=1))
+    # Nothing fetched (queue filled up meanwhile) is not a failure:
+    assert crawl(CrawlRunStats())
+
+
+@pytest.mark.parametrize(
+    "stats",
+    [
+        CrawlRunStats(fetched=0, fetch_errors=3, last_error="ReadTimeout()"),
+        CrawlRunStats(fetched=4, fetch_errors=6),
+    ],
+)
+def test_step_fails_when_fetches_fail(crawl, stats):
+    with pytest.raises(CrawlRunFailed):
+        crawl(stats)
+
+
+def test_backoff_doubles_up_to_max():
+    crawl_scheduler = make_scheduler()
+    delays = []
+    for failures in range(1, 7):
+        crawl_scheduler.failures = failures
+        delays.append(crawl_scheduler.backoff())
+    for failures, delay in enumerate(delays, start=1):
+        upper = min(8, 2 ** (failures - 1))
+        assert upper / 2 <= delay <= upper
+
+
+def test_failed_recrawl_still_crawls(monkeypatch):
+    class FailingRecrawler(FakeRecrawler):
+        async def run(self, client):
+            raise RuntimeError("database is locked")
+
+    async def queue_size():
+        return 0
+
+    crawled = []
+
+    class Crawler:
+        async def crawl_deezer(self, client):
+            crawled.append(True)
+            return CrawlRunStats(fetched=10)
+
+    monkeypatch.setattr(scheduler, "num_albums_in_queue", queue_size)
+    monkeypatch.setattr(scheduler, "Recrawler", FailingRecrawler)
+    monkeypatch.setattr(scheduler, "DeezerCrawler", Crawler)
+    monkeypatch.setattr(scheduler.clients, "_deezer", object())
+
+    assert asyncio.run(make_scheduler().step())
+    assert crawled == [True]
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import date
+
+from app.models import Album, Artist, RecordType, ReviewQueueSize, TrackingStatus
+from app.review_queue import review_queue
+from app.statuses import set_album_status
+
+
+async def create_album(id: int = 10, eligible: bool = True) -> Album:
+    await Artist.get_or_create(
+        id=1,
+        defaults=dict(name="Artist", image_url="http://img", nb_album=1, nb_fan=10),
+    )
+    return await Album.create(
+        id=id,
+        eligible=eligible,
+        artist_id=1,
+        title="Album",
+        image_url="http://img",
+        digital_release_date=date(2022, 5, 1),
+        release_date=date(2022, 5, 1),
+        record_type=RecordType.Album,
+        genres=[],
+        label="Label",
+        tracks=[],
+        contributors={},
+        upc=str(id),
+        folder_name="Artist - Album (2022) [WEB FLAC]",
+    )
+
+
+def test_set_album_status_reads_the_current_row(run_in_db):
+    async def body():
+        album = await create_album()
+        assert await review_queue.reconcile() == 1
+        stale = await Album.get(id=album.id)
+
+        # Meanwhile the album is reviewed and its artist disabled:
+        await set_album_status(album, TrackingStatus.Reviewed)
+        await set_album_status(album, TrackingStatus.Added)
+        await Album.filter(id=album.id).update(eligible=False)
+        await review_queue.add(-1)
+
+        await set_album_status(stale, TrackingStatus.Downloaded)
+        assert stale.status == TrackingStatus.Downloaded
+        assert not stale.eligible
+        size = await ReviewQueueSize.get(id=review_queue.ROW_ID)
+        assert size.size == await review_queue.reconcile() == 0
+
+    run_in_db(body)
+
+
+async def queue_size() -> tuple[int, int]:
+    """The counter, and the size counted from the albums themselves."""
+    counter = await ReviewQueueSize.get(id=review_queue.ROW_ID)
+    counted = await Album.filter(status=TrackingStatus.Added, eligible=True).count()
+    return counter.size, counted
+
+
+def test_queue_size_follows_status_changes(run_in_db):
+    async def body():
+        albums = [await create_album(id, eligible=id % 3 != 0) for id in range(1, 10)]
+        await review_queue.reconcile()
+        assert await queue_size() == (6, 6)
+
+        moves = [
+            TrackingStatus.Reviewed,
+            TrackingStatus.Added,
+            TrackingStatus.Added,
+            TrackingStatus.Downloaded,
+            TrackingStatus.Uploaded,
+            TrackingStatus.Added,
+        ]
+        for i, status in enumerate(moves):
+            for album in albums[i % 3 :: 2]:
+                await set_album_status(album, status)
+                size, counted = await queue_size()
+                assert size == counted
+
+    run_in_db(body)
+
+
+def test_queue_size_under_concurrent_status_changes(run_in_db):
+    async def body():
+        for id in range(1, 7):
+            await create_album(id, eligible=id != 6)
+        await review_queue.reconcile()
+
+        # Each album loaded separately by every caller, like concurrent
+        # requests do, so each caller has its own stale copy:
+        statuses = [
+            TrackingStatus.Reviewed,
+            TrackingStatus.Added,
+            TrackingStatus.Downloaded,
+            TrackingStatus.Added,
+        ]
+        for _ in range(3):
+            calls = [
+                set_album_status(await Album.get(id=id), status)
+                for id in range(1, 7)
+                for status in statuses
+            ]
+            await asyncio.gather(*calls)
+            size, counted = await queue_size()
+            assert size == counted
+
+    run_in_db(body)
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+import torf
+
+from app.torrents import file_offsets, hash_file_pieces, join_piece_hashes
+
+PIECE_SIZE = 16384
+
+
+@pytest.mark.parametrize(
+    "sizes",
+    [
+        [PIECE_SIZE],
+        [PIECE_SIZE * 3, PIECE_SIZE],
+        [100, 200, 300],
+        [PIECE_SIZE - 1, 2, PIECE_SIZE * 2 + 5],
+        [PIECE_SIZE + 1, 10, 20, PIECE_SIZE * 4 - 31, 7],
+        [random.Random(seed).randint(1, PIECE_SIZE * 3) for seed in range(12)],
+    ],
+)
+def test_join_piece_hashes_matches_torf(tmp_path, sizes):
+    folder = tmp_path / "album"
+    folder.mkdir()
+    rng = random.Random(len(sizes))
+    for i, size in enumerate(sizes):
+        (folder / f"{i:02}.flac").write_bytes(rng.randbytes(size))
+
+    torrent = torf.Torrent(folder, trackers=["http://localhost/announce"])
+    torrent.piece_size = PIECE_SIZE
+    torrent.generate()
+    expected = torrent.metainfo["info"]["pieces"]
+
+    parts = []
+    for filepath, offset in file_offsets(torrent):
+        with open(filepath, "rb") as f:
+            parts.append(hash_file_pieces(f.read(), offset, PIECE_SIZE))
+    assert join_piece_hashes(parts, PIECE_SIZE) == expected
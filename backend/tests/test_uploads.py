@@ -0,0 +1,166 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from tortoise import connections
+from tortoise.backends.base.client import BaseTransactionWrapper
+
+from app import uploads
+from app.models import Album, Artist, Upload
+from app.schemas import TrackerAPIResponse, TrackerCode, TrackingStatus
+
+from tests.factories import deezer_album
+
+
+class FlakyQBittorrent:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.added: list[bytes] = []
+
+    async def add_torrents(self, torrent_files: list[bytes]):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("qBittorrent is restarting")
+        self.added.extend(torrent_files)
+
+
+def test_seed_uploads_retries(monkeypatch):
+    monkeypatch.setattr(uploads, "SEED_RETRY_DELAY", 0)
+    upload = Upload(id=1, file=b"torrent")
+
+    qbittorrent = FlakyQBittorrent(failures=uploads.SEED_ATTEMPTS - 1)
+    assert asyncio.run(uploads.seed_uploads([upload], qbittorrent))
+    assert qbittorrent.added == [b"torrent"]
+
+    qbittorrent = FlakyQBittorrent(failures=uploads.SEED_ATTEMPTS)
+    assert not asyncio.run(uploads.seed_uploads([upload], qbittorrent))
+    assert qbittorrent.added == []
+
+
+def test_prepare_upload_resolves_skipped_release_date(run_in_db, monkeypatch):
+    def deezer(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/album/10":
+            return httpx.Response(
+                200, json={"id": 10, "upc": "10", "tracks": {"data": [{"id": 100}]}}
+            )
+        if request.url.path == "/track/100":
+            return httpx.Response(
+                200, json={"id": 100, "album": {"id": 10, "release_date": "2019-03-08"}}
+            )
+        return httpx.Response(404)
+
+    async def verified(album, filepaths, torrent):
+        return dict.fromkeys(filepaths, True)
+
+    monkeypatch.setattr(uploads, "new_torrent", lambda path, code: None)
+    monkeypatch.setattr(uploads, "downloaded_filepaths", lambda album: ["01.flac"])
+    monkeypatch.setattr(uploads, "verify_and_hash", verified)
+
+    async def body():
+        await Artist.create(id=1, name="Artist", image_url="x", nb_album=1, nb_fan=1)
+        album = deezer_album(10, 1, release_date=date(2024, 5, 1))
+        album.release_date_resolved = False
+        await Album.create(**album.dict())
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(deezer)) as client:
+            monkeypatch.setattr(uploads.clients, "_deezer", client)
+            album = await Album.get(id=10)
+            await uploads.prepare_upload(album, TrackerCode.RED)
+
+        album = await Album.get(id=10)
+        assert album.release_date_resolved
+        assert album.release_date == date(2019, 3, 8)
+        assert album.digital_release_date == date(2024, 5, 1)
+
+    run_in_db(body)
+
+
+def in_transaction() -> bool:
+    return isinstance(connections.get("default"), BaseTransactionWrapper)
+
+
+async def create_album(id: int) -> Album:
+    await Artist.create(id=1, name="Artist", image_url="x", nb_album=1, nb_fan=1)
+    album = deezer_album(id, 1, contributors={"Artist": "Main"})
+    await Album.create(**album.dict())
+    return await Album.get(id=id).prefetch_related("artist")
+
+
+TORRENT = SimpleNamespace(infohash="a" * 40, dump=lambda: b"torrent")
+
+
+class RecordingQBittorrent:
+    def __init__(self):
+        self.uploads: list[Upload] = []
+
+    async def add_torrents(self, torrent_files: list[bytes]):
+        assert not in_transaction()
+        self.uploads = await Upload.all()
+
+
+def test_submit_upload_posts_before_writing(run_in_db, monkeypatch):
+    async def process_upload(self, client, params, tracker_code, torrentfile):
+        assert not in_transaction()
+        assert not await Upload.exists()
+        return TrackerAPIResponse(torrentid=5, groupid=6, tracker_code=tracker_code)
+
+    monkeypatch.setattr(uploads.UploadManager, "process_upload", process_upload)
+
+    async def body():
+        album = await create_album(10)
+        qbittorrent = RecordingQBittorrent()
+        await uploads.submit_upload(
+            album, TORRENT, TrackerCode.RED, None, qbittorrent
+        )
+
+        upload = await Upload.get(album_id=10)
+        assert (upload.torrent_id, upload.group_id) == (5, 6)
+        assert (await Album.get(id=10)).status == TrackingStatus.Uploaded
+        # Seeded once the upload was committed:
+        assert [seeded.id for seeded in qbittorrent.uploads] == [upload.id]
+
+    run_in_db(body)
+
+
+def test_rejected_upload_writes_nothing(run_in_db, monkeypatch):
+    async def process_upload(self, client, params, tracker_code, torrentfile):
+        raise httpx.ConnectError("tracker is down")
+
+    monkeypatch.setattr(uploads.UploadManager, "process_upload", process_upload)
+
+    async def body():
+        album = await create_album(10)
+        qbittorrent = RecordingQBittorrent()
+        with pytest.raises(httpx.ConnectError):
+            await uploads.submit_upload(
+                album, TORRENT, TrackerCode.RED, None, qbittorrent
+            )
+
+        assert not await Upload.exists()
+        assert (await Album.get(id=10)).status != TrackingStatus.Uploaded
+        assert qbittorrent.uploads == []
+
+    run_in_db(body)
+
+
+def test_failed_seeding_keeps_upload(run_in_db, monkeypatch):
+    async def process_upload(self, client, params, tracker_code, torrentfile):
+        return TrackerAPIResponse(torrentid=5, groupid=6, tracker_code=tracker_code)
+
+    monkeypatch.setattr(uploads.UploadManager, "process_upload", process_upload)
+    monkeypatch.setattr(uploads, "SEED_RETRY_DELAY", 0)
+
+    async def body():
+        album = await create_album(10)
+        qbittorrent = FlakyQBittorrent(failures=uploads.SEED_ATTEMPTS)
+        await uploads.submit_upload(
+            album, TORRENT, TrackerCode.RED, None, qbittorrent
+        )
+
+        assert await Upload.exists(album_id=10)
+        assert (await Album.get(id=10)).status == TrackingStatus.Uploaded
+
+    run_in_db(body)
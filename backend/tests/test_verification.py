@@ -0,0 +1,90 @@
+import numpy as np
+import soundfile
+
+from app import flac, verification
+from app.models import Album, TrackVerification
+from app.schemas import ParsedAudioFile
+from app.verification import TrackPositions
+
+
+def parsed(position: int) -> ParsedAudioFile:
+    return ParsedAudioFile.construct(position=position)
+
+
+def test_duplicate_track_numbers_fail_every_file(monkeypatch):
+    monkeypatch.setattr(verification, "is_verified", lambda *args: True)
+    positions = TrackPositions(Album(tracks=[{}, {}, {}]))
+
+    assert positions.verify("01.flac", parsed(1), True) == [("01.flac", True)]
+    assert positions.verify("02.flac", parsed(2), True) == [("02.flac", True)]
+    assert positions.verify("03.flac", parsed(2), True) == [
+        ("02.flac", False),
+        ("03.flac", False),
+    ]
+    assert positions.verify("04.flac", None, False) == [("04.flac", False)]
+
+
+def test_later_results_replace_earlier_ones(monkeypatch):
+    monkeypatch.setattr(verification, "is_verified", lambda *args: True)
+    positions = TrackPositions(Album(tracks=[{}, {}]))
+    results = {}
+    for filepath, position in [("a.flac", 1), ("b.flac", 1)]:
+        results.update(positions.verify(filepath, parsed(position), True))
+    assert results == {"a.flac": False, "b.flac": False}
+
+
+def test_cached_inspections_drops_deleted_files(run_in_db, tmp_path):
+    track = tmp_path / "01.flac"
+    track.write_bytes(b"fLaC")
+
+    async def body():
+        await verification.store_inspection(str(track), None, False)
+        assert await verification.cached_inspections([str(track)]) == {
+            str(track): (None, False)
+        }
+
+        track.unlink()
+        assert await verification.cached_inspections([str(track)]) == {}
+        assert not await TrackVerification.exists(filepath=str(track))
+
+    run_in_db(body)
+
+
+def write_flac(path) -> str:
+    """Writes a few seconds of noise as FLAC, returns its STREAMINFO MD5."""
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-(2**15), 2**15, size=(44100 * 3, 2), dtype=np.int16)
+    soundfile.write(path, samples, 44100, format="FLAC", subtype="PCM_16")
+    # "fLaC", the block header, then the MD5 ends the 34 bytes of STREAMINFO:
+    return path.read_bytes()[26:42].hex()
+
+
+def test_verify_native(tmp_path):
+    path = tmp_path / "01.flac"
+    md5 = write_flac(path)
+    assert flac.verify_native(str(path), md5)
+    assert not flac.verify_native(str(path), "0" * 32)
+
+
+def test_verify_native_rejects_empty_file(tmp_path):
+    path = tmp_path / "01.flac"
+    path.write_bytes(b"")
+    assert not flac.verify_native(str(path), "0" * 32)
+
+
+def test_verify_native_rejects_truncated_file(tmp_path):
+    path = tmp_path / "01.flac"
+    md5 = write_flac(path)
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) * 2 // 3])
+    assert not flac.verify_native(str(path), md5)
+
+
+def test_verify_native_rejects_corrupted_file(tmp_path):
+    path = tmp_path / "01.flac"
+    md5 = write_flac(path)
+    data = bytearray(path.read_bytes())
+    middle = len(data) // 2
+    data[middle : middle + 64] = bytes(64)
+    path.write_bytes(bytes(data))
+    assert not flac.verify_native(str(path), md5)
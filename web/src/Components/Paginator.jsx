@@ -3,7 +3,29 @@ import React from "react";
 import Pagination from "react-bootstrap/Pagination";
 
 const Paginator = ({ page, pages, pageSettings, fetchAlbums }) => {
-  if (pages < 2) {
+  // Cursor (keyset) pagination only knows the neighbouring pages:
+  if ("nextCursor" in pageSettings) {
+    const { nextCursor, prevCursor } = pageSettings;
+    if (!nextCursor && !prevCursor) {
+      return;
+    }
+    return (
+      <Pagination>
+        <Pagination.First
+          disabled={!prevCursor}
+          onClick={() => fetchAlbums(null)}
+        />
+        <Pagination.Prev
+          disabled={!prevCursor}
+          onClick={() => fetchAlbums(prevCursor)}
+        />
+        <Pagination.Next
+          disabled={!nextCursor}
+          onClick={() => fetchAlbums(nextCursor)}
+        />
+      </Pagination>
+    );
+  } else if (pages < 2) {
     return;
   } else if (pages < 8) {
     let items = [];
@@ -6,24 +6,25 @@ import Col from "react-bootstrap/Col";
 
 import Albums from "./Albums";
 
-const API_ENDPOINT = "http://172.30.1.27:8006/albums/upload/ready";
+const API_ENDPOINT = "http://172.30.1.27:8006/albums/upload/ready/cursor";
 
 const UploadManager = () => {
   const [albums, setAlbums] = useState([]);
   const [pageSettings, setPageSettings] = useState({});
 
-  const fetchAlbums = (page = 1, size = 10) => {
+  const fetchAlbums = (cursor = null, size = 10) => {
     axios
-      .get(API_ENDPOINT, { params: { page: page, size: size } })
+      .get(API_ENDPOINT, {
+        params: { cursor: cursor, size: size, include_total: true },
+      })
       .then((response) => {
         setAlbums(response.data.items);
         setPageSettings({
-          page: response.data.page,
-          pages: response.data.pages,
-          total: response.data.total,
+          nextCursor: response.data.next_cursor,
+          prevCursor: response.data.prev_cursor,
+          total: response.data.approximate_total,
           size: response.data.size,
         });
-        console.log(pageSettings);
       });
   };
 